@@ -0,0 +1,29 @@
+"""Add processing_state to UploadedFile
+
+Revision ID: 3b0a8b03dd4c
+Revises:
+Create Date: 2026-10-18 09:12:40.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b0a8b03dd4c'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 已有文件都是同步预处理完成的，默认值为 done
+    op.add_column('uploaded_files', sa.Column('processing_state', sa.String(), server_default='done', nullable=False))
+    op.add_column('uploaded_files', sa.Column('processing_error', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('uploaded_files', 'processing_error')
+    op.drop_column('uploaded_files', 'processing_state')
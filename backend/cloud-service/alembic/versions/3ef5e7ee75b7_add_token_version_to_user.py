@@ -0,0 +1,27 @@
+"""Add token_version to User
+
+Revision ID: 3ef5e7ee75b7
+Revises: f5e2e4975cab
+Create Date: 2026-10-18 14:21:07.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3ef5e7ee75b7'
+down_revision: Union[str, None] = 'f5e2e4975cab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 已签发的旧令牌没有 ver claim，升级后需要重新登录
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,37 @@
+"""Make UploadedFile.created_at not null
+
+Revision ID: 9c4e1a7f3b2d
+Revises: b28dee2bc743
+Create Date: 2026-10-18 21:40:12.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e1a7f3b2d'
+down_revision: Union[str, None] = 'b28dee2bc743'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 列表游标 (created_at, id) < (...) 会跳过 created_at 为空的记录，先回填再加约束
+    op.execute(
+        "UPDATE uploaded_files SET created_at = coalesce(updated_at, now()) "
+        "WHERE created_at IS NULL"
+    )
+    op.alter_column('uploaded_files', 'created_at',
+               existing_type=sa.DateTime(timezone=True),
+               existing_server_default=sa.text('now()'),
+               nullable=False)
+
+
+def downgrade() -> None:
+    op.alter_column('uploaded_files', 'created_at',
+               existing_type=sa.DateTime(timezone=True),
+               existing_server_default=sa.text('now()'),
+               nullable=True)
@@ -0,0 +1,78 @@
+"""Add score metadata to UploadedFile
+
+Revision ID: b28dee2bc743
+Revises: d25df7b9d623
+Create Date: 2026-10-18 17:21:05.413208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b28dee2bc743'
+down_revision: Union[str, None] = 'd25df7b9d623'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('uploaded_files', sa.Column('title', sa.String(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('composer', sa.String(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('part_names', sa.String(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('part_count', sa.Integer(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('key_signature', sa.String(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('time_signature', sa.String(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('measure_count', sa.Integer(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('note_count', sa.Integer(), nullable=True))
+    op.add_column('uploaded_files', sa.Column('duration_seconds', sa.Float(), nullable=True))
+    # 生成列需要重写整张表，已有记录的元数据由 python -m app.score_metadata 回填
+    op.add_column('uploaded_files', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(composer, '') || ' ' "
+            "|| coalesce(part_names, '') || ' ' || filename)",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+
+    # CONCURRENTLY 建索引不锁表，不能在事务中执行
+    with op.get_context().autocommit_block():
+        op.create_index('ix_uploaded_files_search_vector', 'uploaded_files', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_uploaded_files_title_trgm', 'uploaded_files', ['title'], unique=False, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_uploaded_files_composer_trgm', 'uploaded_files', ['composer'], unique=False, postgresql_using='gin', postgresql_ops={'composer': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_uploaded_files_filename_trgm', 'uploaded_files', ['filename'], unique=False, postgresql_using='gin', postgresql_ops={'filename': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index(op.f('ix_uploaded_files_part_count'), 'uploaded_files', ['part_count'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_uploaded_files_key_signature'), 'uploaded_files', ['key_signature'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_uploaded_files_time_signature'), 'uploaded_files', ['time_signature'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_uploaded_files_note_count'), 'uploaded_files', ['note_count'], unique=False, postgresql_concurrently=True)
+        op.create_index(op.f('ix_uploaded_files_duration_seconds'), 'uploaded_files', ['duration_seconds'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_uploaded_files_duration_seconds'), table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_uploaded_files_note_count'), table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_uploaded_files_time_signature'), table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_uploaded_files_key_signature'), table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_uploaded_files_part_count'), table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index('ix_uploaded_files_filename_trgm', table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index('ix_uploaded_files_composer_trgm', table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index('ix_uploaded_files_title_trgm', table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index('ix_uploaded_files_search_vector', table_name='uploaded_files', postgresql_concurrently=True)
+    op.drop_column('uploaded_files', 'search_vector')
+    op.drop_column('uploaded_files', 'duration_seconds')
+    op.drop_column('uploaded_files', 'note_count')
+    op.drop_column('uploaded_files', 'measure_count')
+    op.drop_column('uploaded_files', 'time_signature')
+    op.drop_column('uploaded_files', 'key_signature')
+    op.drop_column('uploaded_files', 'part_count')
+    op.drop_column('uploaded_files', 'part_names')
+    op.drop_column('uploaded_files', 'composer')
+    op.drop_column('uploaded_files', 'title')
@@ -0,0 +1,31 @@
+"""Add library listing indexes
+
+Revision ID: d25df7b9d623
+Revises: 3ef5e7ee75b7
+Create Date: 2026-10-18 15:02:44.861530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd25df7b9d623'
+down_revision: Union[str, None] = '3ef5e7ee75b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY 建索引不锁表，不能在事务中执行
+    with op.get_context().autocommit_block():
+        op.create_index('ix_uploaded_files_public_created', 'uploaded_files', ['is_public', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_uploaded_files_user_created', 'uploaded_files', ['user_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_uploaded_files_user_created', table_name='uploaded_files', postgresql_concurrently=True)
+        op.drop_index('ix_uploaded_files_public_created', table_name='uploaded_files', postgresql_concurrently=True)
@@ -0,0 +1,29 @@
+"""Add content_hash to UploadedFile
+
+Revision ID: f5e2e4975cab
+Revises: 3b0a8b03dd4c
+Create Date: 2026-10-18 10:03:27.540916
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5e2e4975cab'
+down_revision: Union[str, None] = '3b0a8b03dd4c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 旧文件没有内容哈希，仍按各自的路径存储和删除
+    op.add_column('uploaded_files', sa.Column('content_hash', sa.String(), nullable=True))
+    op.create_index(op.f('ix_uploaded_files_content_hash'), 'uploaded_files', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_uploaded_files_content_hash'), table_name='uploaded_files')
+    op.drop_column('uploaded_files', 'content_hash')
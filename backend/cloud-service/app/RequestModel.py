@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, Field
 
 class RegisterRequest(BaseModel):
     email: str
@@ -22,3 +23,22 @@ class ManagePermissionRequest(BaseModel):
 class UpdateVisibilityRequest(BaseModel):
     file_id: str
     is_public: bool
+
+
+# 批量操作一次最多处理的文件数
+BATCH_MAX_FILES = 1000
+
+
+class BatchUpdateVisibilityRequest(BaseModel):
+    file_ids: list[str] = Field(..., min_items=1, max_items=BATCH_MAX_FILES)
+    is_public: bool
+
+
+class BatchDeleteRequest(BaseModel):
+    file_ids: list[str] = Field(..., min_items=1, max_items=BATCH_MAX_FILES)
+
+
+class ChunkedUploadInitRequest(BaseModel):
+    filename: str
+    total_size: Optional[int] = None
+    is_public: bool = False
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from concurrent.futures import Future
+from pathlib import Path
+
+from sqlalchemy import update
+
+from app.artifact_quota import record_access, request_quota_check
+from app.common import ProcessingState
+from app.database import async_session
+from app.models import UploadedFile
+from app.preprocess_queue import get_executor, render_score_artifacts
+from app.note_index import compute_note_index, note_index_path
+
+# 正在渲染的乐谱 {score_path: Future}，同一乐谱的并发请求共用一次渲染
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def artifacts_ready(score_path: Path) -> bool:
+    return score_path.with_suffix(".mid").exists() and score_path.with_suffix(".wav").exists()
+
+
+async def _mark_rendered(score_path: Path, midi_path: str, audio_path: str) -> None:
+    # 延迟渲染的记录在第一次渲染后回填路径
+    async with async_session() as db:
+        await db.execute(
+            update(UploadedFile)
+            .where(
+                UploadedFile.filepath == str(score_path),
+                UploadedFile.processing_state == ProcessingState.DEFERRED.value,
+            )
+            .values(
+                processing_state=ProcessingState.DONE.value,
+                midi_path=midi_path,
+                audio_path=audio_path,
+            )
+        )
+        await db.commit()
+
+
+def _render_once(score_path: Path) -> Future:
+    key = str(score_path)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = get_executor().submit(render_score_artifacts, score_path, key)
+        _inflight[key] = future
+
+    def _on_done(f: Future):
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    future.add_done_callback(_on_done)
+    return future
+
+
+async def ensure_artifacts(score_path: Path) -> None:
+    """
+    Make sure the MIDI / audio artifacts of a score exist
+
+    Missing artifacts (never rendered, or evicted) are rendered in the
+    preprocessing process pool. Concurrent calls for the same score wait on
+    the same render. After a render the quota thread is asked to check the
+    cache size.
+
+    Parameters
+    ----------
+    score_path : Path
+        Path to the stored score xml file
+    """
+    # 先记录访问，渲染期间该 blob 不会被当作最久未用而淘汰
+    record_access(score_path)
+    if not artifacts_ready(score_path):
+        midi_path, audio_path = await asyncio.wrap_future(_render_once(score_path))
+        await _mark_rendered(score_path, midi_path, audio_path)
+        record_access(score_path)
+        request_quota_check({str(score_path.parent)})
+
+
+async def ensure_note_index(score_path: Path) -> Path:
+    """
+    确保乐谱的音符索引存在（可能已被淘汰），在预处理进程池中生成
+    """
+    index_path = note_index_path(score_path)
+    if not index_path.exists():
+        await asyncio.wrap_future(get_executor().submit(compute_note_index, score_path))
+    record_access(score_path)
+    return index_path
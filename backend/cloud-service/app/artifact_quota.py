@@ -0,0 +1,208 @@
+import json
+import logging
+import threading
+import time
+
+from pathlib import Path
+from sqlalchemy import select
+
+from app.common import ProcessingState
+from app.config import ARTIFACT_CACHE_MAX_BYTES, ARTIFACT_CACHE_POLICY, ARTIFACT_MIN_AGE_SECONDS
+from app.database import SessionLocal
+from app.models import UploadedFile
+from app.score_store import BLOB_DIR, SCORE_SUFFIXES, lock_blob
+
+# 记录 blob 访问时间和次数的文件，位于每个 blob 目录中
+ACCESS_FILE = ".access"
+# 同一个 blob 的访问记录最多每隔多少秒写一次磁盘
+ACCESS_FLUSH_INTERVAL = 60
+
+# 进程内的访问记录 {blob 目录: [最后访问时间, 访问次数, 上次写盘时间]}
+_access: dict[str, list] = {}
+_access_lock = threading.Lock()
+
+# 配额检查线程：渲染完成后只发信号，遍历 blob 和删除文件都在这个线程里做
+_quota_event = threading.Event()
+_quota_keep: set = set()
+_quota_lock = threading.Lock()
+_quota_thread = None
+
+
+def _read_access(blob: Path) -> tuple[float, int]:
+    try:
+        data = json.loads((blob / ACCESS_FILE).read_text(encoding="utf-8"))
+        return float(data["last_access"]), int(data["hits"])
+    except Exception:
+        return 0.0, 0
+
+
+def record_access(score_path: Path) -> None:
+    """
+    记录一次产物访问，用于 LRU / LFU 淘汰
+    """
+    blob = score_path.parent
+    if BLOB_DIR.resolve() not in blob.resolve().parents:
+        # 旧的非内容寻址文件不参与缓存淘汰
+        return
+
+    now = time.time()
+    with _access_lock:
+        entry = _access.get(str(blob))
+        if entry is None:
+            entry = [*_read_access(blob), 0.0]
+            _access[str(blob)] = entry
+        entry[0] = now
+        entry[1] += 1
+        if now - entry[2] < ACCESS_FLUSH_INTERVAL:
+            return
+        entry[2] = now
+        payload = {"last_access": entry[0], "hits": entry[1]}
+    try:
+        (blob / ACCESS_FILE).write_text(json.dumps(payload), encoding="utf-8")
+    except Exception as e:
+        logging.error(f"Failed to record access for {blob}: {e}")
+
+
+def _blob_artifacts(blob: Path) -> list[Path]:
+    return [
+        path for path in blob.iterdir()
+        if path.is_file() and path.name != ACCESS_FILE and path.suffix.lower() not in SCORE_SUFFIXES
+    ]
+
+
+def _last_used(blob: Path, stats: list) -> tuple[float, float, int]:
+    """
+    返回 (最近使用时间, 最后访问时间, 访问次数)，最近使用时间包含产物的写入时间
+    """
+    with _access_lock:
+        entry = _access.get(str(blob))
+    last_access, hits = (entry[0], entry[1]) if entry else _read_access(blob)
+    return max([last_access, *(stat.st_mtime for stat in stats)]), last_access, hits
+
+
+def _evict_blob(blob: Path) -> int:
+    """
+    持有内容锁删除一个 blob 的产物，返回删除的字节数；锁内重新检查，期间被使用或等待渲染的 blob 保留
+    """
+    db = SessionLocal()
+    try:
+        db.execute(lock_blob(blob.name))
+        pending = db.scalar(
+            select(UploadedFile.id)
+            .where(
+                UploadedFile.content_hash == blob.name,
+                UploadedFile.processing_state.in_([ProcessingState.QUEUED.value, ProcessingState.RENDERING.value]),
+            )
+            .limit(1)
+        )
+        if pending is not None:
+            return 0
+        try:
+            artifacts = _blob_artifacts(blob)
+            stats = [path.stat() for path in artifacts]
+        except FileNotFoundError:
+            return 0
+        if time.time() - _last_used(blob, stats)[0] < ARTIFACT_MIN_AGE_SECONDS:
+            return 0
+        for path in artifacts:
+            path.unlink(missing_ok=True)
+        db.commit()
+        return sum(stat.st_size for stat in stats)
+    finally:
+        db.close()
+
+
+def enforce_quota(keep: set = frozenset()) -> int:
+    """
+    Evict derived artifacts until the cache fits ``ARTIFACT_CACHE_MAX_BYTES``
+
+    The unit of eviction is the artifact set of one blob (MIDI, audio
+    renditions, reference features). The source score is never removed, so an
+    evicted score is simply rendered again on its next request. Blobs are
+    evicted by least recent access (``lru``) or least hits (``lfu``). Blobs
+    accessed or written within ``ARTIFACT_MIN_AGE_SECONDS`` are never evicted,
+    so a file that was just ensured is still there when it is served.
+
+    Like ``file_reclaimer``, a blob's artifacts are removed under its content
+    hash's advisory lock (see ``lock_blob``), and the blob is checked again
+    under the lock. A blob that a queued or rendering row is waiting for, or
+    that was used since the scan, is kept. So a render in progress is not cut
+    short, even one that has not written a file yet.
+
+    Parameters
+    ----------
+    keep : set
+        Blob directories that must not be evicted (e.g. just rendered)
+
+    Returns
+    -------
+    int
+        Number of bytes removed
+    """
+    if ARTIFACT_CACHE_MAX_BYTES <= 0 or not BLOB_DIR.exists():
+        return 0
+
+    now = time.time()
+    blobs = []
+    total = 0
+    for blob in BLOB_DIR.glob("*/*"):
+        if not blob.is_dir():
+            continue
+        try:
+            artifacts = _blob_artifacts(blob)
+            stats = [path.stat() for path in artifacts]
+        except FileNotFoundError:
+            # blob 在遍历期间被回收
+            continue
+        size = sum(stat.st_size for stat in stats)
+        total += size
+        if size == 0 or str(blob) in keep:
+            continue
+        last_used, last_access, hits = _last_used(blob, stats)
+        if now - last_used < ARTIFACT_MIN_AGE_SECONDS:
+            continue
+        blobs.append((blob, last_access, hits))
+
+    if total <= ARTIFACT_CACHE_MAX_BYTES:
+        return 0
+
+    if ARTIFACT_CACHE_POLICY == "lfu":
+        blobs.sort(key=lambda item: (item[2], item[1]))
+    else:
+        blobs.sort(key=lambda item: item[1])
+
+    removed = 0
+    for blob, _, _ in blobs:
+        if total - removed <= ARTIFACT_CACHE_MAX_BYTES:
+            break
+        size = _evict_blob(blob)
+        if size:
+            removed += size
+            print(f"Evicted artifacts of {blob.name} ({size} bytes)")
+    return removed
+
+
+def _quota_worker() -> None:
+    while True:
+        _quota_event.wait()
+        _quota_event.clear()
+        with _quota_lock:
+            keep = set(_quota_keep)
+            _quota_keep.clear()
+        try:
+            enforce_quota(keep)
+        except Exception as e:
+            logging.error(f"Failed to enforce artifact cache quota: {e}")
+
+
+def request_quota_check(keep: set = frozenset()) -> None:
+    """
+    通知配额线程检查缓存大小，多次请求会合并为一次检查
+    """
+    global _quota_thread
+    with _quota_lock:
+        _quota_keep.update(keep)
+        if _quota_thread is None:
+            _quota_thread = threading.Thread(target=_quota_worker, name="artifact-quota", daemon=True)
+            _quota_thread.start()
+    _quota_event.set()
@@ -2,9 +2,10 @@ import jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from fastapi import HTTPException
+from app.config import BCRYPT_ROUNDS
 
 # 密码哈希
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # JWT 配置
 SECRET_KEY = "imusic"  # 替换为更安全的密钥
@@ -26,17 +27,37 @@ def create_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def decode_token(token: str) -> str:
+def create_user_token(user_id: str, username: str, roles: list[str], permissions: list[str], token_version: int) -> str:
+    """
+    Create a JWT carrying the user's identity, roles and permissions
+
+    ``ver`` is the user's ``token_version`` at login. Changing the user's roles
+    or password increments it, which revokes every token issued before.
+    """
+    return create_token({
+        "sub": user_id,
+        "name": username,
+        "roles": sorted(roles),
+        "perms": sorted(permissions),
+        "ver": token_version,
+    })
+
+def decode_token_claims(token: str) -> dict:
     """
-    解码 JWT Token
+    解码 JWT Token，返回全部 claims
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+        if payload.get("sub") is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
+        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+def decode_token(token: str) -> str:
+    """
+    解码 JWT Token，返回用户 ID
+    """
+    return decode_token_claims(token)["sub"]
\ No newline at end of file
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import AUTH_CACHE_TTL
+from app.models import User
+
+# 进程内的令牌版本缓存 {user_id: (过期时间, token_version)}
+_versions: dict[str, tuple[float, int]] = {}
+_versions_lock = threading.Lock()
+
+
+def remember_token_version(user_id: str, token_version: int) -> None:
+    if AUTH_CACHE_TTL <= 0:
+        return
+    with _versions_lock:
+        _versions[user_id] = (time.monotonic() + AUTH_CACHE_TTL, token_version)
+
+
+def cached_token_version(user_id: str) -> Optional[int]:
+    with _versions_lock:
+        entry = _versions.get(user_id)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    return entry[1]
+
+
+async def get_token_version(user_id: str, db: AsyncSession) -> Optional[int]:
+    """
+    Get the current token version of a user
+
+    Served from the in-process cache when possible, otherwise one primary key
+    lookup. Returns None if the user does not exist.
+    """
+    token_version = cached_token_version(user_id)
+    if token_version is not None:
+        return token_version
+
+    token_version = await db.scalar(select(User.token_version).where(User.id == user_id))
+    if token_version is not None:
+        remember_token_version(user_id, token_version)
+    return token_version
+
+
+async def revoke_user_tokens(user_id: str, db: AsyncSession) -> int:
+    """
+    Invalidate every token issued to a user
+
+    Increments ``users.token_version`` and commits, together with the
+    caller's pending changes (e.g. the new roles or password hash). The cache
+    is updated after the commit, so old tokens are rejected by this process
+    right away instead of after the TTL.
+
+    Returns
+    -------
+    int
+        The new token version
+    """
+    token_version = await db.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+    )
+    await db.commit()
+    remember_token_version(user_id, token_version)
+    return token_version
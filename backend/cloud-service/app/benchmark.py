@@ -0,0 +1,328 @@
+"""
+乐谱预处理分阶段性能测试
+
+用法：
+    python -m app.benchmark [乐谱 ...] [--lengthen 2 4 8] [--repeat 3]
+                            [--save-baseline baseline.json] [--compare baseline.json] [--threshold 0.2]
+
+默认使用仓库 resources/ 下的两首巴赫乐谱，并把它们的小节重复若干倍生成更长的乐谱，
+观察耗时随乐谱长度的增长。每个乐谱在独立的子进程中运行，分别记录以下阶段的
+耗时、峰值内存（RSS）和输出文件大小：
+
+    parse       partitura.load_musicxml
+    midi        partitura.save_score_midi
+    wav         partitura.save_wav_fluidsynth
+    renditions  FLAC / Ogg Opus 压缩音频
+    features    score follower 参考特征
+
+不需要数据库和网络。--compare 发现耗时或内存超过阈值时以非零状态退出，可用于部署前检查。
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import partitura
+
+from app.reference_features import compute_reference_features
+from app.utils import encode_audio_renditions
+
+# 仓库自带的测试乐谱
+RESOURCES_DIR = Path(__file__).resolve().parents[3] / "resources"
+DEFAULT_SCORES = [
+    RESOURCES_DIR / "Bach-fugue_bwv_858.musicxml",
+    RESOURCES_DIR / "Bach-prelude_bwv_846.musicxml",
+]
+DEFAULT_LENGTHEN = [4, 16]
+
+STAGES = ["parse", "midi", "wav", "renditions", "features"]
+
+
+def lengthen_score(score_path: Path, factor: int, output_path: Path) -> Path:
+    """
+    Write a longer copy of an uncompressed MusicXML score
+
+    Every part's measures are repeated ``factor`` times and renumbered, which
+    scales the note count (and the rendered audio length) linearly while
+    keeping the musical texture of the original.
+
+    Parameters
+    ----------
+    score_path : Path
+        Path to a partwise ``.musicxml`` / ``.xml`` score
+    factor : int
+        Number of times the measures are repeated
+    output_path : Path
+        Where the lengthened score is written
+
+    Returns
+    -------
+    Path
+        ``output_path``
+    """
+    tree = ET.parse(score_path)
+    for part in tree.getroot().iter("part"):
+        measures = part.findall("measure")
+        for _ in range(factor - 1):
+            for measure in measures:
+                part.append(copy.deepcopy(measure))
+        for number, measure in enumerate(part.findall("measure"), start=1):
+            measure.set("number", str(number))
+    tree.write(output_path, encoding="UTF-8", xml_declaration=True)
+    return output_path
+
+
+def _peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 ** 2
+    return peak / 1024
+
+
+def _file_size(*paths: Path) -> int:
+    return sum(path.stat().st_size for path in paths if path.exists())
+
+
+def run_stages(score_path: str, work_dir: str) -> dict:
+    """
+    Run every preprocessing stage of one score and measure it
+
+    Runs in a fresh worker process so the peak RSS of one case is not
+    inflated by the cases before it. ``ru_maxrss`` is a high-water mark, so the
+    value reported for a stage is the process peak up to the end of that stage.
+
+    Parameters
+    ----------
+    score_path : str
+        Path to the score xml file
+    work_dir : str
+        Empty directory for the stage outputs
+
+    Returns
+    -------
+    dict
+        ``{stage: {"seconds", "peak_rss_mb", "output_bytes"}}``; a failed stage
+        has an ``error`` instead and the stages after it are skipped
+    """
+    work_dir = Path(work_dir)
+    score_copy = work_dir / Path(score_path).name
+    shutil.copyfile(score_path, score_copy)
+    midi_path = score_copy.with_suffix(".mid")
+    wav_path = score_copy.with_suffix(".wav")
+    state = {}
+
+    def _parse():
+        state["score"] = partitura.load_musicxml(score_copy)
+        state["notes"] = sum(len(part.notes_tied) for part in state["score"].parts)
+        return 0
+
+    def _midi():
+        partitura.save_score_midi(state["score"], midi_path)
+        return _file_size(midi_path)
+
+    def _wav():
+        partitura.save_wav_fluidsynth(state["score"], wav_path)
+        return _file_size(wav_path)
+
+    def _renditions():
+        return _file_size(*encode_audio_renditions(wav_path).values())
+
+    def _features():
+        return _file_size(compute_reference_features(score_copy, wav_path))
+
+    stage_funcs = {
+        "parse": _parse,
+        "midi": _midi,
+        "wav": _wav,
+        "renditions": _renditions,
+        "features": _features,
+    }
+
+    results = {}
+    failed = None
+    for stage in STAGES:
+        if failed:
+            results[stage] = {"error": f"skipped, {failed} failed"}
+            continue
+        started = time.perf_counter()
+        try:
+            output_bytes = stage_funcs[stage]()
+        except Exception as e:
+            results[stage] = {"error": f"{type(e).__name__}: {e}"}
+            failed = stage
+            continue
+        results[stage] = {
+            "seconds": round(time.perf_counter() - started, 4),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "output_bytes": output_bytes,
+        }
+    results["notes"] = state.get("notes")
+    return results
+
+
+def _run_case(score_path: Path, repeat: int) -> dict:
+    # spawn 保证每次运行的峰值内存从零开始统计
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="imusic-bench-") as work_dir:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(run_stages, str(score_path), work_dir).result())
+
+    case = {"notes": runs[0].pop("notes"), "stages": {}}
+    for stage in STAGES:
+        samples = [run[stage] for run in runs]
+        errors = [sample["error"] for sample in samples if "error" in sample]
+        if errors:
+            case["stages"][stage] = {"error": errors[0]}
+            continue
+        # 耗时取中位数，内存取最大值
+        case["stages"][stage] = {
+            "seconds": round(statistics.median(sample["seconds"] for sample in samples), 4),
+            "peak_rss_mb": max(sample["peak_rss_mb"] for sample in samples),
+            "output_bytes": samples[-1]["output_bytes"],
+        }
+    return case
+
+
+def run_benchmark(scores: list[Path], lengthen: list[int], repeat: int = 1) -> dict:
+    """
+    Benchmark the preprocessing stages over a set of scores
+
+    Parameters
+    ----------
+    scores : list[Path]
+        Source scores
+    lengthen : list[int]
+        Factors of the synthetically lengthened variants of every score
+    repeat : int
+        Runs per case, the median wall time is reported
+
+    Returns
+    -------
+    dict
+        Environment information and ``cases`` keyed by ``<score>`` or
+        ``<score>x<factor>``
+    """
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "partitura": getattr(partitura, "__version__", "unknown"),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="imusic-bench-src-") as src_dir:
+        cases = []
+        for score in scores:
+            cases.append((score.stem, score, 1))
+            for factor in lengthen:
+                if factor > 1:
+                    lengthened = lengthen_score(score, factor, Path(src_dir) / f"{score.stem}x{factor}.musicxml")
+                    cases.append((f"{score.stem}x{factor}", lengthened, factor))
+
+        for name, score_path, factor in cases:
+            print(f"Benchmarking {name} ...")
+            case = _run_case(score_path, repeat)
+            case["factor"] = factor
+            report["cases"][name] = case
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"{'case':<36} {'stage':<11} {'seconds':>9} {'peak MB':>9} {'output KB':>10}")
+    for name, case in report["cases"].items():
+        label = f"{name} ({case['notes']} notes)" if case["notes"] is not None else name
+        for stage in STAGES:
+            result = case["stages"][stage]
+            if "error" in result:
+                print(f"{label:<36} {stage:<11} {result['error']}")
+            else:
+                print(
+                    f"{label:<36} {stage:<11} {result['seconds']:>9.3f} "
+                    f"{result['peak_rss_mb']:>9.1f} {result['output_bytes'] / 1024:>10.1f}"
+                )
+            label = ""
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float = 0.2) -> list[str]:
+    """
+    Compare a run against a saved baseline
+
+    Parameters
+    ----------
+    baseline : dict
+        Report loaded from ``--save-baseline``
+    current : dict
+        Report of the current run
+    threshold : float
+        Allowed relative growth of wall time and peak RSS
+
+    Returns
+    -------
+    list[str]
+        One message per regression, empty if there is none
+    """
+    regressions = []
+    for name, case in current["cases"].items():
+        base_case = baseline["cases"].get(name)
+        if base_case is None:
+            continue
+        for stage in STAGES:
+            result = case["stages"][stage]
+            base = base_case["stages"].get(stage)
+            if base is None:
+                continue
+            if "error" in result and "error" not in base:
+                regressions.append(f"{name}/{stage}: failed ({result['error']})")
+                continue
+            if "error" in result or "error" in base:
+                continue
+            for metric in ("seconds", "peak_rss_mb"):
+                if base[metric] > 0 and result[metric] > base[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{name}/{stage}: {metric} {base[metric]} -> {result[metric]} "
+                        f"(+{(result[metric] / base[metric] - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the score preprocessing stages")
+    parser.add_argument("scores", nargs="*", type=Path, default=DEFAULT_SCORES, help="MusicXML scores to benchmark")
+    parser.add_argument("--lengthen", nargs="*", type=int, default=DEFAULT_LENGTHEN, help="lengthening factors")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the median time is reported")
+    parser.add_argument("--save-baseline", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.scores, args.lengthen, args.repeat)
+    print_report(result)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        problems = compare_reports(baseline, result, args.threshold)
+        if problems:
+            print(f"{len(problems)} regression(s) over {args.threshold:.0%}:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"No regression over {args.threshold:.0%} against {args.compare}")
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import UPLOAD_DIR, UPLOAD_CHUNK_SIZE, CHUNKED_UPLOAD_EXPIRE_HOURS
+from app.score_store import ScoreHasher, new_score_hasher
+
+# 分块上传的中间状态目录：<upload_id>.json 保存进度，<upload_id>.part 保存已接收的数据
+PARTIAL_UPLOAD_DIR = UPLOAD_DIR / "partial"
+
+# 单个分块的最大字节数
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# 整个文件的最大字节数，未声明 total_size 的上传同样受此限制
+MAX_UPLOAD_SIZE = 256 * 1024 * 1024
+
+# 进程内的增量哈希状态 {upload_id: (hasher, 已哈希的字节数)}
+# hashlib 对象无法持久化，服务重启后从 .part 文件重新计算一次
+_hashers: dict[str, tuple[ScoreHasher, int]] = {}
+# 同一个上传的分块按顺序写入 {upload_id: [锁, 正在使用的请求数]}，没有请求使用时删除
+_locks: dict[str, list] = {}
+
+
+def _state_path(upload_id: str) -> Path:
+    return PARTIAL_UPLOAD_DIR / f"{upload_id}.json"
+
+
+def _data_path(upload_id: str) -> Path:
+    return PARTIAL_UPLOAD_DIR / f"{upload_id}.part"
+
+
+def _save_state(state: dict) -> None:
+    # 先写临时文件再替换，进程崩溃时不会留下损坏的状态文件
+    path = _state_path(state["upload_id"])
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(state), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def _load_state(upload_id: str) -> Optional[dict]:
+    path = _state_path(upload_id)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+@asynccontextmanager
+async def _upload_lock(upload_id: str):
+    entry = _locks.setdefault(upload_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _locks.pop(upload_id, None)
+
+
+async def read_chunk(request: Request) -> bytes:
+    """
+    读取分块请求体：Content-Length 超过上限时直接拒绝，读取过程中累计字节数，超过上限立即停止
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if declared > MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Chunk larger than {MAX_CHUNK_SIZE} bytes")
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Chunk larger than {MAX_CHUNK_SIZE} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _write_at(path: Path, offset: int, data: bytes) -> None:
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+
+
+def _rehash(path: Path, filename: str, size: int) -> ScoreHasher:
+    hasher = new_score_hasher(filename)
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+def init_upload(user_id: str, filename: str, total_size: Optional[int], is_public: bool) -> dict:
+    """
+    创建分块上传会话，声明的文件大小超过上限时拒绝
+    """
+    if total_size is not None and total_size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=f"File larger than {MAX_UPLOAD_SIZE} bytes")
+    PARTIAL_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    state = {
+        "upload_id": upload_id,
+        "user_id": user_id,
+        "filename": filename,
+        "total_size": total_size,
+        "is_public": is_public,
+        "received": 0,
+        "created_at": time.time(),
+    }
+    _data_path(upload_id).touch()
+    _save_state(state)
+    _hashers[upload_id] = (new_score_hasher(filename), 0)
+    return state
+
+
+def get_upload(upload_id: str, user_id: str) -> dict:
+    """
+    获取分块上传会话状态，客户端断线重连后据此从 received 处继续上传
+    """
+    state = _load_state(upload_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if state["user_id"] != user_id:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return state
+
+
+async def write_chunk(upload_id: str, user_id: str, offset: int, data: bytes) -> dict:
+    """
+    Write one chunk of a resumable upload
+
+    The chunk must start at or before the number of bytes already received.
+    Bytes that were already received (e.g. a chunk re-sent after a dropped
+    connection) are skipped. The file may not grow beyond its declared size
+    nor beyond ``MAX_UPLOAD_SIZE``. File IO and hashing run in the threadpool so the
+    event loop is never blocked.
+
+    Parameters
+    ----------
+    upload_id : str
+        ID returned by ``init_upload``
+    user_id : str
+        ID of the uploading user
+    offset : int
+        Byte offset of ``data`` in the file
+    data : bytes
+        Chunk content
+
+    Returns
+    -------
+    dict
+        Updated upload state
+    """
+    if len(data) > MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=413, detail=f"Chunk larger than {MAX_CHUNK_SIZE} bytes")
+
+    async with _upload_lock(upload_id):
+        state = await run_in_threadpool(get_upload, upload_id, user_id)
+        received = state["received"]
+        if offset > received:
+            raise HTTPException(status_code=409, detail=f"Expected offset {received}, got {offset}")
+
+        data = data[received - offset:]
+        if not data:
+            return state
+        total_size = state["total_size"]
+        if total_size is not None and received + len(data) > total_size:
+            raise HTTPException(status_code=400, detail="Chunk exceeds declared file size")
+        if received + len(data) > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail=f"File larger than {MAX_UPLOAD_SIZE} bytes")
+
+        data_path = _data_path(upload_id)
+        await run_in_threadpool(_write_at, data_path, received, data)
+
+        hasher, hashed = _hashers.get(upload_id, (None, -1))
+        if hasher is None or hashed != received:
+            hasher = await run_in_threadpool(_rehash, data_path, state["filename"], received)
+        await run_in_threadpool(hasher.update, data)
+        _hashers[upload_id] = (hasher, received + len(data))
+
+        state["received"] = received + len(data)
+        await run_in_threadpool(_save_state, state)
+        return state
+
+
+async def finalize_upload(upload_id: str, user_id: str) -> tuple[Path, str, dict]:
+    """
+    Complete a resumable upload
+
+    The state file is removed here, so the same upload cannot be finalized
+    twice. If storing the file fails afterwards, the orphaned ``.part`` file
+    is removed by ``cleanup_expired_uploads``.
+
+    Returns
+    -------
+    tuple[Path, str, dict]
+        Path to the assembled file, its normalized content hash and the
+        upload state. The caller moves the file into the score store.
+    """
+    async with _upload_lock(upload_id):
+        state = await run_in_threadpool(get_upload, upload_id, user_id)
+        # 无论成功与否都不再保留哈希状态，未完成的上传继续时从 .part 文件重新计算
+        hasher, hashed = _hashers.pop(upload_id, (None, -1))
+        received = state["received"]
+        if state["total_size"] is not None and received != state["total_size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {received}/{state['total_size']} bytes",
+            )
+
+        data_path = _data_path(upload_id)
+        if hasher is None or hashed != received:
+            hasher = await run_in_threadpool(_rehash, data_path, state["filename"], received)
+
+        _state_path(upload_id).unlink(missing_ok=True)
+    return data_path, hasher.hexdigest(), state
+
+
+def cleanup_expired_uploads() -> int:
+    """
+    删除超过有效期仍未完成的分块上传及其进程内的哈希状态，以及完成后没有被存储的数据文件
+    """
+    # 状态文件已不存在的上传（例如被其他进程清理）不再保留哈希状态
+    for upload_id in list(_hashers):
+        if not _state_path(upload_id).exists():
+            _hashers.pop(upload_id, None)
+    if not PARTIAL_UPLOAD_DIR.exists():
+        return 0
+
+    expire_before = time.time() - CHUNKED_UPLOAD_EXPIRE_HOURS * 3600
+    removed = 0
+    for state_path in PARTIAL_UPLOAD_DIR.glob("*.json"):
+        try:
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            if state.get("created_at", 0) >= expire_before:
+                continue
+            _data_path(state["upload_id"]).unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            _hashers.pop(state["upload_id"], None)
+            removed += 1
+        except Exception as e:
+            logging.error(f"Failed to clean up partial upload {state_path}: {e}")
+
+    # 没有状态文件的数据文件：finalize 之后存储或提交失败留下的
+    for data_path in PARTIAL_UPLOAD_DIR.glob("*.part"):
+        try:
+            if _state_path(data_path.stem).exists() or data_path.stat().st_mtime >= expire_before:
+                continue
+            data_path.unlink(missing_ok=True)
+            removed += 1
+        except Exception as e:
+            logging.error(f"Failed to clean up partial upload {data_path}: {e}")
+    return removed
+
+
+async def run_periodic_cleanup(interval: float = 3600) -> None:
+    """
+    服务运行期间定期清理过期的分块上传
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await run_in_threadpool(cleanup_expired_uploads)
+            if removed:
+                print(f"Removed {removed} expired chunked uploads")
+        except Exception as e:
+            logging.error(f"Failed to clean up chunked uploads: {e}")
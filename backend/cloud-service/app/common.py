@@ -6,6 +6,20 @@ class GetFileType(Enum):
     MIDI_FILE = "midi"
 
 
+class AudioFormat(Enum):
+    WAV = "wav"    # fluidsynth 渲染的原始音频
+    FLAC = "flac"  # 无损压缩
+    OGG = "ogg"    # Ogg Opus，用于播放
+
+
+class ProcessingState(Enum):
+    QUEUED = "queued"        # 已上传，等待预处理
+    RENDERING = "rendering"  # 正在生成 MIDI / 音频
+    DONE = "done"            # 预处理完成
+    FAILED = "failed"        # 预处理失败
+    DEFERRED = "deferred"    # 延迟渲染模式：首次请求 MIDI / 音频时再渲染
+
+
 class EvaluationMetric(Enum):
     PITCH_ACCURACY = "音高准确度"
     RHYTHM_ACCURACY = "节奏准确度"
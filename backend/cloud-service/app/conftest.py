@@ -0,0 +1,74 @@
+import pytest
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from app.db_base import Base
+
+
+@compiles(TSVECTOR, "sqlite")
+def _compile_tsvector(element, compiler, **kw):
+    # 全文检索列在 sqlite 中存为普通文本
+    return "TEXT"
+
+
+def _register_pg_functions(dbapi_connection, connection_record):
+    # 服务代码用到的 PostgreSQL 函数：全文检索只取原文，advisory lock 在单连接的 sqlite 中总能获得
+    dbapi_connection.create_function("to_tsvector", 2, lambda config, text: text, deterministic=True)
+    dbapi_connection.create_function("pg_advisory_xact_lock", 1, lambda key: None)
+    dbapi_connection.create_function("pg_try_advisory_lock", 1, lambda key: True)
+
+
+class SyncSessionAdapter:
+    """
+    Run the statements of code written for ``AsyncSession`` on a sync session
+
+    The async sqlite driver is not a dependency of the service, so tests run
+    the very same ``select()`` / ``update()`` statements through a sync
+    sqlite session instead. Only the awaitable wrapper differs.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def execute(self, statement, *args, **kwargs):
+        return self.session.execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return self.session.scalar(statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return self.session.scalars(statement, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return self.session.get(*args, **kwargs)
+
+    async def commit(self):
+        self.session.commit()
+
+    async def close(self):
+        self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.session.close()
+        return False
+
+
+@pytest.fixture
+def sqlite_db():
+    """
+    内存 sqlite 数据库：返回 (会话工厂, 执行过的 SQL 列表)，会话工厂的 bind 即引擎
+    """
+    engine = create_engine("sqlite://")
+    event.listen(engine, "connect", _register_pg_functions)
+    Base.metadata.create_all(engine)
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    session_factory = sessionmaker(bind=engine)
+    yield session_factory, queries
+    engine.dispose()
@@ -1,25 +1,27 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from app.db_base import DATABASE_URL, Base, engine  # 使用从 db_base 导入的 Base
 import app.models  # 导入模块以注册所有模型
 from sqlalchemy.orm import Session
-from .config import DATABASE_URL
+from .config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT
+from .query_metrics import instrument_engine
 
-# 同步引擎和会话
+# 同步引擎和会话，只用于预处理子进程、批量导入等后台任务，接口统一使用异步会话
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# 异步引擎和会话
+# 异步引擎和会话，所有接口共用这一个连接池
 async_engine = create_async_engine(
     DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://'),
-    echo=True,
     future=True,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
     pool_recycle=1800,
 )
+# 接口的查询计入请求级统计
+instrument_engine(async_engine.sync_engine)
 
 async_session = async_sessionmaker(
     async_engine,
@@ -30,22 +32,11 @@ async_session = async_sessionmaker(
 )
 
 async def get_async_db():
+    """
+    获取异步数据库会话，由接口自行提交；未提交的修改在关闭时回滚
+    """
     async with async_session() as session:
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
-        finally:
-            await session.close()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+        yield session
 
 def seed_permissions(db: Session):
     permissions = [
@@ -97,6 +88,9 @@ def seed_role_permissions(db: Session):
 # 创建所有表并初始化数据
 if __name__ == "__main__":
     print("Creating database tables...")
+    # 曲目库搜索的三元组索引（gin_trgm_ops）依赖 pg_trgm 扩展，建表前先创建
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
     Base.metadata.create_all(bind=engine)  # 创建表
     print("Database tables created successfully.")
 
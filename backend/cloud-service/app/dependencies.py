@@ -1,29 +1,71 @@
+from dataclasses import dataclass
 from fastapi import Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from .database import SessionLocal
+from .database import AsyncSession, async_session, get_async_db
 from .models import User
-from .auth import decode_token
+from .auth import decode_token_claims
+from .auth_cache import cached_token_version, get_token_version, remember_token_version
 
-def get_db():
-    """
-    获取数据库会话
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-def get_current_user(authorization: str = Header(...), db: Session = Depends(get_db)) -> User:
+@dataclass(frozen=True)
+class TokenUser:
     """
-    从 Authorization 头中解析用户身份
+    由令牌 claims 构造的用户身份，不对应数据库记录
     """
+    id: str
+    name: str
+    roles: tuple
+    permissions: tuple
+
+
+def _get_claims(authorization: str) -> dict:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
-    
-    token = authorization.split(" ")[1]
-    user_id = decode_token(token)  # 解码 Token 获取用户 ID
-    user = db.query(User).filter(User.id == user_id).first()
+    return decode_token_claims(authorization.split(" ")[1])
+
+
+def _check_token_version(claims: dict, token_version) -> None:
+    if token_version is None:
+        raise HTTPException(status_code=401, detail="User not authenticated")
+    if claims.get("ver") != token_version:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+
+async def get_token_user(authorization: str = Header(...)) -> TokenUser:
+    """
+    Authenticate from the token claims alone
+
+    For read endpoints that only need the user's id, name, roles or
+    permissions. The token version is checked against the in-process cache,
+    so a warm request does not touch the database; a cache miss costs one
+    primary key lookup.
+    """
+    claims = _get_claims(authorization)
+    if "ver" not in claims:
+        # 旧格式的令牌没有 claims，需要重新登录
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    token_version = cached_token_version(claims["sub"])
+    if token_version is None:
+        # 缓存未命中时才从连接池取连接
+        async with async_session() as db:
+            token_version = await get_token_version(claims["sub"], db)
+    _check_token_version(claims, token_version)
+    return TokenUser(
+        id=claims["sub"],
+        name=claims.get("name"),
+        roles=tuple(claims.get("roles", ())),
+        permissions=tuple(claims.get("perms", ())),
+    )
+
+
+async def get_current_user(authorization: str = Header(...), db: AsyncSession = Depends(get_async_db)) -> User:
+    """
+    从 Authorization 头中解析用户身份，与接口共用同一个会话
+    """
+    claims = _get_claims(authorization)
+    user = await db.get(User, claims["sub"])
     if not user:
         raise HTTPException(status_code=401, detail="User not authenticated")
-    return user
\ No newline at end of file
+    _check_token_version(claims, user.token_version)
+    remember_token_version(user.id, user.token_version)
+    return user
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+
+from pathlib import Path
+from typing import Iterable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from app.common import AudioFormat
+from app.database import async_session
+from app.models import UploadedFile
+from app.reference_features import reference_features_path
+from app.score_cache import parsed_score_path
+from app.note_index import note_index_path
+from app.score_store import lock_blob, release_score_blob
+from app.utils import audio_rendition_path
+
+# 待回收的 (content_hashes, file_paths)，由后台任务逐个处理
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+
+
+def legacy_file_paths(uploaded_file: UploadedFile) -> list[Path]:
+    """
+    非内容寻址的旧记录独占的文件：乐谱、MIDI、音频及其派生文件
+    """
+    score_path = Path(uploaded_file.filepath)
+    file_paths = [
+        Path(path)
+        for path in (uploaded_file.filepath, uploaded_file.midi_path, uploaded_file.audio_path)
+        if path
+    ]
+    # 解析结果缓存、参考特征和音符索引
+    file_paths.append(parsed_score_path(score_path))
+    file_paths.append(reference_features_path(score_path))
+    file_paths.append(note_index_path(score_path))
+    if uploaded_file.audio_path:
+        # 压缩音频
+        file_paths.extend(
+            audio_rendition_path(Path(uploaded_file.audio_path), audio_format)
+            for audio_format in (AudioFormat.FLAC, AudioFormat.OGG)
+        )
+    return file_paths
+
+
+def delete_local_files(file_paths: list[Path]) -> None:
+    """
+    删除旧的非内容寻址文件，单个文件删除失败时继续删除其他文件
+    """
+    for file_path in file_paths:
+        try:
+            if file_path.exists():
+                file_path.unlink()
+                print(f"Successfully deleted file: {file_path}")
+        except Exception as e:
+            print(f"Failed to delete file {file_path}: {str(e)}")
+
+
+async def reclaim(content_hashes: set, file_paths: list[Path]) -> None:
+    """
+    Remove the files of deleted ``UploadedFile`` rows
+
+    A blob is only removed if no row references its content hash any more.
+    The references are counted here rather than when the rows are deleted,
+    under the content hash's advisory lock (see ``lock_blob``). So a blob
+    that was uploaded again in the meantime is kept, even if its new row is
+    not committed yet.
+
+    Parameters
+    ----------
+    content_hashes : set
+        Content hashes of the deleted rows
+    file_paths : list[Path]
+        Files owned by deleted rows outside the content-addressed store
+    """
+    for content_hash in sorted(content_hashes):
+        # 每个哈希一个短事务，不会长时间阻塞相同内容的上传
+        async with async_session() as db:
+            await db.execute(lock_blob(content_hash))
+            referenced = await db.scalar(
+                select(UploadedFile.id).where(UploadedFile.content_hash == content_hash).limit(1)
+            )
+            if referenced is None:
+                await run_in_threadpool(release_score_blob, content_hash)
+            await db.commit()
+    if file_paths:
+        await run_in_threadpool(delete_local_files, file_paths)
+
+
+async def _run() -> None:
+    while True:
+        content_hashes, file_paths = await _queue.get()
+        try:
+            await reclaim(content_hashes, file_paths)
+        except Exception as e:
+            # 回收失败只会留下孤立文件，不影响已删除的记录
+            logging.error(f"Failed to reclaim files: {e}")
+        finally:
+            _queue.task_done()
+
+
+def schedule_reclaim(content_hashes: Iterable[str] = (), file_paths: Iterable[Path] = ()) -> None:
+    """
+    删除记录并提交事务后调用，文件在后台删除，接口不等待文件 IO
+    """
+    global _queue, _worker
+    content_hashes = {content_hash for content_hash in content_hashes if content_hash}
+    file_paths = list(file_paths)
+    if not content_hashes and not file_paths:
+        return
+    if _worker is None or _worker.done():
+        _queue = asyncio.Queue()
+        _worker = asyncio.get_running_loop().create_task(_run())
+    _queue.put_nowait((content_hashes, file_paths))
+
+
+async def drain(timeout: Optional[float] = None) -> None:
+    """
+    等待已提交的回收任务完成，服务关闭时调用
+    """
+    if _queue is None:
+        return
+    try:
+        await asyncio.wait_for(_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logging.error(f"{_queue.qsize()} file reclaim jobs were not finished")
@@ -0,0 +1,218 @@
+import os
+import re
+
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from pathlib import Path
+from typing import Iterator, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.common import AudioFormat
+from app.config import FILE_CACHE_MAX_AGE
+
+# 流式读取文件的块大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+AUDIO_MEDIA_TYPES = {
+    AudioFormat.WAV: "audio/wav",
+    AudioFormat.FLAC: "audio/flac",
+    AudioFormat.OGG: "audio/ogg",
+}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def negotiate_audio_format(
+    requested: Optional[str],
+    accept: Optional[str],
+    available: list[AudioFormat],
+) -> AudioFormat:
+    """
+    Pick the audio format to serve
+
+    An explicit ``format`` query parameter wins. Otherwise the ``Accept``
+    header is matched against the available formats by q-value; wildcards are
+    ignored so that clients which did not ask for a compressed format keep
+    getting WAV.
+
+    Parameters
+    ----------
+    requested : str, optional
+        Value of the ``format`` query parameter
+    accept : str, optional
+        Value of the ``Accept`` request header
+    available : list[AudioFormat]
+        Formats that exist on disk for the file
+
+    Returns
+    -------
+    AudioFormat
+        Format to serve, ``AudioFormat.WAV`` by default
+    """
+    if requested:
+        audio_format = AudioFormat(requested.lower())
+        if audio_format not in available:
+            raise ValueError(f"Audio format not available: {requested}")
+        return audio_format
+
+    best, best_q = AudioFormat.WAV, 0.0
+    for part in (accept or "").split(","):
+        fields = [field.strip() for field in part.split(";")]
+        media_type = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        for audio_format in available:
+            if AUDIO_MEDIA_TYPES[audio_format] == media_type and q > best_q:
+                best, best_q = audio_format, q
+    return best
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """
+    解析单个 bytes 区间，返回闭区间 (start, end)；无法满足时返回 None
+    """
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == "":
+        # bytes=-N 表示最后 N 个字节
+        if end == "" or int(end) == 0:
+            return None
+        start = max(file_size - int(end), 0)
+        end = file_size - 1
+    else:
+        start = int(start)
+        end = int(end) if end else file_size - 1
+        end = min(end, file_size - 1)
+    if start > end or start >= file_size:
+        return None
+    return start, end
+
+
+def content_disposition(filename: str) -> str:
+    # 与 FileResponse 的处理方式相同：非 ASCII 文件名使用 RFC 5987 编码
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _iter_file_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """
+    由文件大小和修改时间生成 ETag，不需要读取文件内容
+    """
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def file_validators(path: Path) -> dict:
+    """
+    文件的缓存校验信息，供清单接口和文件接口共用
+    """
+    stat_result = path.stat()
+    return {
+        "size": stat_result.st_size,
+        "etag": file_etag(stat_result),
+        "last_modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match 使用弱比较
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in tags
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    判断条件请求是否可以返回 304，If-None-Match 优先于 If-Modified-Since
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve_file(
+    request: Request,
+    path: Path,
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+) -> Response:
+    """
+    Serve a file with HTTP caching and Range support
+
+    Every response carries ``ETag``, ``Last-Modified`` and ``Cache-Control``.
+    A matching ``If-None-Match`` / ``If-Modified-Since`` gets ``304 Not
+    Modified`` without touching the file content. A single ``bytes=`` range
+    gets ``206 Partial Content`` (unless ``If-Range`` no longer matches), an
+    unsatisfiable range gets ``416``. Multiple ranges are not supported and
+    fall back to the whole file, which RFC 7233 allows.
+    """
+    stat_result = path.stat()
+    file_size = stat_result.st_size
+    etag = file_etag(stat_result)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={FILE_CACHE_MAX_AGE}",
+    }
+
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() not in (etag, headers["Last-Modified"]):
+        # 文件已变化，忽略 Range 返回完整文件
+        range_header = None
+
+    if not range_header or "," in range_header:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
+
+    if filename:
+        headers["Content-Disposition"] = content_disposition(filename)
+
+    byte_range = parse_range(range_header, file_size)
+    if byte_range is None:
+        headers["Content-Range"] = f"bytes */{file_size}"
+        return Response(status_code=416, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
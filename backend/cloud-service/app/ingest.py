@@ -0,0 +1,208 @@
+"""
+批量导入乐谱库
+
+用法：
+    python -m app.ingest <目录> --user-email admin@example.com [--public] [--workers N] [--batch-size 500]
+
+遍历目录下的 MusicXML 文件，写入内容寻址存储，在进程池中并行渲染 MIDI / 音频，
+最后按批次在大事务中插入 UploadedFile 记录。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from app.common import ProcessingState
+from app.database import SessionLocal
+from app.models import User, UploadedFile
+from app.preprocess_queue import render_score_artifacts
+from app.score_metadata import METADATA_FIELDS, read_score_metadata
+from app.score_store import SCORE_SUFFIXES, lock_blob, release_score_blob, save_upload_to_tmp, store_score_blob
+from app.config import init_config
+from app.library_cache import invalidate_library
+
+
+def find_scores(root: Path) -> list[Path]:
+    return sorted(
+        path for path in root.rglob("*")
+        if path.is_file() and path.suffix.lower() in SCORE_SUFFIXES
+    )
+
+
+def _render(score_path: str) -> tuple[str, str, dict]:
+    midi_path, audio_path = render_score_artifacts(Path(score_path), score_path)
+    try:
+        metadata = read_score_metadata(Path(score_path))
+    except Exception as e:
+        logging.error(f"Failed to extract metadata of {score_path}: {e}")
+        metadata = dict.fromkeys(METADATA_FIELDS)
+    return midi_path, audio_path, metadata
+
+
+def ingest_directory(
+    root: Path,
+    user_email: str,
+    is_public: bool = False,
+    workers: int = os.cpu_count() or 1,
+    batch_size: int = 500,
+) -> dict:
+    """
+    Ingest every score under a directory
+
+    Identical scores (same content hash) are rendered once. Scores the user
+    already owns are skipped. Blobs of scores that failed to render are
+    removed again unless another row references them.
+
+    Parameters
+    ----------
+    root : Path
+        Directory to walk
+    user_email : str
+        E-mail of the user that owns the imported files
+    is_public : bool
+        Whether the imported files are public
+    workers : int
+        Number of render processes
+    batch_size : int
+        Number of ``UploadedFile`` rows inserted per transaction
+
+    Returns
+    -------
+    dict
+        Counts and timings of the run
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == user_email).first()
+        if not user:
+            raise ValueError(f"User not found: {user_email}")
+        owned_hashes = {
+            content_hash
+            for (content_hash,) in db.query(UploadedFile.content_hash)
+            .filter(UploadedFile.user_id == user.id, UploadedFile.content_hash.isnot(None))
+            .all()
+        }
+    finally:
+        db.close()
+
+    stats = {"found": 0, "skipped": 0, "rendered": 0, "failed": 0, "inserted": 0}
+    started = time.perf_counter()
+
+    # 1. 计算内容哈希并写入存储
+    sources = find_scores(root)
+    stats["found"] = len(sources)
+    entries = []  # (filename, content_hash, score_path)
+    for source in sources:
+        with open(source, "rb") as f:
+            tmp_path, content_hash = save_upload_to_tmp(f, source.name)
+        if content_hash in owned_hashes:
+            tmp_path.unlink(missing_ok=True)
+            stats["skipped"] += 1
+            continue
+        owned_hashes.add(content_hash)
+        score_path = store_score_blob(tmp_path, content_hash, source.name)
+        entries.append((source.name, content_hash, score_path))
+    stored_at = time.perf_counter()
+    print(f"Stored {len(entries)} scores ({stats['skipped']} skipped) in {stored_at - started:.1f}s")
+
+    # 2. 并行渲染，相同内容只渲染一次
+    unique_scores = {content_hash: score_path for _, content_hash, score_path in entries}
+    artifacts = {}  # content_hash -> (midi_path, audio_path, metadata)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_render, str(score_path)): content_hash
+            for content_hash, score_path in unique_scores.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            content_hash = futures[future]
+            try:
+                artifacts[content_hash] = future.result()
+                stats["rendered"] += 1
+            except Exception as e:
+                logging.error(f"Failed to render {unique_scores[content_hash]}: {e}")
+                stats["failed"] += 1
+            if done % 50 == 0 or done == len(futures):
+                elapsed = time.perf_counter() - stored_at
+                print(f"Rendered {done}/{len(futures)} ({done / elapsed:.2f} scores/s)")
+    rendered_at = time.perf_counter()
+
+    # 3. 批量插入数据库记录
+    now = datetime.now()
+    rows = [
+        {
+            "id": str(uuid.uuid4())[:8],
+            "filename": filename,
+            "filepath": str(score_path),
+            "midi_path": artifacts[content_hash][0],
+            "audio_path": artifacts[content_hash][1],
+            "content_hash": content_hash,
+            "processing_state": ProcessingState.DONE.value,
+            "is_public": is_public,
+            "user_id": user.id,
+            "created_by": user.name,
+            "updated_by": user.name,
+            "created_at": now,
+            "updated_at": now,
+            **artifacts[content_hash][2],
+        }
+        for filename, content_hash, score_path in entries
+        if content_hash in artifacts
+    ]
+    db = SessionLocal()
+    try:
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            # 渲染期间 blob 还没有记录引用，可能已被删除文件的回收任务删除；在锁内确认仍然存在
+            for content_hash in sorted({row["content_hash"] for row in batch}):
+                db.execute(lock_blob(content_hash))
+            missing = {row["content_hash"] for row in batch if not Path(row["filepath"]).exists()}
+            for content_hash in missing:
+                logging.error(f"Blob {content_hash} was removed during ingest, skipping it")
+            stats["failed"] += len(missing)
+            batch = [row for row in batch if row["content_hash"] not in missing]
+            db.bulk_insert_mappings(UploadedFile, batch)
+            db.commit()
+            stats["inserted"] += len(batch)
+
+        # 渲染失败的乐谱没有插入记录，删除导入时写入的 blob；已被其他记录引用的保留
+        for content_hash in sorted(unique_scores.keys() - artifacts.keys()):
+            db.execute(lock_blob(content_hash))
+            referenced = db.query(UploadedFile.id).filter(UploadedFile.content_hash == content_hash).first()
+            if referenced is None:
+                release_score_blob(content_hash)
+            db.commit()
+    finally:
+        db.close()
+    if is_public and stats["inserted"]:
+        # 配置了共享缓存时立即生效，否则各服务进程的缓存在 TTL 后过期
+        asyncio.run(invalidate_library())
+    finished = time.perf_counter()
+
+    stats["store_seconds"] = round(stored_at - started, 2)
+    stats["render_seconds"] = round(rendered_at - stored_at, 2)
+    stats["insert_seconds"] = round(finished - rendered_at, 2)
+    stats["total_seconds"] = round(finished - started, 2)
+    stats["scores_per_second"] = round(stats["inserted"] / max(finished - started, 1e-9), 2)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk ingest a directory of MusicXML scores")
+    parser.add_argument("root", type=Path, help="directory to walk")
+    parser.add_argument("--user-email", required=True, help="owner of the imported files")
+    parser.add_argument("--public", action="store_true", help="make the imported files public")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of render processes")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per insert transaction")
+    args = parser.parse_args()
+
+    init_config()
+    result = ingest_directory(args.root, args.user_email, args.public, args.workers, args.batch_size)
+    print("Ingest finished:")
+    for key, value in result.items():
+        print(f"  {key}: {value}")
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from app.config import LIBRARY_CACHE_URL, LIBRARY_CACHE_TTL, LIBRARY_CACHE_MAX_ENTRIES
+
+# 共享缓存中的键前缀
+KEY_PREFIX = "imusic:library"
+
+
+class LRUCache:
+    """
+    进程内的 LRU 缓存，未配置共享缓存时使用，也可在本地代替共享缓存
+    """
+
+    def __init__(self, max_entries: int = LIBRARY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    async def generation(self) -> int:
+        return self._generation
+
+    async def bump_generation(self) -> None:
+        # 旧一代的条目不会再被读到，直接清空释放内存
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    async def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """
+    多个服务进程共享的缓存，需要安装 redis 包
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._client = redis.from_url(url)
+
+    async def generation(self) -> int:
+        return int(await self._client.get(f"{KEY_PREFIX}:generation") or 0)
+
+    async def bump_generation(self) -> None:
+        # 旧一代的条目由 TTL 自然过期
+        await self._client.incr(f"{KEY_PREFIX}:generation")
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._client.get(f"{KEY_PREFIX}:{key}")
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        await self._client.set(f"{KEY_PREFIX}:{key}", json.dumps(value), ex=ttl)
+
+
+def create_backend(url: str = LIBRARY_CACHE_URL):
+    if url:
+        try:
+            return RedisCache(url)
+        except ImportError:
+            logging.error("LIBRARY_CACHE_URL is set but the redis package is not installed, using the in-process cache")
+    return LRUCache()
+
+
+backend = create_backend()
+
+# 正在加载的页面 {key: Future}，同一页面的并发请求只查询一次数据库
+_inflight: dict[str, asyncio.Future] = {}
+
+
+async def read_through(key_parts: tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Return a cached public-library page, loading it on a miss
+
+    Keys are scoped by a generation number that every invalidation bumps, so
+    an invalidation drops all pages and counts at once. Concurrent misses of
+    the same page share one load; if that load is cancelled, the waiting
+    callers load the page themselves. If the cache backend fails the page is
+    loaded from the database as if there was no cache.
+
+    Parameters
+    ----------
+    key_parts : tuple
+        Query parameters identifying the page
+    loader : Callable[[], Awaitable[Any]]
+        Coroutine function producing the JSON serializable page
+
+    Returns
+    -------
+    Any
+        The page
+    """
+    if LIBRARY_CACHE_TTL <= 0:
+        return await loader()
+
+    try:
+        generation = await backend.generation()
+        key = f"{generation}:" + ":".join("" if part is None else str(part) for part in key_parts)
+        value = await backend.get(key)
+    except Exception as e:
+        logging.error(f"Library cache unavailable: {e}")
+        return await loader()
+    if value is not None:
+        return value
+
+    future = _inflight.get(key)
+    if future is not None:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # 等待者自身被取消
+                raise
+            # 负责加载的请求被取消（例如客户端断开），自行加载
+            return await loader()
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        value = await loader()
+        future.set_result(value)
+    except Exception as e:
+        future.set_exception(e)
+        # 没有其他等待者时避免 "exception was never retrieved" 警告
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+        if not future.done():
+            # 加载被取消（CancelledError 不是 Exception），通知等待者不要一直等下去
+            future.cancel()
+
+    try:
+        await backend.set(key, value, LIBRARY_CACHE_TTL)
+    except Exception as e:
+        logging.error(f"Failed to store library page in cache: {e}")
+    return value
+
+
+async def invalidate_library() -> None:
+    """
+    公开曲目库发生变化（新增、删除、公开状态变化）时调用
+    """
+    try:
+        await backend.bump_generation()
+    except Exception as e:
+        logging.error(f"Failed to invalidate library cache: {e}")
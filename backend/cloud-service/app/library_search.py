@@ -0,0 +1,145 @@
+from typing import Optional
+
+from sqlalchemy import func, literal, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.models import UploadedFile
+
+# 搜索的排序方式及其默认方向
+SORT_ORDERS = {
+    "relevance": "desc",
+    "newest": "desc",
+    "title": "asc",
+    "composer": "asc",
+    "duration": "asc",
+    "notes": "asc",
+}
+
+_SORT_COLUMNS = {
+    "newest": UploadedFile.created_at,
+    "title": UploadedFile.title,
+    "composer": UploadedFile.composer,
+    "duration": UploadedFile.duration_seconds,
+    "notes": UploadedFile.note_count,
+}
+
+# to_tsvector / websearch_to_tsquery 使用同一个分词配置，乐谱标题多为人名和外文，不做词干处理
+_TS_CONFIG = literal_column("'simple'::regconfig")
+
+
+def escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_search_query(
+    q: Optional[str] = None,
+    *,
+    composer: Optional[str] = None,
+    key: Optional[str] = None,
+    time_signature: Optional[str] = None,
+    parts: Optional[int] = None,
+    min_duration: Optional[float] = None,
+    max_duration: Optional[float] = None,
+    min_notes: Optional[int] = None,
+    max_notes: Optional[int] = None,
+    sort: str = "relevance",
+    order: Optional[str] = None,
+    limit: int = 10,
+    offset: int = 0,
+) -> Select:
+    """
+    Build the public library search query
+
+    ``q`` matches whole words through the full-text index, substrings of the
+    title, composer and filename through the trigram indexes, and misspelt
+    words of the title and composer through trigram word similarity. Every
+    condition is served by an index, so no score file is read.
+
+    Parameters
+    ----------
+    q : str, optional
+        Free text query
+    composer, key, time_signature, parts, min_duration, max_duration, min_notes, max_notes
+        Metadata filters, None means no filter
+    sort : str
+        One of ``SORT_ORDERS``; ``relevance`` falls back to ``newest``
+        without ``q``
+    order : str, optional
+        ``asc`` or ``desc``, defaults to the natural order of ``sort``
+    limit : int
+        Maximum number of rows
+    offset : int
+        Number of rows skipped
+
+    Returns
+    -------
+    Select
+        Query selecting ``UploadedFile`` rows
+    """
+    if sort not in SORT_ORDERS:
+        raise ValueError(f"Invalid sort: {sort}")
+    order = order or SORT_ORDERS[sort]
+    if order not in ("asc", "desc"):
+        raise ValueError(f"Invalid order: {order}")
+
+    stmt = select(UploadedFile).where(UploadedFile.is_public == True)
+
+    q = " ".join(q.split()) if q else None
+    if q:
+        tsquery = func.websearch_to_tsquery(_TS_CONFIG, q)
+        pattern = f"%{escape_like(q)}%"
+        stmt = stmt.where(or_(
+            UploadedFile.search_vector.op("@@")(tsquery),
+            UploadedFile.title.ilike(pattern, escape="\\"),
+            UploadedFile.composer.ilike(pattern, escape="\\"),
+            UploadedFile.filename.ilike(pattern, escape="\\"),
+            literal(q).op("<%")(UploadedFile.title),
+            literal(q).op("<%")(UploadedFile.composer),
+        ))
+    elif sort == "relevance":
+        sort = "newest"
+
+    if composer:
+        stmt = stmt.where(UploadedFile.composer.ilike(f"%{escape_like(composer)}%", escape="\\"))
+    if key:
+        stmt = stmt.where(UploadedFile.key_signature == key)
+    if time_signature:
+        stmt = stmt.where(UploadedFile.time_signature == time_signature)
+    if parts is not None:
+        stmt = stmt.where(UploadedFile.part_count == parts)
+    if min_duration is not None:
+        stmt = stmt.where(UploadedFile.duration_seconds >= min_duration)
+    if max_duration is not None:
+        stmt = stmt.where(UploadedFile.duration_seconds <= max_duration)
+    if min_notes is not None:
+        stmt = stmt.where(UploadedFile.note_count >= min_notes)
+    if max_notes is not None:
+        stmt = stmt.where(UploadedFile.note_count <= max_notes)
+
+    if sort == "relevance":
+        # greatest 忽略 NULL，没有标题或作曲家的乐谱按文件名计算相似度
+        column = func.ts_rank(UploadedFile.search_vector, tsquery) + func.greatest(
+            func.word_similarity(q, UploadedFile.title),
+            func.word_similarity(q, UploadedFile.composer),
+            func.word_similarity(q, UploadedFile.filename),
+        )
+    else:
+        column = _SORT_COLUMNS[sort]
+    column = column.desc() if order == "desc" else column.asc()
+    # 元数据未提取的乐谱排在最后；id 保证翻页顺序稳定
+    return stmt.order_by(column.nulls_last(), UploadedFile.id).offset(offset).limit(limit)
+
+
+async def search_library(db: AsyncSession, page: int, page_size: int, **criteria) -> tuple[list[UploadedFile], dict]:
+    """
+    执行搜索，多查询一行判断是否还有下一页，不做 COUNT
+    """
+    stmt = build_search_query(limit=page_size + 1, offset=(page - 1) * page_size, **criteria)
+    files = list((await db.execute(stmt)).scalars())
+    pagination = {
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(files) > page_size,
+    }
+    return files[:page_size], pagination
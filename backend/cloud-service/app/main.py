@@ -1,29 +1,47 @@
+import asyncio
+import json
 import uuid
-import shutil
-import base64
 import logging
 
 from pathlib import Path
-from fastapi import FastAPI, File, Form, UploadFile, WebSocket, Depends, HTTPException, Query
+from typing import Optional
+from fastapi import FastAPI, File, Form, UploadFile, WebSocket, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, JSONResponse
 from datetime import datetime
+from sqlalchemy import delete, update
 from sqlalchemy.sql import select, func
 
 from .utils import (
-    preprocess_score,
     has_permission,
 )
+from .permissions import invalidate_permissions, load_permissions, load_role_names
+from .preprocess_queue import PENDING_STATES, submit_preprocess, submit_metadata, requeue_pending_jobs, shutdown_executor
+from .common import ProcessingState, AudioFormat
+from .file_streaming import AUDIO_MEDIA_TYPES, negotiate_audio_format, serve_file, file_validators
 from .database import AsyncSession, get_async_db
-from .dependencies import get_current_user, get_db
-from .models import UploadedFile, User, UserRole, Role, Permission, RolePermission
-from .auth import (hash_password, verify_password, create_token, decode_token)  # Import hash_password if defined in utils
-from .RequestModel import LoginRequest, RegisterRequest, ChangePasswordRequest, ManagePermissionRequest, UpdateVisibilityRequest
+from .dependencies import TokenUser, get_current_user, get_token_user
+from .models import UploadedFile, User, UserRole, Role, Permission
+from .auth import create_user_token
+from .password_hashing import PasswordHashingBusy, hash_password_async, verify_password_async
+from .auth_cache import revoke_user_tokens
+from .RequestModel import LoginRequest, RegisterRequest, ChangePasswordRequest, ManagePermissionRequest, UpdateVisibilityRequest, ChunkedUploadInitRequest, BatchUpdateVisibilityRequest, BatchDeleteRequest
 from .response_utils import success_response, error_response
 from .evaluator import PerformanceEvaluator
-from .utils import TEMP_DIR
-from .config import UPLOAD_DIR, init_config
+from .utils import TEMP_DIR, audio_rendition_path
+from .config import RENDER_MODE, init_config
+from .artifact_cache import ensure_artifacts, ensure_note_index
+from .score_store import lock_blob, save_upload_to_tmp, store_score_blob
+from . import chunked_upload
+from .reference_features import REFERENCE_FEATURE_VERSION, get_feature_version, reference_features_path
+from .note_index import NOTE_INDEX_VERSION, note_index_path
+from .score_metadata import copy_metadata
+from .pagination import keyset_page
+from .library_search import search_library
+from . import library_cache
+from . import file_reclaimer
+from .query_metrics import QueryMetricsMiddleware, get_query_metrics
 
 # 初始化配置
 init_config()
@@ -39,6 +57,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(QueryMetricsMiddleware)
+
+
+@app.on_event("startup")
+def resume_preprocess_jobs():
+    # 重启前未完成的预处理任务重新入队
+    count = requeue_pending_jobs()
+    if count:
+        print(f"Requeued {count} pending preprocess jobs")
+
+    # 清理过期的分块上传
+    removed = chunked_upload.cleanup_expired_uploads()
+    if removed:
+        print(f"Removed {removed} expired chunked uploads")
+
+
+@app.on_event("startup")
+async def start_background_cleanup():
+    # 运行期间放弃的分块上传也会按有效期清理
+    asyncio.create_task(chunked_upload.run_periodic_cleanup())
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    shutdown_executor()
+    # 等待已删除记录的文件回收完成
+    await file_reclaimer.drain(timeout=10)
 
 
 # ================== API ==================
@@ -47,35 +92,96 @@ async def root():
     return {"message": "Hello Cloud"}
 
 @app.get("/cloud/auth/validate-token")
-def validate_token(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def validate_token(user: TokenUser = Depends(get_token_user)):
     try:
-        # 直接使用 user 对象
-        roles = [role.name for role in user.roles]
-        permissions = [
-            perm.name
-            for role in user.roles
-            for perm in role.permissions
-        ]
-
+        # 角色和权限直接来自令牌 claims
         return success_response(
             data={
                 "userId": user.id,
                 "username": user.name,
-                "roles": roles,
-                "permissions": permissions,
+                "roles": list(user.roles),
+                "permissions": list(user.permissions),
             },
             message="Token is valid",
         )
     except Exception as e:
         return error_response(message=f"Token validation failed: {str(e)}", status_code=401)
     
+async def create_uploaded_file(
+    db: AsyncSession,
+    file_id: str,
+    filename: str,
+    file_path: Path,
+    content_hash: str,
+    user: TokenUser,
+    is_public: bool,
+) -> UploadedFile:
+    """
+    保存文件信息到数据库，需要的话提交预处理任务
+    如果相同内容的乐谱已经预处理完成，直接复用其 MIDI 、音频和元数据，否则在预处理完成后回填
+    相同内容的乐谱正在排队或渲染时不重复渲染，由该任务完成后一并回填
+    延迟渲染模式下不提交预处理任务，只提取元数据
+    调用方需持有该内容的锁（lock_blob），预处理任务回填时也会获取同一把锁
+    """
+    rendered = await db.scalar(
+        select(UploadedFile)
+        .where(
+            UploadedFile.content_hash == content_hash,
+            UploadedFile.processing_state == ProcessingState.DONE.value,
+        )
+        .limit(1)
+    )
+    pending = None
+    if not rendered:
+        pending = await db.scalar(
+            select(UploadedFile.id)
+            .where(
+                UploadedFile.content_hash == content_hash,
+                UploadedFile.processing_state.in_(PENDING_STATES),
+            )
+            .limit(1)
+        )
+    uploaded_file = UploadedFile(
+        id=file_id,
+        filename=filename,
+        filepath=str(file_path),
+        content_hash=content_hash,
+        user_id=user.id,  # 使用当前用户的 ID
+        is_public=is_public,
+        created_by=user.name,
+        updated_by=user.name,
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+    if rendered:
+        uploaded_file.midi_path = rendered.midi_path
+        uploaded_file.audio_path = rendered.audio_path
+        uploaded_file.processing_state = ProcessingState.DONE.value
+    elif RENDER_MODE == "lazy" and not pending:
+        # 首次请求 MIDI / 音频时再渲染
+        uploaded_file.processing_state = ProcessingState.DEFERRED.value
+    else:
+        uploaded_file.processing_state = ProcessingState.QUEUED.value
+    has_metadata = copy_metadata(rendered, uploaded_file)
+
+    db.add(uploaded_file)
+    await db.commit()
+    if uploaded_file.processing_state == ProcessingState.QUEUED.value:
+        if not pending:
+            # 预处理交给后台进程池，不阻塞请求；任务会顺带提取元数据
+            submit_preprocess(file_id, str(file_path))
+    elif not has_metadata:
+        submit_metadata(file_id, str(file_path))
+    return uploaded_file
+
+
 # 文件上传接口
 @app.post("/cloud/upload")
 async def upload_file(
     file: UploadFile = File(...),
     is_public: bool = Form(False),
-    user: User = Depends(get_current_user),  # 获取当前用户对象
-    db: Session = Depends(get_db),
+    user: TokenUser = Depends(get_token_user),  # 令牌中的用户身份
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     文件上传接口
@@ -83,50 +189,172 @@ async def upload_file(
     try:
         file_id = str(uuid.uuid4())[:8]
         
-        # 使用配置文件中的上传目录
-        file_path = UPLOAD_DIR / f"{file_id}_{file.filename}"
-        with open(str(file_path), "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 调用预处理函数
-        score_midi_path, score_audio_path = preprocess_score(file_path)
-
-        # 统一处理所有路径
-        file_path = str(file_path)
-        score_midi_path = str(Path(score_midi_path))
-        score_audio_path = str(Path(score_audio_path))
-
-        # 保存文件信息到数据库
-        uploaded_file = UploadedFile(
-            id=file_id,
-            filename=file.filename,
-            filepath=file_path,
-            midi_path=score_midi_path,  # 保存 MIDI 路径
-            audio_path=score_audio_path,  # 保存音频路径
-            user_id=user.id,  # 使用当前用户的 ID
-            is_public=is_public,
-            created_by=user.name,
-            updated_by=user.name,
-            created_at=datetime.now(),
-            updated_at=datetime.now(),
-        )
-        db.add(uploaded_file)
-        db.commit()
+        # 先写入临时文件，同时计算规范化内容哈希（在线程池中执行，不阻塞事件循环）
+        tmp_path, content_hash = await run_in_threadpool(save_upload_to_tmp, file.file, file.filename)
+
+        # 相同内容的乐谱只保存一份；提交记录之前持有该内容的锁，blob 不会被回收
+        await db.execute(lock_blob(content_hash))
+        file_path = await run_in_threadpool(store_score_blob, tmp_path, content_hash, file.filename)
+
+        uploaded_file = await create_uploaded_file(db, file_id, file.filename, file_path, content_hash, user, is_public)
+        if is_public:
+            await library_cache.invalidate_library()
 
         return success_response(
-            data={"file_id": file_id},
-            message="File uploaded and preprocessed successfully",
+            data={"file_id": file_id, "processing_state": uploaded_file.processing_state},
+            message="File uploaded successfully",
         )
     except Exception as e:
         return error_response(message=f"Failed to upload file: {str(e)}", status_code=500)
 
 
+# 分块上传接口：init -> PUT chunk (offset) -> finalize，断线后可通过查询接口获取进度继续上传
+@app.post("/cloud/upload/chunked/init")
+def init_chunked_upload(request: ChunkedUploadInitRequest, user: TokenUser = Depends(get_token_user)):
+    """
+    创建分块上传会话
+    """
+    try:
+        state = chunked_upload.init_upload(user.id, request.filename, request.total_size, request.is_public)
+        return success_response(
+            data={
+                "upload_id": state["upload_id"],
+                "received": state["received"],
+                "max_chunk_size": chunked_upload.MAX_CHUNK_SIZE,
+                "max_upload_size": chunked_upload.MAX_UPLOAD_SIZE,
+            },
+            message="Chunked upload created",
+        )
+    except HTTPException as e:
+        return error_response(message=e.detail, status_code=e.status_code)
+    except Exception as e:
+        return error_response(message=f"Failed to create chunked upload: {str(e)}", status_code=500)
+
+
+@app.get("/cloud/upload/chunked/{upload_id}")
+def get_chunked_upload(upload_id: str, user: TokenUser = Depends(get_token_user)):
+    """
+    查询分块上传进度
+    """
+    try:
+        state = chunked_upload.get_upload(upload_id, user.id)
+        return success_response(
+            data={
+                "upload_id": upload_id,
+                "received": state["received"],
+                "total_size": state["total_size"],
+            },
+            message="fetch chunked upload successfully.",
+        )
+    except HTTPException as e:
+        return error_response(message=e.detail, status_code=e.status_code)
+    except Exception as e:
+        return error_response(message=f"Failed to fetch chunked upload: {str(e)}", status_code=500)
+
+
+@app.put("/cloud/upload/chunked/{upload_id}")
+async def put_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    user: TokenUser = Depends(get_token_user),
+):
+    """
+    上传一个分块，请求体为分块的原始字节
+    """
+    try:
+        data = await chunked_upload.read_chunk(request)
+        state = await chunked_upload.write_chunk(upload_id, user.id, offset, data)
+        return success_response(
+            data={"upload_id": upload_id, "received": state["received"]},
+            message="Chunk received",
+        )
+    except HTTPException as e:
+        return error_response(message=e.detail, status_code=e.status_code)
+    except Exception as e:
+        return error_response(message=f"Failed to upload chunk: {str(e)}", status_code=500)
+
+
+@app.post("/cloud/upload/chunked/{upload_id}/finalize")
+async def finalize_chunked_upload(
+    upload_id: str,
+    user: TokenUser = Depends(get_token_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    完成分块上传，之后的处理与普通上传相同
+    """
+    try:
+        data_path, content_hash, state = await chunked_upload.finalize_upload(upload_id, user.id)
+        filename = state["filename"]
+        # 提交记录之前持有该内容的锁，blob 不会被回收
+        await db.execute(lock_blob(content_hash))
+        file_path = await run_in_threadpool(store_score_blob, data_path, content_hash, filename)
+
+        file_id = str(uuid.uuid4())[:8]
+        uploaded_file = await create_uploaded_file(db, file_id, filename, file_path, content_hash, user, state["is_public"])
+        if state["is_public"]:
+            await library_cache.invalidate_library()
+
+        return success_response(
+            data={"file_id": file_id, "processing_state": uploaded_file.processing_state},
+            message="File uploaded successfully",
+        )
+    except HTTPException as e:
+        return error_response(message=e.detail, status_code=e.status_code)
+    except Exception as e:
+        return error_response(message=f"Failed to finalize upload: {str(e)}", status_code=500)
+
+
+# 预处理状态查询接口
+@app.get("/cloud/upload/{file_id}/status")
+async def get_processing_state(file_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    查询文件预处理状态：queued / rendering / done / failed
+    """
+    try:
+        uploaded_file = await db.get(UploadedFile, file_id)
+        if not uploaded_file:
+            return error_response(message="File not found", status_code=404)
+
+        return success_response(
+            data={
+                "file_id": uploaded_file.id,
+                "processing_state": uploaded_file.processing_state,
+                "error": uploaded_file.processing_error,
+            },
+            message="fetch processing state successfully.",
+        )
+    except Exception as e:
+        return error_response(message=f"Failed to fetch processing state: {str(e)}", status_code=500)
+
+
+async def find_uploaded_file(db: AsyncSession, file_id: str) -> Optional[UploadedFile]:
+    """
+    查询文件记录后立即归还连接：按需渲染和文件下载可能持续很久，期间不占用连接池
+    """
+    uploaded_file = await db.get(UploadedFile, file_id)
+    await db.close()
+    return uploaded_file
+
+
+def is_processed(uploaded_file: UploadedFile) -> bool:
+    """
+    MIDI 和音频文件是否可用（已生成，或可以在请求时渲染）
+    被缓存淘汰的产物由 ensure_artifacts 重新渲染
+    """
+    return uploaded_file.processing_state in (
+        ProcessingState.DONE.value,
+        ProcessingState.DEFERRED.value,
+    )
+
+
 # 公开文件接口
 @app.post("/cloud/publish/{file_id}")
-def publish_file(file_id: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def publish_file(file_id: str, user: TokenUser = Depends(get_token_user), db: AsyncSession = Depends(get_async_db)):
     try:
         # 检查文件是否存在
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        uploaded_file = await db.get(UploadedFile, file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
 
@@ -138,41 +366,61 @@ def publish_file(file_id: str, user: User = Depends(get_current_user), db: Sessi
         uploaded_file.is_public = True
         uploaded_file.updated_by = user.id
         uploaded_file.updated_at = datetime.now()
-        db.commit()
+        await db.commit()
+        await library_cache.invalidate_library()
 
         return success_response(data={}, message="File published successfully")
     except Exception as e:
         return error_response(message=f"Failed to publish file: {str(e)}", status_code=500)
 
 
+async def list_files(
+    db: AsyncSession,
+    where: list,
+    page: Optional[int],
+    page_size: int,
+    cursor: Optional[str],
+    total: str,
+) -> tuple[list[UploadedFile], dict]:
+    """
+    曲目列表分页：默认使用 (created_at, id) 游标分页；
+    指定 page 时沿用 OFFSET 分页和精确总数，兼容旧客户端
+    """
+    if page is None:
+        return await keyset_page(db, where, page_size, cursor, total)
+
+    count = await db.scalar(select(func.count()).select_from(UploadedFile).where(*where)) or 0
+    stmt = (
+        select(UploadedFile)
+        .where(*where)
+        .order_by(UploadedFile.created_at.desc(), UploadedFile.id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    files = list((await db.execute(stmt)).scalars())
+    pagination = {
+        "total": count,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (count + page_size - 1) // page_size if count > 0 else 1
+    }
+    return files, pagination
+
+
 # 曲目库浏览接口，所有曲目
 @app.get("/cloud/library")
 async def get_library(
-    page: int = Query(1, ge=1),
+    page: Optional[int] = Query(None, ge=1, description="旧的页码分页，深分页较慢"),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    total: str = Query("none", regex="^(none|exact|estimate)$"),
     db: AsyncSession = Depends(get_async_db)
 ):
     """
-    获取公开乐谱库，支持分页
+    获取公开乐谱库，支持游标分页；所有访客看到的内容相同，结果经过缓存
     """
-    try:
-        # 查询公开文件总数
-        stmt = select(func.count()).select_from(UploadedFile).where(UploadedFile.is_public == True)
-        total = await db.scalar(stmt)
-        if total is None:
-            total = 0
-        
-        # 分页查询文件
-        stmt = (
-            select(UploadedFile)
-            .where(UploadedFile.is_public == True)
-            .order_by(UploadedFile.created_at.desc())
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-        )
-        result = await db.execute(stmt)
-        files = result.scalars().all()
-        
+    async def load_page() -> dict:
+        files, pagination = await list_files(db, [UploadedFile.is_public == True], page, page_size, cursor, total)
         data = [
             {
                 "id": f.id,
@@ -183,47 +431,92 @@ async def get_library(
             }
             for f in files
         ]
-        
-        pagination = {
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size if total > 0 else 1
-        }
-        
-        return success_response(data=data, pagination=pagination, message="fetch library successfully.")
+        return {"data": data, "pagination": pagination}
+
+    try:
+        result = await library_cache.read_through(("library", page, page_size, cursor, total), load_page)
+        return success_response(data=result["data"], pagination=result["pagination"], message="fetch library successfully.")
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
     except Exception as e:
         return error_response(message=f"Failed to fetch library: {str(e)}", status_code=500)
 
 
+def score_metadata_data(f: UploadedFile) -> dict:
+    return {
+        "title": f.title,
+        "composer": f.composer,
+        "parts": f.part_names,
+        "part_count": f.part_count,
+        "key_signature": f.key_signature,
+        "time_signature": f.time_signature,
+        "measure_count": f.measure_count,
+        "note_count": f.note_count,
+        "duration_seconds": f.duration_seconds,
+    }
+
+
+# 曲目库搜索接口
+@app.get("/cloud/library/search")
+async def search_public_library(
+    q: Optional[str] = Query(None, max_length=200, description="标题、作曲家、声部或文件名"),
+    composer: Optional[str] = Query(None, max_length=200),
+    key: Optional[str] = Query(None, max_length=8, description="调号，如 C、F#、Am"),
+    time_signature: Optional[str] = Query(None, max_length=8, description="拍号，如 4/4"),
+    parts: Optional[int] = Query(None, ge=1, description="声部数"),
+    min_duration: Optional[float] = Query(None, ge=0, description="最短时长（秒）"),
+    max_duration: Optional[float] = Query(None, ge=0, description="最长时长（秒）"),
+    min_notes: Optional[int] = Query(None, ge=0),
+    max_notes: Optional[int] = Query(None, ge=0),
+    sort: str = Query("relevance", regex="^(relevance|newest|title|composer|duration|notes)$"),
+    order: Optional[str] = Query(None, regex="^(asc|desc)$"),
+    page: int = Query(1, ge=1, le=100, description="搜索结果只提供前 100 页"),
+    page_size: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    按乐谱元数据搜索公开曲目库，只查询数据库索引
+    """
+    try:
+        files, pagination = await search_library(
+            db, page, page_size,
+            q=q, composer=composer, key=key, time_signature=time_signature, parts=parts,
+            min_duration=min_duration, max_duration=max_duration, min_notes=min_notes, max_notes=max_notes,
+            sort=sort, order=order,
+        )
+        data = [
+            {
+                "id": f.id,
+                "filename": f.filename,
+                "user_id": f.user_id,
+                "username": f.created_by if f.created_by else None,
+                "created_at": f.created_at.isoformat() if f.created_at else None,
+                **score_metadata_data(f),
+            }
+            for f in files
+        ]
+        return success_response(data=data, pagination=pagination, message="search library successfully.")
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    except Exception as e:
+        return error_response(message=f"Failed to search library: {str(e)}", status_code=500)
+
+
 # 我的曲谱接口
 @app.get("/cloud/my-library")
 async def get_my_library(
-    current_user: User = Depends(get_current_user),
-    page: int = Query(1, ge=1),
+    current_user: TokenUser = Depends(get_token_user),
+    page: Optional[int] = Query(None, ge=1, description="旧的页码分页，深分页较慢"),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    total: str = Query("none", regex="^(none|exact|estimate)$"),
     db: AsyncSession = Depends(get_async_db)
 ):
     """
-    获取用户的乐谱库，支持分页
+    获取用户的乐谱库，支持游标分页
     """
     try:
-        # 查询用户文件总数
-        stmt = select(func.count()).select_from(UploadedFile).where(UploadedFile.user_id == current_user.id)
-        total = await db.scalar(stmt)
-        if total is None:
-            total = 0
-        
-        # 分页查询文件
-        stmt = (
-            select(UploadedFile)
-            .where(UploadedFile.user_id == current_user.id)
-            .order_by(UploadedFile.created_at.desc())
-            .offset((page - 1) * page_size)
-            .limit(page_size)
-        )
-        result = await db.execute(stmt)
-        files = result.scalars().all()
+        files, pagination = await list_files(db, [UploadedFile.user_id == current_user.id], page, page_size, cursor, total)
         
         data = [
             {
@@ -235,89 +528,140 @@ async def get_my_library(
             for f in files
         ]
         
-        pagination = {
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size if total > 0 else 1
-        }
-        
         return success_response(data=data, pagination=pagination, message="fetch my library successfully.")
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
     except Exception as e:
         return error_response(message=f"Failed to fetch my library: {str(e)}", status_code=500)
 
 
+def build_practice_manifest(request: Request, uploaded_file: UploadedFile) -> dict:
+    """
+    练习清单：各文件的 URL、大小和缓存校验信息，客户端按需下载并利用 HTTP 缓存
+    """
+    def entry(endpoint: str, path: Path, **query) -> dict:
+        url = str(request.url_for(endpoint, file_id=uploaded_file.id))
+        if query:
+            url += "?" + "&".join(f"{key}={value}" for key, value in query.items())
+        return {"url": url, **file_validators(path)}
+
+    # MIDI / 音频与乐谱同目录，延迟渲染的记录在请求时才回填路径
+    score_path = Path(uploaded_file.filepath)
+    audio_path = score_path.with_suffix(".wav")
+    files = {
+        "score": entry("get_score_file_by_id", score_path),
+        "midi": entry("get_midi_file_by_id", score_path.with_suffix(".mid")),
+        "audio": {
+            # 不带 format 参数时按 Accept 头协商
+            "url": str(request.url_for("get_audio_file_by_id", file_id=uploaded_file.id)),
+            "formats": {
+                audio_format.value: entry(
+                    "get_audio_file_by_id",
+                    audio_rendition_path(audio_path, audio_format),
+                    format=audio_format.value,
+                )
+                for audio_format in AudioFormat
+                if audio_rendition_path(audio_path, audio_format).exists()
+            },
+        },
+    }
+    features_path = reference_features_path(score_path)
+    if features_path.exists():
+        files["features"] = entry("get_features_file_by_id", features_path, version=REFERENCE_FEATURE_VERSION)
+    index_path = note_index_path(score_path)
+    if index_path.exists():
+        files["note_index"] = entry("get_note_index_by_id", index_path, version=NOTE_INDEX_VERSION)
+
+    return {
+        "file_info": {
+            "id": uploaded_file.id,
+            "filename": uploaded_file.filename,
+            "created_at": uploaded_file.created_at,
+        },
+        "content_hash": uploaded_file.content_hash,
+        "files": files,
+    }
+
+
+# 练习清单接口
+@app.get("/cloud/practice/{file_id}/manifest")
+async def get_practice_manifest(file_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    获取练习所需文件的清单，不返回文件内容
+    """
+    try:
+        uploaded_file = await find_uploaded_file(db, file_id)
+        if not uploaded_file:
+            return error_response(message="File not found", status_code=404)
+        if not is_processed(uploaded_file):
+            return error_response(
+                message=f"File is not ready for practice: {uploaded_file.processing_state}",
+                status_code=409,
+            )
+
+        await ensure_artifacts(Path(uploaded_file.filepath))
+        return success_response(
+            data=build_practice_manifest(request, uploaded_file),
+            message="Practice manifest fetched successfully",
+        )
+    except Exception as e:
+        return error_response(message=f"Failed to fetch practice manifest: {str(e)}", status_code=500)
+
+
 # 选择曲目进行跟音练习
 @app.post("/cloud/practice/{file_id}")
-def practice(file_id: str, db: Session = Depends(get_db)):
+async def practice(file_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    返回练习清单，同时保留 use_url / *_url 字段兼容旧客户端
+    文件内容不再内联为 Base64，由客户端通过 URL 获取
+    """
     try:
         # 检查文件是否存在
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        uploaded_file = await find_uploaded_file(db, file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
-
-        # 读取文件路径
-        file_path = Path(uploaded_file.filepath)
-        midi_path = Path(uploaded_file.midi_path)
-        audio_path = Path(uploaded_file.audio_path)
-
-        # 检查文件大小
-        file_size_mb = file_path.stat().st_size / (1024 * 1024)
-        midi_size_mb = midi_path.stat().st_size / (1024 * 1024)
-        audio_size_mb = audio_path.stat().st_size / (1024 * 1024)
-
-        # 如果任意文件大于 5MB，返回 URL 和标志
-        if file_size_mb > 5 or midi_size_mb > 5 or audio_size_mb > 5:
-            return success_response(
-                data={
-                    "file_info": {
-                        "id": uploaded_file.id,
-                        "filename": uploaded_file.filename,
-                        "created_at": uploaded_file.created_at,
-                    },
-                    "use_url": True,
-                    "file_url": uploaded_file.filepath,
-                    "midi_url": uploaded_file.midi_path,
-                    "audio_url": uploaded_file.audio_path,
-                },
-                message="Large file, returning URLs",
+        if not is_processed(uploaded_file):
+            return error_response(
+                message=f"File is not ready for practice: {uploaded_file.processing_state}",
+                status_code=409,
             )
 
-        # 如果文件较小，返回 Base64 编码的内容
-        with open(file_path, "r", encoding="utf-8") as file:
-            file_content = base64.b64encode(file.read().encode("utf-8")).decode("utf-8")
-
-        with open(midi_path, "rb") as midi_file:
-            midi_content = base64.b64encode(midi_file.read()).decode("utf-8")
-
-        with open(audio_path, "rb") as audio_file:
-            audio_content = base64.b64encode(audio_file.read()).decode("utf-8")
-
+        await ensure_artifacts(Path(uploaded_file.filepath))
+        manifest = build_practice_manifest(request, uploaded_file)
+        files = manifest["files"]
         return success_response(
             data={
-                "file_info": {
-                    "id": uploaded_file.id,
-                    "filename": uploaded_file.filename,
-                    "created_at": uploaded_file.created_at,
-                },
-                "use_url": False,
-                "file_content": file_content,
-                "midi_content": midi_content,
-                "audio_content": audio_content,
+                **manifest,
+                "use_url": True,
+                "file_url": files["score"]["url"],
+                "midi_url": files["midi"]["url"],
+                "audio_url": files["audio"]["url"],
             },
             message="Practice data fetched successfully",
         )
     except Exception as e:
         return error_response(message=f"Failed to start practice: {str(e)}", status_code=500)
 
+def hashing_busy_response() -> JSONResponse:
+    """
+    密码哈希线程池已满时返回 429，客户端稍后重试
+    """
+    return JSONResponse(
+        status_code=429,
+        content=error_response(message="Too many authentication requests, please retry later", status_code=429),
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.post("/cloud/register")
-def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
+async def register_user(request: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        existing_user = db.query(User).filter(User.email == request.email).first()
+        existing_user = await db.scalar(select(User).where(User.email == request.email).limit(1))
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
 
-        hashed_password = hash_password(request.password)
+        # bcrypt 计算耗时，放到专用的哈希线程池中执行
+        hashed_password = await hash_password_async(request.password)
         new_user = User(
             email=request.email,
             name=request.username,
@@ -325,130 +669,164 @@ def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
             created_by=request.username,
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
 
         # 分配默认角色
-        default_role = db.query(Role).filter(Role.name == "user").first()
+        default_role = await db.scalar(select(Role).where(Role.name == "user"))
         if not default_role:
             raise HTTPException(status_code=500, detail="Default role 'user' not found")
         user_role = UserRole(user_id=new_user.id, role_id=default_role.id)
         db.add(user_role)
-        db.commit()
+        await db.commit()
 
         return success_response(
             data={"user_id": new_user.id},
             message="User registered successfully",
         )
+    except PasswordHashingBusy:
+        return hashing_busy_response()
     except Exception as e:
         return error_response(message=f"Failed to register user: {str(e)}", status_code=500)
 
 @app.post("/cloud/login")
-def login_user(request: LoginRequest, db: Session = Depends(get_db)):
+async def login_user(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        user = db.query(User).filter(User.email == request.email).first()
-        if not user or not verify_password(request.password, user.hashed_password):
+        user = await db.scalar(select(User).where(User.email == request.email).limit(1))
+        if not user:
             return error_response(message="Invalid email or password", status_code=401)
+        verified, new_hash = await verify_password_async(request.password, user.hashed_password)
+        if not verified:
+            return error_response(message="Invalid email or password", status_code=401)
+        if new_hash:
+            # BCRYPT_ROUNDS 变化后，用已验证的明文按新轮数重新哈希
+            user.hashed_password = new_hash
+            await db.commit()
 
-        # 获取用户角色和权限
-        roles = db.query(Role).join(UserRole).filter(UserRole.user_id == user.id).all()
-        permissions = db.query(Permission).join(RolePermission).join(Role).filter(Role.id.in_([role.id for role in roles])).all()
-
-        # 生成身份令牌
-        token = create_token({"sub": user.id})
+        # 获取用户角色和权限，写入令牌 claims
+        roles = await load_role_names(user.id, db)
+        permissions = list(await load_permissions(user.id, db))
+        token = create_user_token(user.id, user.name, roles, permissions, user.token_version)
 
         return success_response(
             data={
                 "user_id": user.id,
                 "username": user.name,
-                "roles": [role.name for role in roles],
-                "permissions": [permission.name for permission in permissions],
+                "roles": roles,
+                "permissions": permissions,
                 "token": token,
             },
             message="Login successful",
         )
+    except PasswordHashingBusy:
+        return hashing_busy_response()
     except Exception as e:
         return error_response(message=f"Failed to login: {str(e)}", status_code=500)
 
 
 @app.post("/cloud/change-password")
-def change_password(request: ChangePasswordRequest, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def change_password(request: ChangePasswordRequest, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     修改密码接口
     """
     try:
-        # 查找当前用户
-        user = db.query(User).filter(User.id == user.id).first()
-        if not user or not verify_password(request.old_password, user.hashed_password):
+        # get_current_user 与本接口共用会话，user 可以直接修改
+        verified, _ = await verify_password_async(request.old_password, user.hashed_password)
+        if not verified:
             return error_response(message="Invalid old password", status_code=401)
 
-        # 更新密码
-        user.hashed_password = hash_password(request.new_password)
-        db.commit()
+        # 更新密码，之前签发的令牌全部失效
+        user.hashed_password = await hash_password_async(request.new_password)
+        token_version = await revoke_user_tokens(user.id, db)
+
+        # 返回新令牌，当前客户端无需重新登录
+        roles = await load_role_names(user.id, db)
+        token = create_user_token(user.id, user.name, roles, list(await load_permissions(user.id, db)), token_version)
 
-        return success_response(data={}, message="Password changed successfully")
+        return success_response(data={"token": token}, message="Password changed successfully")
+    except PasswordHashingBusy:
+        return hashing_busy_response()
     except Exception as e:
         return error_response(message=f"Failed to change password: {str(e)}", status_code=500)
 
 @app.post("/cloud/manage-permission/{user_id}")
-def manage_permission(user_id: str, request: ManagePermissionRequest, current_user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
+async def manage_permission(user_id: str, request: ManagePermissionRequest, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     管理权限接口
     """
     try:
         # 检查当前用户是否有管理权限
-        if not has_permission(current_user_id, "manage_users", db):
+        if not await has_permission(current_user.id, "manage_users", db):
             raise HTTPException(status_code=403, detail="Permission denied")
 
         # 查找目标用户
-        target_user = db.query(User).filter(User.id == user_id).first()
+        target_user = await db.get(User, user_id)
         if not target_user:
             raise HTTPException(status_code=404, detail="User not found")
 
         # 更新用户角色
-        new_role = db.query(Role).filter(Role.id == request.new_permission_level).first()
+        new_role = await db.get(Role, request.new_permission_level)
         if not new_role:
             raise HTTPException(status_code=404, detail="Role not found")
 
         # 删除旧角色并分配新角色
-        db.query(UserRole).filter(UserRole.user_id == user_id).delete()
+        await db.execute(delete(UserRole).where(UserRole.user_id == user_id))
         user_role = UserRole(user_id=user_id, role_id=new_role.id)
         db.add(user_role)
-        db.commit()
+        # 角色变化后旧令牌中的 claims 已过期，需要重新登录
+        await revoke_user_tokens(user_id, db)
+        invalidate_permissions(user_id)
 
         return {"message": f"User {user_id}'s role updated to {new_role.name}"}
     except Exception as e:
         return error_response(message=f"Failed to manage permission: {str(e)}", status_code=500)
     
 
+# 查询统计接口
+@app.get("/cloud/metrics/queries")
+async def get_query_metrics_endpoint(
+    reset: bool = Query(False, description="返回后清空统计，便于观察一段时间内的数据"),
+    user: TokenUser = Depends(get_token_user),
+):
+    """
+    各接口的查询次数、数据库耗时、最慢语句和疑似 N+1 次数，按数据库总耗时降序
+    """
+    if "manage_users" not in user.permissions:
+        return error_response(message="Permission denied", status_code=403)
+    return success_response(data=get_query_metrics(reset), message="fetch query metrics successfully.")
+
+
 @app.put("/cloud/update-visibility")
-def update_visibility(
+async def update_visibility(
     request: UpdateVisibilityRequest, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     更新文件的公开状态
     """
     try:
         # 查找文件
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == request.file_id).first()
+        uploaded_file = await db.get(UploadedFile, request.file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
         
 
         # 检查权限：用户是否有管理权限或是文件的上传者
-        if not (has_permission(current_user.id, "delete_file", db) or uploaded_file.user_id == current_user.id):
+        if not (uploaded_file.user_id == current_user.id or await has_permission(current_user.id, "delete_file", db)):
             print(f"Permission denied.")
             raise HTTPException(status_code=403, detail="Permission denied")
         
 
         # 更新文件的公开状态
+        visibility_changed = bool(uploaded_file.is_public) != request.is_public
         uploaded_file.is_public = request.is_public
         uploaded_file.updated_by = current_user.id
         uploaded_file.updated_at = func.now()
         
-        db.commit()
+        await db.commit()
+        if visibility_changed:
+            await library_cache.invalidate_library()
         print("Successfully updated file visibility")
 
         return success_response(data={}, message="File visibility updated successfully")
@@ -473,102 +851,195 @@ def get_file(file_path: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def download_filename(uploaded_file: UploadedFile, file_path: Path) -> str:
+    """
+    下载文件名使用用户上传时的文件名，存储路径可能是共享的内容寻址路径
+    """
+    return f"{Path(uploaded_file.filename).stem}{file_path.suffix}"
+
+
 @app.get("/cloud/get-score-file-by-id/{file_id}")
-def get_score_file_by_id(file_id: str, db: Session = Depends(get_db)):
+async def get_score_file_by_id(file_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     获取乐谱文件接口
     """
     try:
         # 查找文件
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        uploaded_file = await find_uploaded_file(db, file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
         
         # 返回文件内容
         file_path = Path(uploaded_file.filepath)
-        return FileResponse(file_path, filename=file_path.name)
+        return serve_file(request, file_path, filename=download_filename(uploaded_file, file_path))
     except Exception as e:
         return error_response(message=f"Failed to get score file: {str(e)}", status_code=500)
 
 
 @app.get("/cloud/get-audio-file-by-id/{file_id}")
-def get_audio_file_by_id(file_id: str, db: Session = Depends(get_db)):
+async def get_audio_file_by_id(
+    file_id: str,
+    request: Request,
+    format: Optional[str] = Query(None, description="wav / flac / ogg，不指定时按 Accept 头协商"),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    获取演奏文件接口
+    获取演奏文件接口，支持格式协商和 Range 请求
     """
     try:
         # 查找文件
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        uploaded_file = await find_uploaded_file(db, file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
+        if not is_processed(uploaded_file):
+            return error_response(
+                message=f"File is not ready: {uploaded_file.processing_state}",
+                status_code=409,
+            )
         
         # 返回文件内容
-        file_path = Path(uploaded_file.audio_path)
-        return FileResponse(file_path, filename=file_path.name)
+        score_path = Path(uploaded_file.filepath)
+        await ensure_artifacts(score_path)
+        wav_path = score_path.with_suffix(".wav")
+        available = [
+            audio_format
+            for audio_format in AudioFormat
+            if audio_rendition_path(wav_path, audio_format).exists()
+        ]
+        try:
+            audio_format = negotiate_audio_format(format, request.headers.get("accept"), available)
+        except ValueError as e:
+            return error_response(message=str(e), status_code=406)
+
+        file_path = audio_rendition_path(wav_path, audio_format)
+        response = serve_file(
+            request,
+            file_path,
+            media_type=AUDIO_MEDIA_TYPES[audio_format],
+            filename=download_filename(uploaded_file, file_path),
+        )
+        response.headers["Vary"] = "Accept"
+        return response
     except Exception as e:
         return error_response(message=f"Failed to get audio file: {str(e)}", status_code=500)
 
 
 @app.get("/cloud/get-midi-file-by-id/{file_id}")
-def get_midi_file_by_id(file_id: str, db: Session = Depends(get_db)):
+async def get_midi_file_by_id(file_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     获取MIDI文件接口
     """
     try:
         # 查找文件
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        uploaded_file = await find_uploaded_file(db, file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
+        if not is_processed(uploaded_file):
+            return error_response(
+                message=f"File is not ready: {uploaded_file.processing_state}",
+                status_code=409,
+            )
         
         # 返回文件内容
-        file_path = Path(uploaded_file.midi_path)
-        return FileResponse(file_path, filename=file_path.name)
+        score_path = Path(uploaded_file.filepath)
+        await ensure_artifacts(score_path)
+        file_path = score_path.with_suffix(".mid")
+        return serve_file(request, file_path, media_type="audio/midi", filename=download_filename(uploaded_file, file_path))
     except Exception as e:
         return error_response(message=f"Failed to get midi file: {str(e)}", status_code=500)
 
 
+@app.get("/cloud/get-features-file-by-id/{file_id}")
+async def get_features_file_by_id(
+    file_id: str,
+    request: Request,
+    version: str = Query(REFERENCE_FEATURE_VERSION),
+    fingerprint: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    获取预计算的参考特征文件（.npy），版本不匹配或尚未生成时返回 404
+    device-service 传入其 Matchmaker 的 fingerprint（JSON），版本号由本服务的 get_feature_version 换算
+    """
+    try:
+        if fingerprint is not None:
+            try:
+                version = get_feature_version(json.loads(fingerprint))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid fingerprint")
+        uploaded_file = await find_uploaded_file(db, file_id)
+        if not uploaded_file:
+            raise HTTPException(status_code=404, detail="File not found")
+
+        score_path = Path(uploaded_file.filepath)
+        if version == REFERENCE_FEATURE_VERSION and is_processed(uploaded_file):
+            await ensure_artifacts(score_path)
+        file_path = reference_features_path(score_path, version)
+        if not file_path.exists():
+            raise HTTPException(status_code=404, detail=f"Reference features {version} not found")
+        return serve_file(request, file_path, media_type="application/octet-stream", filename=download_filename(uploaded_file, file_path))
+    except HTTPException:
+        # device-service 依据 HTTP 状态码判断是否回退到本地计算
+        raise
+    except Exception as e:
+        return error_response(message=f"Failed to get features file: {str(e)}", status_code=500)
+
+
+@app.get("/cloud/get-note-index-by-id/{file_id}")
+async def get_note_index_by_id(
+    file_id: str,
+    request: Request,
+    version: str = Query(NOTE_INDEX_VERSION),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    获取音符索引（未压缩的 .npz，可直接内存映射），格式版本不匹配时返回 404
+    """
+    try:
+        uploaded_file = await find_uploaded_file(db, file_id)
+        if not uploaded_file:
+            raise HTTPException(status_code=404, detail="File not found")
+
+        score_path = Path(uploaded_file.filepath)
+        if version == NOTE_INDEX_VERSION:
+            await ensure_note_index(score_path)
+        file_path = note_index_path(score_path, version)
+        if not file_path.exists():
+            raise HTTPException(status_code=404, detail=f"Note index v{version} not found")
+        return serve_file(request, file_path, media_type="application/octet-stream", filename=download_filename(uploaded_file, file_path))
+    except HTTPException:
+        # device-service 依据 HTTP 状态码判断是否回退到乐谱遍历
+        raise
+    except Exception as e:
+        return error_response(message=f"Failed to get note index: {str(e)}", status_code=500)
+
+
 @app.delete("/cloud/delete/{file_id}")
-def delete_file(file_id: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_file(file_id: str, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     删除文件接口
     """
     try:
         # 查找文件
-        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        uploaded_file = await db.get(UploadedFile, file_id)
         if not uploaded_file:
             raise HTTPException(status_code=404, detail="File not found")
 
         # 检查权限：用户是否有删除权限或是文件的上传者
-        if not (has_permission(user.id, "delete_file", db) or uploaded_file.user_id == user.id):
+        if not (uploaded_file.user_id == user.id or await has_permission(user.id, "delete_file", db)):
             raise HTTPException(status_code=403, detail="Permission denied")
 
-        # 获取所有需要删除的文件路径
-        file_paths = [
-            Path(uploaded_file.filepath),  # 原始文件
-            Path(uploaded_file.midi_path),  # MIDI文件
-            Path(uploaded_file.audio_path)  # 音频文件
-        ]
-
-        # 记录要删除的文件路径
-        print(f"Attempting to delete files for file_id {file_id}:")
-        for file_path in file_paths:
-            print(f"  - {file_path} (exists: {file_path.exists()})")
-
-        # 删除所有相关文件
-        for file_path in file_paths:
-            try:
-                if file_path.exists():
-                    file_path.unlink()
-                    print(f"Successfully deleted file: {file_path}")
-                else:
-                    print(f"File does not exist: {file_path}")
-            except Exception as e:
-                print(f"Failed to delete file {file_path}: {str(e)}")
-                # 继续删除其他文件，不中断流程
-
-        # 删除数据库记录
-        db.delete(uploaded_file)
-        db.commit()
+        # 内容寻址存储的文件由多条记录共享，回收时没有记录引用才删除 blob；旧记录的文件直接删除
+        content_hash = uploaded_file.content_hash
+        file_paths = [] if content_hash else file_reclaimer.legacy_file_paths(uploaded_file)
+        was_public = bool(uploaded_file.is_public)
+
+        # 删除数据库记录，文件在后台回收
+        await db.delete(uploaded_file)
+        await db.commit()
+        if was_public:
+            await library_cache.invalidate_library()
+        file_reclaimer.schedule_reclaim([content_hash], file_paths)
         print(f"Successfully deleted database record for file_id {file_id}")
 
         return success_response(message="File deleted successfully")
@@ -577,9 +1048,99 @@ def delete_file(file_id: str, user: User = Depends(get_current_user), db: Sessio
         return error_response(message=f"Failed to delete file: {str(e)}", status_code=500)
 
 
+async def find_batch_files(db: AsyncSession, file_ids: list[str], user_id: str) -> tuple[list, list[str]]:
+    """
+    一次查询批量操作涉及的文件并检查权限：上传者本人或有 delete_file 权限，任何一个文件无权限时整批拒绝
+    返回找到的记录和不存在的文件 ID
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    rows = (await db.execute(
+        select(
+            UploadedFile.id,
+            UploadedFile.user_id,
+            UploadedFile.is_public,
+            UploadedFile.content_hash,
+            UploadedFile.filepath,
+            UploadedFile.midi_path,
+            UploadedFile.audio_path,
+        ).where(UploadedFile.id.in_(file_ids))
+    )).all()
+    others = [row.id for row in rows if row.user_id != user_id]
+    if others and not await has_permission(user_id, "delete_file", db):
+        raise HTTPException(status_code=403, detail=f"Permission denied for files: {', '.join(others)}")
+    found = {row.id for row in rows}
+    return rows, [file_id for file_id in file_ids if file_id not in found]
+
+
+# 批量修改公开状态接口
+@app.put("/cloud/batch/update-visibility")
+async def batch_update_visibility(
+    request: BatchUpdateVisibilityRequest,
+    user: TokenUser = Depends(get_token_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    在一个事务中修改多个文件的公开状态，不存在的文件 ID 在 not_found 中返回
+    """
+    try:
+        rows, not_found = await find_batch_files(db, request.file_ids, user.id)
+        changed = [row.id for row in rows if bool(row.is_public) != request.is_public]
+        if changed:
+            await db.execute(
+                update(UploadedFile)
+                .where(UploadedFile.id.in_(changed))
+                .values(is_public=request.is_public, updated_by=user.id, updated_at=func.now())
+            )
+            await db.commit()
+            await library_cache.invalidate_library()
+
+        return success_response(
+            data={"updated": changed, "not_found": not_found},
+            message="File visibility updated successfully",
+        )
+    except HTTPException as e:
+        return error_response(message=e.detail, status_code=e.status_code)
+    except Exception as e:
+        print(f"Error updating visibility: {str(e)}")
+        return error_response(message=f"Failed to update visibility: {str(e)}", status_code=500)
+
+
+# 批量删除接口
+@app.post("/cloud/batch/delete")
+async def batch_delete_files(
+    request: BatchDeleteRequest,
+    user: TokenUser = Depends(get_token_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    在一个事务中删除多个文件的记录，文件在后台回收，不存在的文件 ID 在 not_found 中返回
+    """
+    try:
+        rows, not_found = await find_batch_files(db, request.file_ids, user.id)
+        deleted = [row.id for row in rows]
+        if deleted:
+            await db.execute(delete(UploadedFile).where(UploadedFile.id.in_(deleted)))
+            await db.commit()
+            if any(row.is_public for row in rows):
+                await library_cache.invalidate_library()
+            file_reclaimer.schedule_reclaim(
+                [row.content_hash for row in rows],
+                [path for row in rows if not row.content_hash for path in file_reclaimer.legacy_file_paths(row)],
+            )
+
+        return success_response(
+            data={"deleted": deleted, "not_found": not_found},
+            message="Files deleted successfully",
+        )
+    except HTTPException as e:
+        return error_response(message=e.detail, status_code=e.status_code)
+    except Exception as e:
+        print(f"Error in batch_delete_files: {str(e)}")
+        return error_response(message=f"Failed to delete files: {str(e)}", status_code=500)
+
 
 @app.post("/local/evaluate")
-async def evaluate_performance(file_id: str, audio_data: UploadFile, user: User = Depends(get_current_user)):
+async def evaluate_performance(file_id: str, audio_data: UploadFile, user: TokenUser = Depends(get_token_user)):
     """
     评测用户的演奏表现
     """
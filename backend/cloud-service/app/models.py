@@ -1,8 +1,10 @@
 from app.db_base import Base
 import uuid
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, ForeignKey, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
+from app.common import ProcessingState
 
 class BaseModel(Base):
     __abstract__ = True  # 让这个类成为抽象类，不会创建对应的表
@@ -63,6 +65,7 @@ class User(BaseModel):
     email = Column(String, unique=False, index=True)  # 邮箱
     hashed_password = Column(String, nullable=False)  # 哈希密码
     is_latest = Column(Boolean, default=True)  # 是否是最新记录
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # 修改角色或密码时递增，使旧令牌失效
 
     # 多对多关系
     roles = relationship(
@@ -87,13 +90,52 @@ class UserRole(Base):
 
 class UploadedFile(BaseModel):
     __tablename__ = "uploaded_files"
+    __table_args__ = (
+        # 曲目库列表按 (created_at, id) 游标分页
+        Index("ix_uploaded_files_public_created", "is_public", "created_at", "id"),
+        Index("ix_uploaded_files_user_created", "user_id", "created_at", "id"),
+        # 曲目库搜索：全文索引按词匹配，三元组索引支持子串 / 模糊匹配
+        Index("ix_uploaded_files_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_uploaded_files_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_uploaded_files_composer_trgm", "composer", postgresql_using="gin", postgresql_ops={"composer": "gin_trgm_ops"}),
+        Index("ix_uploaded_files_filename_trgm", "filename", postgresql_using="gin", postgresql_ops={"filename": "gin_trgm_ops"}),
+    )
 
     filename = Column(String, nullable=False)  # 文件名
     filepath = Column(String, nullable=False)  # 文件路径 sorce file path
     midi_path = Column(String, nullable=True)  # 新增 MIDI 路径字段
     audio_path = Column(String, nullable=True)  # 新增音频路径字段
+    content_hash = Column(String, nullable=True, index=True)  # 规范化乐谱内容的 SHA-256，相同乐谱共享存储
     is_public = Column(Boolean, default=False)  # 是否公开
+    processing_state = Column(
+        String,
+        nullable=False,
+        default=ProcessingState.QUEUED.value,
+        server_default=ProcessingState.DONE.value,
+    )  # 预处理状态：queued / rendering / done / failed
+    processing_error = Column(String, nullable=True)  # 预处理失败原因
     user_id = Column(String, ForeignKey("users.id"), nullable=False)  # 上传者外键
+    # 列表游标按 (created_at, id) 比较，不能为空
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # 创建时间
+
+    # 乐谱元数据，解析乐谱时提取，未提取前为空
+    title = Column(String, nullable=True)  # 标题
+    composer = Column(String, nullable=True)  # 作曲家
+    part_names = Column(String, nullable=True)  # 声部名称，逗号分隔
+    part_count = Column(Integer, nullable=True, index=True)  # 声部数
+    key_signature = Column(String, nullable=True, index=True)  # 调号，如 C、F#、Am
+    time_signature = Column(String, nullable=True, index=True)  # 拍号，如 4/4
+    measure_count = Column(Integer, nullable=True)  # 小节数
+    note_count = Column(Integer, nullable=True, index=True)  # 音符数
+    duration_seconds = Column(Float, nullable=True, index=True)  # 参考音频时长（秒）
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(composer, '') || ' ' "
+            "|| coalesce(part_names, '') || ' ' || filename)",
+            persisted=True,
+        ),
+    ))  # 全文检索向量，由数据库根据以上列生成，查询记录时默认不加载
 
     # 关系
     user = relationship("User", back_populates="uploaded_files")  # 关联用户表
@@ -0,0 +1,137 @@
+import uuid
+
+import numpy as np
+
+from pathlib import Path
+from partitura.score import Score, merge_parts
+
+from app.score_cache import load_score_cached
+
+# 音符索引的格式版本，数组或字段变化时递增，旧版本的文件不会被误用
+NOTE_INDEX_VERSION = "2"
+
+# 按 (onset_quarter, pitch) 排序的音符数组
+NOTE_FIELDS = ("onset_beat", "onset_quarter", "duration_beat", "duration_quarter", "pitch", "measure", "part")
+# 按开始位置排序的小节数组
+MEASURE_FIELDS = ("measure_number", "measure_start_beat", "measure_start_quarter")
+# beat -> quarter 的分段线性映射的断点，按 beat 严格递增，用 np.interp 查找
+BEAT_MAP_FIELDS = ("beat_map_beat", "beat_map_quarter")
+
+
+def note_index_path(score_path: Path, version: str = NOTE_INDEX_VERSION) -> Path:
+    return score_path.with_name(f"{score_path.stem}.notes.v{version}.npz")
+
+
+def build_note_index(score: Score) -> dict[str, np.ndarray]:
+    """
+    Flatten a parsed score into sorted columnar arrays
+
+    Notes of every part are merged and sorted by onset, so the notes around a
+    score position are found with ``np.searchsorted``. Measure boundaries
+    come from the first part; ``measure`` of a note is the number of the
+    measure of its own part that contains its onset.
+
+    ``beat_map_beat`` / ``beat_map_quarter`` hold the beat and quarter
+    position of every time point of the merged part (the part the follower
+    reports beats in). Both maps are linear between time points, so
+    ``np.interp`` over these arrays gives exactly
+    ``quarter_map(inv_beat_map(beat))``.
+
+    Parameters
+    ----------
+    score : Score
+        The parsed score
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        One array per name in ``NOTE_FIELDS``, ``MEASURE_FIELDS`` and
+        ``BEAT_MAP_FIELDS``
+    """
+    columns = {field: [] for field in NOTE_FIELDS}
+    for part_index, part in enumerate(score.parts):
+        notes = part.note_array()
+        measures = part.measures
+        measure_starts = np.array([measure.start.t for measure in measures], dtype=np.int64)
+        measure_numbers = np.array([measure.number for measure in measures], dtype=np.int32)
+        if len(measures):
+            positions = np.searchsorted(measure_starts, notes["onset_div"], side="right") - 1
+            note_measures = measure_numbers[np.clip(positions, 0, None)]
+        else:
+            note_measures = np.zeros(len(notes), dtype=np.int32)
+
+        for field in ("onset_beat", "onset_quarter", "duration_beat", "duration_quarter", "pitch"):
+            columns[field].append(notes[field])
+        columns["measure"].append(note_measures)
+        columns["part"].append(np.full(len(notes), part_index))
+
+    dtypes = {
+        "onset_beat": np.float64,
+        "onset_quarter": np.float64,
+        "duration_beat": np.float64,
+        "duration_quarter": np.float64,
+        "pitch": np.int16,
+        "measure": np.int32,
+        "part": np.int16,
+    }
+    index = {
+        field: np.concatenate(values).astype(dtypes[field]) if values else np.zeros(0, dtype=dtypes[field])
+        for field, values in columns.items()
+    }
+    order = np.lexsort((index["pitch"], index["onset_quarter"]))
+    index = {field: values[order] for field, values in index.items()}
+
+    measures = score.parts[0].measures if score.parts else []
+    if measures:
+        part = score.parts[0]
+        starts = np.array([measure.start.t for measure in measures])
+        index["measure_number"] = np.array([measure.number for measure in measures], dtype=np.int32)
+        index["measure_start_beat"] = np.asarray(part.beat_map(starts), dtype=np.float64)
+        index["measure_start_quarter"] = np.asarray(part.quarter_map(starts), dtype=np.float64)
+    else:
+        index["measure_number"] = np.zeros(0, dtype=np.int32)
+        index["measure_start_beat"] = np.zeros(0, dtype=np.float64)
+        index["measure_start_quarter"] = np.zeros(0, dtype=np.float64)
+
+    if score.parts:
+        part = merge_parts(score.parts)
+        times = np.array([point.t for point in part._points])
+        beats = np.asarray(part.beat_map(times), dtype=np.float64)
+        # np.interp 要求横坐标严格递增，重复的 beat 只保留第一个
+        beats, first = np.unique(beats, return_index=True)
+        index["beat_map_beat"] = beats
+        index["beat_map_quarter"] = np.asarray(part.quarter_map(times), dtype=np.float64)[first]
+    else:
+        index["beat_map_beat"] = np.zeros(0, dtype=np.float64)
+        index["beat_map_quarter"] = np.zeros(0, dtype=np.float64)
+    return index
+
+
+def compute_note_index(score_path: Path) -> Path:
+    """
+    Build the note index of a score and store it as ``.npz`` next to it
+
+    The archive is written uncompressed so that the device service can
+    memory-map the arrays in place. An existing index of the current version
+    is reused.
+
+    Parameters
+    ----------
+    score_path : Path
+        Path to the score xml file
+
+    Returns
+    -------
+    Path
+        Path to the ``.npz`` file
+    """
+    index_path = note_index_path(score_path)
+    if index_path.exists():
+        return index_path
+
+    index = build_note_index(load_score_cached(score_path))
+    # np.savez 需要 .npz 后缀，写完后原子替换
+    tmp_path = index_path.with_name(f"{index_path.stem}.{uuid.uuid4().hex[:8]}.tmp.npz")
+    np.savez(tmp_path, **index)
+    tmp_path.replace(index_path)
+    return index_path
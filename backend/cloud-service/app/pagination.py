@@ -0,0 +1,103 @@
+import base64
+import json
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.models import UploadedFile
+
+
+def encode_cursor(created_at: datetime, file_id: str) -> str:
+    """
+    游标只包含排序键 (created_at, id)，客户端视为不透明字符串
+    """
+    payload = json.dumps([created_at.isoformat(), file_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    解析游标，格式错误时抛出 ValueError
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, file_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), str(file_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+async def estimate_count(db: AsyncSession, stmt: Select) -> int:
+    """
+    用查询计划中的行数估计代替 COUNT(*)，代价与数据量无关
+    """
+    compiled = stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def keyset_page(
+    db: AsyncSession,
+    where: list,
+    page_size: int,
+    cursor: Optional[str] = None,
+    total: str = "none",
+) -> tuple[list[UploadedFile], dict]:
+    """
+    Fetch one page of ``uploaded_files`` ordered by newest first
+
+    Pages are addressed by a cursor on ``(created_at, id)`` instead of an
+    offset, so with the ``(..., created_at, id)`` indexes every page costs
+    one index range scan no matter how deep it is. ``created_at`` is NOT
+    NULL, so the row-value comparison never skips a row.
+
+    Parameters
+    ----------
+    db : AsyncSession
+        Database session
+    where : list
+        Filter conditions of the listing
+    page_size : int
+        Number of rows per page
+    cursor : str, optional
+        ``next_cursor`` of the previous page, None for the first page
+    total : str
+        ``none`` (default), ``exact`` (``COUNT(*)``) or ``estimate`` (planner
+        row estimate)
+
+    Returns
+    -------
+    tuple[list[UploadedFile], dict]
+        The rows of the page and the pagination info
+    """
+    stmt = select(UploadedFile).where(*where)
+    if cursor:
+        created_at, file_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(UploadedFile.created_at, UploadedFile.id) < tuple_(created_at, file_id))
+    stmt = stmt.order_by(UploadedFile.created_at.desc(), UploadedFile.id.desc()).limit(page_size + 1)
+
+    files = list((await db.execute(stmt)).scalars())
+    has_more = len(files) > page_size
+    files = files[:page_size]
+
+    pagination = {
+        "page_size": page_size,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(files[-1].created_at, files[-1].id) if has_more else None,
+    }
+    if total in ("exact", "estimate"):
+        if total == "exact":
+            count = await db.scalar(select(func.count()).select_from(UploadedFile).where(*where))
+        else:
+            count = await estimate_count(db, select(UploadedFile.id).where(*where))
+        pagination["total"] = count
+        pagination["total_is_estimate"] = total == "estimate"
+        pagination["total_pages"] = max((count + page_size - 1) // page_size, 1)
+    return files, pagination
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from app.auth import pwd_context
+from app.config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+
+# 专用于 bcrypt 的线程池（bcrypt 计算时释放 GIL），与 FastAPI 默认线程池隔离
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+# 正在执行和排队的哈希任务数
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+class PasswordHashingBusy(Exception):
+    """
+    排队的哈希任务已达上限，接口应返回 429
+    """
+
+
+async def _run(func, *args):
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_HASH_MAX_PENDING:
+            raise PasswordHashingBusy()
+        _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    在专用线程池中计算密码哈希
+    """
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Verify a password on the hashing pool
+
+    Returns
+    -------
+    tuple[bool, str or None]
+        Whether the password matches, and a new hash when the stored one
+        uses a different cost than ``BCRYPT_ROUNDS`` (the caller saves it)
+    """
+    return await _run(pwd_context.verify_and_update, password, hashed_password)
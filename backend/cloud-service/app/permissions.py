@@ -0,0 +1,85 @@
+import threading
+import time
+
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import PERMISSION_CACHE_TTL
+from app.models import Permission, Role, RolePermission, UserRole
+
+# 进程内的权限缓存 {user_id: (过期时间, 权限名集合)}
+_cache: dict[str, tuple[float, frozenset]] = {}
+_cache_lock = threading.Lock()
+
+
+async def load_permissions(user_id: str, db: AsyncSession) -> frozenset:
+    """
+    一次联表查询取出用户所有角色的全部权限名
+    """
+    rows = await db.execute(
+        select(Permission.name)
+        .join(RolePermission, RolePermission.permission_id == Permission.id)
+        .join(UserRole, UserRole.role_id == RolePermission.role_id)
+        .where(UserRole.user_id == user_id)
+        .distinct()
+    )
+    return frozenset(rows.scalars())
+
+
+async def load_role_names(user_id: str, db: AsyncSession) -> list[str]:
+    """
+    用户的全部角色名
+    """
+    rows = await db.execute(
+        select(Role.name)
+        .join(UserRole, UserRole.role_id == Role.id)
+        .where(UserRole.user_id == user_id)
+    )
+    return list(rows.scalars())
+
+
+async def get_permissions(user_id: str, db: AsyncSession) -> frozenset:
+    """
+    Get the permission names of a user
+
+    The result is cached per user for ``PERMISSION_CACHE_TTL`` seconds, so
+    repeated authorization checks cost no query. Role changes made through
+    this service call ``invalidate_permissions``; the TTL bounds how long
+    changes made elsewhere (e.g. directly in the database) stay unseen.
+
+    Parameters
+    ----------
+    user_id : str
+        ID of the user
+    db : AsyncSession
+        Database session used on a cache miss
+
+    Returns
+    -------
+    frozenset
+        Names of the user's permissions
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    permissions = await load_permissions(user_id, db)
+    if PERMISSION_CACHE_TTL > 0:
+        with _cache_lock:
+            _cache[user_id] = (now + PERMISSION_CACHE_TTL, permissions)
+    return permissions
+
+
+def invalidate_permissions(user_id: Optional[str] = None) -> None:
+    """
+    清除某个用户的权限缓存，不指定用户时清除全部
+    """
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
@@ -0,0 +1,284 @@
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from app.artifact_quota import request_quota_check
+from app.common import ProcessingState
+from app.config import PREPROCESS_WORKERS
+from app.database import SessionLocal, engine
+from app.models import UploadedFile
+from app.reference_features import compute_reference_features
+from app.note_index import compute_note_index
+from app.score_metadata import read_score_metadata
+from app.score_store import lock_blob
+from app.utils import preprocess_score, encode_audio_renditions
+
+# 排队或正在渲染的状态
+PENDING_STATES = [ProcessingState.QUEUED.value, ProcessingState.RENDERING.value]
+
+# 重新提交未完成任务的 advisory lock，多个 worker 中只有一个获得
+REQUEUE_LOCK_KEY = 0x5C0E_0001
+
+# 预处理进程池，在第一次提交任务时创建
+_executor: Optional[ProcessPoolExecutor] = None
+# 持有 REQUEUE_LOCK_KEY 的连接，进程退出时关闭，锁随之释放
+_requeue_connection = None
+
+
+def _init_worker():
+    """
+    子进程初始化：丢弃从父进程继承的数据库连接池
+    """
+    engine.dispose(close=False)
+
+
+def _update_file(file_id: str, **fields) -> None:
+    db = SessionLocal()
+    try:
+        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        if not uploaded_file:
+            return
+        for key, value in fields.items():
+            setattr(uploaded_file, key, value)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _set_state(file_id: str, state: ProcessingState, **fields) -> None:
+    """
+    更新任务状态，相同内容、等待该任务的记录（queued / rendering）一并更新
+    持有内容锁，与创建记录的请求互斥，等待中的新记录不会漏掉回填
+    """
+    db = SessionLocal()
+    try:
+        uploaded_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        if not uploaded_file:
+            return
+        rows = [uploaded_file]
+        if uploaded_file.content_hash:
+            db.execute(lock_blob(uploaded_file.content_hash))
+            rows += (
+                db.query(UploadedFile)
+                .filter(
+                    UploadedFile.content_hash == uploaded_file.content_hash,
+                    UploadedFile.id != file_id,
+                    UploadedFile.processing_state.in_(PENDING_STATES),
+                )
+                .all()
+            )
+        for row in rows:
+            row.processing_state = state.value
+            for key, value in fields.items():
+                setattr(row, key, value)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _read_metadata(score_path: Path, log_name: str) -> dict:
+    # 元数据只用于搜索，提取失败不影响预处理结果
+    try:
+        return read_score_metadata(score_path)
+    except Exception as e:
+        logging.error(f"Failed to extract metadata of {log_name}: {e}")
+        return {}
+
+
+def render_score_artifacts(score_path: Path, log_name: str) -> tuple[str, str]:
+    """
+    Produce every artifact derived from a score
+
+    The MIDI and WAV files are required, failures are raised. Compressed
+    renditions, reference features and the note index are optional caches,
+    failures are only logged.
+
+    Parameters
+    ----------
+    score_path : Path
+        Path to the score xml file
+    log_name : str
+        Name used in log messages (file id or source path)
+
+    Returns
+    -------
+    tuple[str, str]
+        Paths to the MIDI and WAV files
+    """
+    score_midi_path, score_audio_path = preprocess_score(score_path)
+
+    # 压缩音频失败时仍可使用 WAV
+    try:
+        encode_audio_renditions(Path(score_audio_path))
+    except Exception as e:
+        logging.error(f"Failed to encode audio renditions for {log_name}: {e}")
+
+    # 参考特征只是加速 score following 的缓存，失败时 device-service 会自行计算
+    try:
+        compute_reference_features(score_path, Path(score_audio_path))
+    except Exception as e:
+        logging.error(f"Failed to compute reference features for {log_name}: {e}")
+
+    # 音符索引同样是缓存，解析结果已缓存，几乎没有额外开销
+    try:
+        compute_note_index(score_path)
+    except Exception as e:
+        logging.error(f"Failed to compute note index for {log_name}: {e}")
+
+    return str(Path(score_midi_path)), str(Path(score_audio_path))
+
+
+def run_preprocess_job(file_id: str, score_path: str) -> str:
+    """
+    Run the preprocessing of one uploaded score inside a worker process
+
+    Parameters
+    ----------
+    file_id : str
+        ID of the ``UploadedFile`` row
+    score_path : str
+        Path to the uploaded score xml file
+
+    Returns
+    -------
+    str
+        Final processing state of the file
+    """
+    _set_state(file_id, ProcessingState.RENDERING, processing_error=None)
+    try:
+        score_midi_path, score_audio_path = render_score_artifacts(Path(score_path), file_id)
+    except Exception as e:
+        logging.error(f"Failed to preprocess {file_id}: {e}")
+        _set_state(file_id, ProcessingState.FAILED, processing_error=str(e))
+        return ProcessingState.FAILED.value
+
+    # 渲染时已缓存解析结果，这里不会再次解析乐谱
+    metadata = _read_metadata(Path(score_path), file_id)
+    _set_state(
+        file_id,
+        ProcessingState.DONE,
+        midi_path=score_midi_path,
+        audio_path=score_audio_path,
+        **metadata,
+    )
+    return ProcessingState.DONE.value
+
+
+def run_metadata_job(file_id: str, score_path: str) -> None:
+    """
+    只提取元数据，用于不需要立即渲染的记录（延迟渲染模式、复用了渲染结果的旧记录）
+    """
+    metadata = _read_metadata(Path(score_path), file_id)
+    if metadata:
+        _update_file(file_id, **metadata)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS, initializer=_init_worker)
+    return _executor
+
+
+def submit_preprocess(file_id: str, score_path: str) -> None:
+    """
+    将预处理任务加入进程池队列，立即返回
+    """
+    future = get_executor().submit(run_preprocess_job, file_id, str(score_path))
+
+    def _on_done(f):
+        error = f.exception()
+        if error is None:
+            # 新产物写入后通知配额线程检查缓存，不在结果回调线程里遍历 blob
+            request_quota_check({str(Path(score_path).parent)})
+        else:
+            # 子进程异常退出（例如 BrokenProcessPool），任务本身没有机会记录状态
+            logging.error(f"Preprocess job for {file_id} crashed: {error}")
+            try:
+                _set_state(file_id, ProcessingState.FAILED, processing_error=str(error))
+            except Exception as e:
+                logging.error(f"Failed to record job failure for {file_id}: {e}")
+
+    future.add_done_callback(_on_done)
+
+
+def submit_metadata(file_id: str, score_path: str) -> None:
+    """
+    将元数据提取任务加入进程池队列，立即返回
+    """
+    future = get_executor().submit(run_metadata_job, file_id, str(score_path))
+
+    def _on_done(f):
+        error = f.exception()
+        if error is not None:
+            logging.error(f"Metadata job for {file_id} crashed: {error}")
+
+    future.add_done_callback(_on_done)
+
+
+def requeue_pending_jobs() -> int:
+    """
+    Resubmit the jobs left in queued / rendering state by a restart
+
+    Every worker of the service calls this at startup, but only the one
+    that obtains the session-level advisory lock ``REQUEUE_LOCK_KEY``
+    resubmits, so each pending score is rendered once. The lock is held on
+    a dedicated connection for the lifetime of the process: workers started
+    while it runs (e.g. the other workers of the same deployment) skip the
+    requeue, since the jobs are already running in its pool. Rows sharing a
+    content hash get one job, which fills in the others when it finishes.
+
+    Returns
+    -------
+    int
+        Number of jobs submitted
+    """
+    global _requeue_connection
+    if _requeue_connection is not None:
+        return 0
+    connection = engine.connect()
+    try:
+        acquired = connection.scalar(select(func.pg_try_advisory_lock(REQUEUE_LOCK_KEY)))
+        # 会话级的锁在事务结束后仍然保留
+        connection.commit()
+    except Exception:
+        connection.close()
+        raise
+    if not acquired:
+        connection.close()
+        return 0
+    _requeue_connection = connection
+
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(UploadedFile.id, UploadedFile.filepath, UploadedFile.content_hash)
+            .filter(UploadedFile.processing_state.in_(PENDING_STATES))
+            .all()
+        )
+    finally:
+        db.close()
+
+    submitted = set()
+    count = 0
+    for file_id, filepath, content_hash in pending:
+        if content_hash and content_hash in submitted:
+            continue
+        submitted.add(content_hash)
+        submit_preprocess(file_id, filepath)
+        count += 1
+    return count
+
+
+def shutdown_executor() -> None:
+    global _executor, _requeue_connection
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _requeue_connection is not None:
+        _requeue_connection.close()
+        _requeue_connection = None
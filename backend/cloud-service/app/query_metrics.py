@@ -0,0 +1,185 @@
+import logging
+import time
+
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from app.config import QUERY_METRICS_ENABLED, N_PLUS_ONE_THRESHOLD
+
+# 记录的 SQL 语句最大长度
+STATEMENT_MAX_LENGTH = 300
+
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    if len(statement) > STATEMENT_MAX_LENGTH:
+        return statement[:STATEMENT_MAX_LENGTH] + "..."
+    return statement
+
+
+@dataclass
+class RequestQueries:
+    """
+    一个请求执行的查询
+    """
+    count: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+    statements: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        # SQL 中的参数是占位符，N+1 查询表现为同一条语句重复执行
+        self.statements[statement] += 1
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    @property
+    def suspected_n_plus_one(self) -> bool:
+        return N_PLUS_ONE_THRESHOLD > 0 and self.count > N_PLUS_ONE_THRESHOLD
+
+    def most_repeated(self) -> tuple[Optional[str], int]:
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+@dataclass
+class RouteQueryStats:
+    """
+    一个接口（方法 + 路由模板）的累计查询统计
+    """
+    requests: int = 0
+    queries: int = 0
+    db_seconds: float = 0.0
+    max_queries: int = 0
+    suspected_n_plus_one: int = 0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+    most_repeated_statement: Optional[str] = None
+    most_repeated_count: int = 0
+
+    def add(self, queries: RequestQueries) -> None:
+        self.requests += 1
+        self.queries += queries.count
+        self.db_seconds += queries.seconds
+        self.max_queries = max(self.max_queries, queries.count)
+        if queries.suspected_n_plus_one:
+            self.suspected_n_plus_one += 1
+        if queries.slowest_statement is not None and queries.slowest_seconds >= self.slowest_seconds:
+            self.slowest_seconds = queries.slowest_seconds
+            self.slowest_statement = _shorten(queries.slowest_statement)
+        statement, repeats = queries.most_repeated()
+        if repeats > self.most_repeated_count:
+            self.most_repeated_count = repeats
+            self.most_repeated_statement = _shorten(statement)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "avg_queries": round(self.queries / self.requests, 2) if self.requests else 0,
+            "max_queries": self.max_queries,
+            "db_ms": round(self.db_seconds * 1000, 2),
+            "avg_db_ms": round(self.db_seconds * 1000 / self.requests, 2) if self.requests else 0,
+            "suspected_n_plus_one": self.suspected_n_plus_one,
+            "slowest_ms": round(self.slowest_seconds * 1000, 2),
+            "slowest_statement": self.slowest_statement,
+            "most_repeated_count": self.most_repeated_count,
+            "most_repeated_statement": self.most_repeated_statement,
+        }
+
+
+# 当前请求的查询记录，请求之外（后台任务、子进程）为 None，不做统计
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+# {"GET /cloud/library": RouteQueryStats}
+_routes: dict[str, RouteQueryStats] = {}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None and context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _current.get()
+    started = getattr(context, "_query_started", None)
+    if queries is not None and started is not None:
+        queries.record(statement, time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    为引擎注册查询计时事件；异步引擎传入 async_engine.sync_engine
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def record_request(route: str, queries: RequestQueries) -> None:
+    _routes.setdefault(route, RouteQueryStats()).add(queries)
+    if queries.suspected_n_plus_one:
+        statement, repeats = queries.most_repeated()
+        logging.warning(
+            f"Suspected N+1: {route} ran {queries.count} queries in {queries.seconds * 1000:.1f} ms, "
+            f"most repeated ({repeats}x): {_shorten(statement)}"
+        )
+
+
+def get_query_metrics(reset: bool = False) -> dict:
+    """
+    按数据库总耗时降序返回各接口的统计
+    """
+    metrics = {
+        route: stats.to_dict()
+        for route, stats in sorted(_routes.items(), key=lambda item: item[1].db_seconds, reverse=True)
+    }
+    if reset:
+        _routes.clear()
+    return metrics
+
+
+class QueryMetricsMiddleware:
+    """
+    Count the queries, total DB time and slowest statement of every request
+
+    Timings are collected by engine events into a per-request context
+    variable, aggregated per route template, and reported to the client in a
+    ``Server-Timing`` header. A request running more than
+    ``N_PLUS_ONE_THRESHOLD`` queries is logged as a suspected N+1.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = _current.set(queries)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # 路由匹配后 FastAPI 会把路由对象写入 scope，未匹配的请求（404）不做统计
+            route = scope.get("route")
+            if route is not None:
+                record_request(f"{scope['method']} {route.path}", queries)
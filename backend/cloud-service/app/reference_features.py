@@ -0,0 +1,76 @@
+import hashlib
+import json
+import uuid
+
+import numpy as np
+
+import matchmaker
+
+from pathlib import Path
+from matchmaker import Matchmaker
+
+from app.config import REFERENCE_FEATURE_CONFIG
+
+
+def feature_fingerprint(config: dict = REFERENCE_FEATURE_CONFIG) -> dict:
+    """
+    决定参考特征内容的全部输入：特征配置（含 method）和 matchmaker 版本
+    """
+    return {**config, "matchmaker": matchmaker.__version__}
+
+
+def get_feature_version(fingerprint: dict) -> str:
+    """
+    根据 feature_fingerprint 生成版本号，唯一的定义：device-service 把自己的 fingerprint 发给本服务换算
+    """
+    payload = json.dumps(fingerprint, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+REFERENCE_FEATURE_VERSION = get_feature_version(feature_fingerprint())
+
+
+def reference_features_path(score_path: Path, version: str = REFERENCE_FEATURE_VERSION) -> Path:
+    return score_path.with_name(f"{score_path.stem}.features.{version}.npy")
+
+
+def compute_reference_features(score_path: Path, score_audio_path: Path) -> Path:
+    """
+    Compute the score follower's reference features and store them as ``.npy``
+
+    The features are produced by the same ``Matchmaker`` setup the
+    device-service uses, so the follower can load them instead of running the
+    DSP again at the start of every session. Existing features of the current
+    version are reused.
+
+    Parameters
+    ----------
+    score_path : Path
+        Path to the score xml file
+    score_audio_path : Path
+        Path to the rendered score audio, used as the (unused) performance
+        input so that no audio device is opened
+
+    Returns
+    -------
+    Path
+        Path to the ``.npy`` feature file next to the score
+    """
+    features_path = reference_features_path(score_path)
+    if features_path.exists():
+        return features_path
+
+    mm = Matchmaker(
+        score_file=str(score_path),
+        performance_file=str(score_audio_path),
+        input_type=REFERENCE_FEATURE_CONFIG["input_type"],
+        method=REFERENCE_FEATURE_CONFIG["method"],
+        frame_rate=REFERENCE_FEATURE_CONFIG["frame_rate"],
+    )
+    features = np.ascontiguousarray(mm.reference_features)
+
+    # np.save 需要 .npy 后缀，写完后原子替换
+    tmp_path = features_path.with_name(f"{features_path.stem}.{uuid.uuid4().hex[:8]}.tmp.npy")
+    np.save(tmp_path, features)
+    tmp_path.replace(features_path)
+    return features_path
@@ -0,0 +1,65 @@
+import logging
+import pickle
+import sys
+import uuid
+
+import numpy as np
+import partitura
+
+from pathlib import Path
+from partitura.score import Score
+
+# 解析结果缓存的版本号：pickle 依赖 partitura 的类定义、numpy 的数组格式和 Python 版本，任一变化后旧缓存不再使用
+# 缓存只在 cloud-service 本地读写，不通过接口提供：反序列化 pickle 可以执行任意代码
+PARSED_SCORE_VERSION = f"{partitura.__version__}-py{sys.version_info.major}{sys.version_info.minor}-np{np.__version__}"
+# 两个服务都运行在 Python 3.8 以上，可以使用 protocol 5
+PICKLE_PROTOCOL = 5
+
+
+def parsed_score_path(score_path: Path, version: str = PARSED_SCORE_VERSION) -> Path:
+    return score_path.with_name(f"{score_path.stem}.partitura-{version}.pkl")
+
+
+def _write_parsed_score(score: Score, path: Path) -> None:
+    # 先写临时文件再原子替换，并发任务不会读到半成品
+    tmp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:8]}.tmp.pkl")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(score, f, protocol=PICKLE_PROTOCOL)
+    tmp_path.replace(path)
+
+
+def load_score_cached(score_path: Path) -> Score:
+    """
+    Parse a MusicXML score, reusing the serialized result of an earlier parse
+
+    The parsed ``Score`` is pickled next to the score file. Stored scores are
+    content-addressed, so the cache is keyed by the content hash (the blob
+    directory) and the partitura, Python and numpy versions (the file name).
+    A cache file that cannot be read is replaced by a fresh parse. The pickle
+    is written and read by cloud-service only; other consumers get the
+    arrays they need from the note index instead.
+
+    Parameters
+    ----------
+    score_path : Path
+        Path to the score xml file
+
+    Returns
+    -------
+    Score
+        The parsed score
+    """
+    cache_path = parsed_score_path(score_path)
+    if cache_path.exists():
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logging.error(f"Failed to load parsed score {cache_path}, parsing again: {e}")
+
+    score = partitura.load_musicxml(score_path)
+    try:
+        _write_parsed_score(score, cache_path)
+    except Exception as e:
+        logging.error(f"Failed to cache parsed score {cache_path}: {e}")
+    return score
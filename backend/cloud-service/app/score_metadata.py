@@ -0,0 +1,162 @@
+"""
+乐谱元数据提取
+
+用法（回填已有记录）：
+    python -m app.score_metadata [--workers N]
+
+上传 / 预处理 / 批量导入时从解析后的乐谱中提取标题、作曲家、声部、调号、拍号、
+小节数、音符数和时长，写入 uploaded_files 的索引列，曲目库搜索只查询数据库。
+"""
+import argparse
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+from partitura.score import Score
+
+from app.score_cache import load_score_cached
+
+# 写入 UploadedFile 的元数据列，相同内容的乐谱直接复制这些列
+METADATA_FIELDS = (
+    "title",
+    "composer",
+    "part_names",
+    "part_count",
+    "key_signature",
+    "time_signature",
+    "measure_count",
+    "note_count",
+    "duration_seconds",
+)
+
+# 参考音频使用 partitura.save_wav_fluidsynth 的默认速度（每分钟 60 个四分音符）渲染，
+# 时长按同样的速度换算，与练习时听到的音频一致
+REFERENCE_QPM = 60
+
+
+def _clean(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    text = " ".join(str(text).split())
+    return text or None
+
+
+def extract_score_metadata(score: Score) -> dict:
+    """
+    Extract the searchable metadata of a parsed score
+
+    Key and time signature are the first ones of the first part, the
+    measure count and duration are those of the longest part.
+
+    Parameters
+    ----------
+    score : Score
+        The parsed score
+
+    Returns
+    -------
+    dict
+        A value for every name in ``METADATA_FIELDS``, None when the score
+        does not contain the information
+    """
+    parts = list(score.parts)
+    first_part = parts[0] if parts else None
+    key_sigs = first_part.key_sigs if first_part is not None else []
+    time_sigs = first_part.time_sigs if first_part is not None else []
+
+    duration_quarters = 0.0
+    for part in parts:
+        if part.first_point is None or part.last_point is None:
+            continue
+        length = float(part.quarter_map(part.last_point.t) - part.quarter_map(part.first_point.t))
+        duration_quarters = max(duration_quarters, length)
+
+    part_names = [_clean(part.part_name) for part in parts]
+    return {
+        # MusicXML 中标题可能写在 movement-title、credit 或 work-title 中
+        "title": _clean(score.title or score.movement_title or score.work_title),
+        "composer": _clean(score.composer),
+        "part_names": ", ".join(name for name in part_names if name) or None,
+        "part_count": len(parts),
+        "key_signature": key_sigs[0].name if key_sigs else None,
+        "time_signature": f"{time_sigs[0].beats}/{time_sigs[0].beat_type}" if time_sigs else None,
+        "measure_count": max((len(part.measures) for part in parts), default=0),
+        "note_count": sum(len(part.notes_tied) for part in parts),
+        "duration_seconds": round(duration_quarters * 60 / REFERENCE_QPM, 2),
+    }
+
+
+def read_score_metadata(score_path: Path) -> dict:
+    """
+    解析乐谱（优先使用解析结果缓存）并提取元数据，在进程池中执行
+    """
+    return extract_score_metadata(load_score_cached(Path(score_path)))
+
+
+def copy_metadata(source, target) -> bool:
+    """
+    把相同内容乐谱已提取的元数据复制到新记录，source 没有元数据时返回 False
+    """
+    if source is None or source.note_count is None:
+        return False
+    for field in METADATA_FIELDS:
+        setattr(target, field, getattr(source, field))
+    return True
+
+
+def backfill_metadata(workers: int = os.cpu_count() or 1) -> dict:
+    """
+    为元数据列为空的记录提取元数据，相同内容的乐谱只解析一次
+    """
+    from app.database import SessionLocal
+    from app.models import UploadedFile
+
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(UploadedFile.content_hash, UploadedFile.filepath)
+            .filter(UploadedFile.note_count.is_(None))
+            .all()
+        )
+    finally:
+        db.close()
+
+    # 没有内容哈希的旧记录按文件路径去重
+    scores = {content_hash or filepath: filepath for content_hash, filepath in pending}
+    stats = {"scores": len(scores), "updated": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(read_score_metadata, filepath): key for key, filepath in scores.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                metadata = future.result()
+            except Exception as e:
+                logging.error(f"Failed to extract metadata of {scores[key]}: {e}")
+                stats["failed"] += 1
+                continue
+            db = SessionLocal()
+            try:
+                column = UploadedFile.filepath if key == scores[key] else UploadedFile.content_hash
+                stats["updated"] += (
+                    db.query(UploadedFile)
+                    .filter(column == key, UploadedFile.note_count.is_(None))
+                    .update(metadata, synchronize_session=False)
+                )
+                db.commit()
+            finally:
+                db.close()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the metadata of scores uploaded before metadata extraction existed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of parse processes")
+    args = parser.parse_args()
+
+    result = backfill_metadata(args.workers)
+    print("Backfill finished:")
+    for key, value in result.items():
+        print(f"  {key}: {value}")
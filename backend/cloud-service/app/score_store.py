@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import shutil
+import uuid
+
+from pathlib import Path
+
+from sqlalchemy import func, select
+
+from app.config import UPLOAD_DIR, UPLOAD_CHUNK_SIZE
+
+# 内容寻址存储目录：blobs/<hash前两位>/<hash>/score.<ext>
+BLOB_DIR = UPLOAD_DIR / "blobs"
+# 上传过程中的临时文件目录
+UPLOAD_TMP_DIR = UPLOAD_DIR / "tmp"
+
+# 乐谱源文件可能的扩展名
+SCORE_SUFFIXES = {".musicxml", ".xml", ".mxl"}
+# 压缩格式按原始字节计算哈希，其余按文本规范化后计算
+BINARY_SCORE_SUFFIXES = {".mxl"}
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+class ScoreHasher:
+    """
+    Incremental SHA-256 of a normalized score
+
+    Text scores are normalized before hashing so that the same MusicXML saved
+    with a different editor still maps to the same blob: a leading UTF-8 BOM is
+    dropped and CRLF / CR line endings are converted to LF. Chunks can be fed
+    in any size; a trailing CR is held back until the next chunk arrives.
+    """
+
+    def __init__(self, normalize: bool = True):
+        self.normalize = normalize
+        self._sha = hashlib.sha256()
+        self._head = b""  # 用于检测 BOM 的前几个字节
+        self._head_done = not normalize
+        self._pending_cr = False
+
+    def update(self, chunk: bytes) -> None:
+        if not self.normalize:
+            self._sha.update(chunk)
+            return
+
+        if not self._head_done:
+            self._head += chunk
+            if len(self._head) < len(UTF8_BOM):
+                return
+            chunk = self._head[len(UTF8_BOM):] if self._head.startswith(UTF8_BOM) else self._head
+            self._head = b""
+            self._head_done = True
+
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+            self._pending_cr = False
+        if chunk.endswith(b"\r"):
+            chunk = chunk[:-1]
+            self._pending_cr = True
+        self._sha.update(chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n"))
+
+    def hexdigest(self) -> str:
+        sha = self._sha.copy()
+        if self._head and self._head != UTF8_BOM:
+            sha.update(self._head.replace(b"\r\n", b"\n").replace(b"\r", b"\n"))
+        if self._pending_cr:
+            sha.update(b"\n")
+        return sha.hexdigest()
+
+
+def new_score_hasher(filename: str) -> ScoreHasher:
+    return ScoreHasher(normalize=Path(filename).suffix.lower() not in BINARY_SCORE_SUFFIXES)
+
+
+def new_upload_tmp_path() -> Path:
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    return UPLOAD_TMP_DIR / uuid.uuid4().hex
+
+
+def save_upload_to_tmp(fileobj, filename: str) -> tuple[Path, str]:
+    """
+    Copy an uploaded file object to a temporary file while hashing it
+
+    This does blocking IO, call it from the threadpool in async handlers.
+
+    Returns
+    -------
+    tuple[Path, str]
+        Temporary file path and normalized content hash
+    """
+    tmp_path = new_upload_tmp_path()
+    hasher = new_score_hasher(filename)
+    with open(str(tmp_path), "wb") as buffer:
+        while chunk := fileobj.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            buffer.write(chunk)
+    return tmp_path, hasher.hexdigest()
+
+
+def blob_dir(content_hash: str) -> Path:
+    return BLOB_DIR / content_hash[:2] / content_hash
+
+
+def blob_lock_key(content_hash: str) -> int:
+    # advisory lock 的键是 bigint，取哈希的前 15 位十六进制（60 位）
+    return int(content_hash[:15], 16)
+
+
+def lock_blob(content_hash: str):
+    """
+    Statement taking the transaction-level advisory lock of a content hash
+
+    Storing a blob and committing the row that references it, and checking
+    that a blob is unreferenced and removing it, both run under this lock.
+    So a blob is never removed between ``store_score_blob`` and the commit of
+    its new row, in any process. The lock is released at commit or rollback.
+    """
+    return select(func.pg_advisory_xact_lock(blob_lock_key(content_hash)))
+
+
+def store_score_blob(tmp_path: Path, content_hash: str, filename: str) -> Path:
+    """
+    Move an uploaded score into the content-addressed store
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary file holding the uploaded bytes
+    content_hash : str
+        Normalized SHA-256 of the score (see ``ScoreHasher``)
+    filename : str
+        Original file name, only its suffix is kept
+
+    Returns
+    -------
+    Path
+        Path to the stored score. If the same score is already stored, the
+        temporary file is discarded and the existing path is returned.
+    """
+    target_dir = blob_dir(content_hash)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    suffix = Path(filename).suffix.lower()
+    candidates = [suffix] + sorted(SCORE_SUFFIXES - {suffix})
+    for candidate in candidates:
+        existing = target_dir / f"score{candidate}"
+        if existing.exists():
+            tmp_path.unlink(missing_ok=True)
+            return existing
+
+    score_path = target_dir / f"score{suffix}"
+    tmp_path.replace(score_path)
+    return score_path
+
+
+def release_score_blob(content_hash: str) -> None:
+    """
+    删除不再被任何 UploadedFile 引用的 blob 目录（乐谱及其 MIDI / 音频产物）
+    """
+    target_dir = blob_dir(content_hash)
+    try:
+        if target_dir.exists():
+            shutil.rmtree(target_dir)
+            print(f"Successfully deleted blob: {target_dir}")
+    except Exception as e:
+        logging.error(f"Failed to delete blob {target_dir}: {e}")
@@ -0,0 +1,83 @@
+import os
+import time
+
+import pytest
+
+from app import artifact_quota
+from app.common import ProcessingState
+from app.models import UploadedFile
+
+
+@pytest.fixture
+def quota(tmp_path, sqlite_db, monkeypatch):
+    """
+    blob 目录指向 tmp_path，配额 100 字节；返回添加记录的函数
+    """
+    session_factory, _ = sqlite_db
+    monkeypatch.setattr(artifact_quota, "SessionLocal", session_factory)
+    monkeypatch.setattr(artifact_quota, "BLOB_DIR", tmp_path)
+    monkeypatch.setattr(artifact_quota, "ARTIFACT_CACHE_MAX_BYTES", 100)
+    monkeypatch.setattr(artifact_quota, "ARTIFACT_MIN_AGE_SECONDS", 600)
+    monkeypatch.setattr(artifact_quota, "_access", {})
+
+    def add(file_id, content_hash, state):
+        with session_factory() as db:
+            db.add(UploadedFile(
+                id=file_id,
+                filename=f"{file_id}.musicxml",
+                filepath=str(tmp_path / content_hash[:2] / content_hash / "score.musicxml"),
+                content_hash=content_hash,
+                user_id="user",
+                processing_state=state.value,
+            ))
+            db.commit()
+
+    return add
+
+
+def _make_blob(root, name, size, age):
+    blob = root / name[:2] / name
+    blob.mkdir(parents=True)
+    (blob / "score.musicxml").write_text("<score/>")
+    midi = blob / "score.mid"
+    midi.write_bytes(b"\0" * size)
+    mtime = time.time() - age
+    os.utime(midi, (mtime, mtime))
+    return blob
+
+
+def test_enforce_quota_skips_recent_blobs(tmp_path, quota):
+    old = _make_blob(tmp_path, "aa" * 32, 80, age=3600)
+    recent = _make_blob(tmp_path, "bb" * 32, 80, age=3600)
+    written = _make_blob(tmp_path, "cc" * 32, 80, age=10)
+    # 刚确认过产物、即将下载的 blob
+    artifact_quota.record_access(recent / "score.musicxml")
+
+    removed = artifact_quota.enforce_quota()
+
+    assert removed == 80
+    assert not (old / "score.mid").exists()
+    assert (old / "score.musicxml").exists()
+    assert (recent / "score.mid").exists()
+    assert (written / "score.mid").exists()
+
+
+def test_enforce_quota_skips_blobs_waiting_for_a_render(tmp_path, quota):
+    rendering = _make_blob(tmp_path, "aa" * 32, 80, age=3600)
+    old = _make_blob(tmp_path, "bb" * 32, 80, age=3600)
+    queued = _make_blob(tmp_path, "cc" * 32, 80, age=3600)
+    quota("rendering", "aa" * 32, ProcessingState.RENDERING)
+    quota("old", "bb" * 32, ProcessingState.DONE)
+    quota("queued", "cc" * 32, ProcessingState.QUEUED)
+    # 等待渲染的两个 blob 在 LRU 中排在前面
+    artifact_quota._access[str(rendering)] = [1.0, 1, 0.0]
+    artifact_quota._access[str(queued)] = [2.0, 1, 0.0]
+    artifact_quota._access[str(old)] = [3.0, 1, 0.0]
+
+    removed = artifact_quota.enforce_quota()
+
+    # 跳过等待渲染的 blob，继续淘汰下一个
+    assert removed == 80
+    assert (rendering / "score.mid").exists()
+    assert not (old / "score.mid").exists()
+    assert (queued / "score.mid").exists()
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from fastapi import HTTPException
+
+from app import dependencies
+from app.auth import create_user_token
+from app.auth_cache import revoke_user_tokens
+from app.conftest import SyncSessionAdapter
+from app.models import User
+
+
+def test_token_user_is_served_from_cache_and_revocable(monkeypatch, sqlite_db):
+    session_factory, queries = sqlite_db
+    db = session_factory()
+    db.add(User(id="u-token", name="bob", hashed_password="x"))
+    db.commit()
+    monkeypatch.setattr(dependencies, "async_session", lambda: SyncSessionAdapter(session_factory()))
+    queries.clear()
+    header = "Bearer " + create_user_token("u-token", "bob", ["user"], ["upload_file"], 0)
+
+    user = asyncio.run(dependencies.get_token_user(header))
+    assert (user.id, user.name, user.permissions) == ("u-token", "bob", ("upload_file",))
+    # 之后的请求从缓存取令牌版本，不再查询
+    asyncio.run(dependencies.get_token_user(header))
+    assert len(queries) == 1
+
+    assert asyncio.run(revoke_user_tokens("u-token", SyncSessionAdapter(db))) == 1
+    assert any(query.lstrip().upper().startswith("UPDATE") and "RETURNING" in query.upper() for query in queries)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(dependencies.get_token_user(header))
+    assert exc_info.value.detail == "Token has been revoked"
+
+    new_header = "Bearer " + create_user_token("u-token", "bob", ["user"], ["upload_file"], 1)
+    assert asyncio.run(dependencies.get_token_user(new_header)).id == "u-token"
+    assert db.get(User, "u-token").token_version == 1
@@ -0,0 +1,31 @@
+import partitura
+
+from app.benchmark import DEFAULT_SCORES, compare_reports, lengthen_score
+
+
+def test_lengthen_score_repeats_measures(tmp_path):
+    score_path = DEFAULT_SCORES[1]
+    lengthened = lengthen_score(score_path, 3, tmp_path / "x3.musicxml")
+
+    original = partitura.load_musicxml(score_path)
+    longer = partitura.load_musicxml(lengthened)
+    assert len(longer.parts[0].notes_tied) == 3 * len(original.parts[0].notes_tied)
+
+
+def test_compare_reports_flags_regressions():
+    baseline = {"cases": {"a": {"stages": {
+        "parse": {"seconds": 1.0, "peak_rss_mb": 100.0, "output_bytes": 0},
+        "midi": {"seconds": 1.0, "peak_rss_mb": 100.0, "output_bytes": 10},
+    }}}}
+    current = {"cases": {"a": {"stages": {
+        "parse": {"seconds": 1.1, "peak_rss_mb": 150.0, "output_bytes": 0},
+        "midi": {"error": "ValueError: broken"},
+        "wav": {"error": "skipped, midi failed"},
+        "renditions": {"error": "skipped, midi failed"},
+        "features": {"error": "skipped, midi failed"},
+    }}}}
+
+    problems = compare_reports(baseline, current, threshold=0.2)
+    assert len(problems) == 2
+    assert problems[0].startswith("a/parse: peak_rss_mb")
+    assert problems[1].startswith("a/midi: failed")
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app import chunked_upload
+
+
+@pytest.fixture
+def partial_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunked_upload, "PARTIAL_UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+def test_read_chunk_stops_at_max_chunk_size(monkeypatch):
+    monkeypatch.setattr(chunked_upload, "MAX_CHUNK_SIZE", 10)
+    app = FastAPI()
+
+    @app.put("/chunk")
+    async def put(request: Request):
+        try:
+            return {"size": len(await chunked_upload.read_chunk(request))}
+        except HTTPException as e:
+            return {"error": e.status_code}
+
+    client = TestClient(app)
+    assert client.put("/chunk", content=b"x" * 10).json() == {"size": 10}
+    # 声明的长度过大时不读取请求体
+    assert client.put("/chunk", content=b"x" * 11).json() == {"error": 413}
+    # 没有 Content-Length 的流式请求体在超过上限时停止读取
+    assert client.put("/chunk", content=(b"xxxx" for _ in range(3))).json() == {"error": 413}
+
+
+def test_upload_state_is_dropped_after_finalize_and_expiry(partial_dir, monkeypatch):
+    state = chunked_upload.init_upload("u1", "score.musicxml", 6, False)
+    upload_id = state["upload_id"]
+    asyncio.run(chunked_upload.write_chunk(upload_id, "u1", 0, b"abc"))
+    assert chunked_upload._locks == {}
+
+    # 未完成时 finalize 失败，哈希状态也不再保留，继续上传时重新计算
+    with pytest.raises(HTTPException):
+        asyncio.run(chunked_upload.finalize_upload(upload_id, "u1"))
+    assert upload_id not in chunked_upload._hashers
+    asyncio.run(chunked_upload.write_chunk(upload_id, "u1", 3, b"def"))
+    data_path, content_hash, _ = asyncio.run(chunked_upload.finalize_upload(upload_id, "u1"))
+    assert upload_id not in chunked_upload._hashers
+    assert chunked_upload._locks == {}
+
+    expected = chunked_upload.new_score_hasher("score.musicxml")
+    expected.update(b"abcdef")
+    assert content_hash == expected.hexdigest()
+    # 由 store_score_blob 移入内容寻址存储
+    data_path.unlink()
+
+    # 放弃的上传在过期后连同哈希状态一起删除
+    abandoned = chunked_upload.init_upload("u1", "score.musicxml", None, False)["upload_id"]
+    monkeypatch.setattr(chunked_upload, "CHUNKED_UPLOAD_EXPIRE_HOURS", 0)
+    time.sleep(0.01)
+    assert chunked_upload.cleanup_expired_uploads() == 1
+    assert abandoned not in chunked_upload._hashers
+
+
+def test_upload_size_is_bounded(partial_dir, monkeypatch):
+    monkeypatch.setattr(chunked_upload, "MAX_UPLOAD_SIZE", 8)
+    with pytest.raises(HTTPException) as error:
+        chunked_upload.init_upload("u1", "score.musicxml", 9, False)
+    assert error.value.status_code == 413
+
+    # 未声明大小的上传同样受上限约束
+    upload_id = chunked_upload.init_upload("u1", "score.musicxml", None, False)["upload_id"]
+    asyncio.run(chunked_upload.write_chunk(upload_id, "u1", 0, b"x" * 8))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(chunked_upload.write_chunk(upload_id, "u1", 8, b"x"))
+    assert error.value.status_code == 413
+    assert chunked_upload.get_upload(upload_id, "u1")["received"] == 8
+
+
+def test_cleanup_removes_data_left_by_failed_finalize(partial_dir, monkeypatch):
+    upload_id = chunked_upload.init_upload("u1", "score.musicxml", 3, False)["upload_id"]
+    asyncio.run(chunked_upload.write_chunk(upload_id, "u1", 0, b"abc"))
+    data_path, _, _ = asyncio.run(chunked_upload.finalize_upload(upload_id, "u1"))
+    # 之后存储或提交失败，数据文件留在原处
+    assert data_path.exists()
+    assert chunked_upload.cleanup_expired_uploads() == 0
+    assert data_path.exists()
+
+    monkeypatch.setattr(chunked_upload, "CHUNKED_UPLOAD_EXPIRE_HOURS", 0)
+    time.sleep(0.01)
+    assert chunked_upload.cleanup_expired_uploads() == 1
+    assert not data_path.exists()
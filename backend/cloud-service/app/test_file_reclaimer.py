@@ -0,0 +1,52 @@
+import asyncio
+
+from app import file_reclaimer, score_store
+
+
+class _FakeSession:
+    """
+    只支持 reclaim 用到的方法；记录加锁的内容哈希，只对已加锁的哈希回答是否仍被引用
+    """
+    def __init__(self, referenced: set, locked: list):
+        self.referenced = referenced
+        self.locked = locked
+        self.current = None
+
+    async def execute(self, statement):
+        key = next(iter(statement.compile().params.values()))
+        self.current = next(h for h in ("aa" * 32, "bb" * 32) if score_store.blob_lock_key(h) == key)
+        self.locked.append(self.current)
+
+    async def scalar(self, statement):
+        assert self.current is not None, "references must be counted under the lock"
+        return "row" if self.current in self.referenced else None
+
+    async def commit(self):
+        self.current = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def test_reclaim_keeps_referenced_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(score_store, "BLOB_DIR", tmp_path / "blobs")
+    locked = []
+    monkeypatch.setattr(file_reclaimer, "async_session", lambda: _FakeSession({"bb" * 32}, locked))
+    for content_hash in ("aa" * 32, "bb" * 32):
+        score_store.blob_dir(content_hash).mkdir(parents=True)
+        (score_store.blob_dir(content_hash) / "score.musicxml").write_text("<score/>")
+    legacy_file = tmp_path / "legacy.mid"
+    legacy_file.write_bytes(b"MThd")
+
+    async def run():
+        file_reclaimer.schedule_reclaim(["aa" * 32, "bb" * 32, None], [legacy_file, tmp_path / "missing.wav"])
+        await file_reclaimer.drain(timeout=5)
+
+    asyncio.run(run())
+    assert not score_store.blob_dir("aa" * 32).exists()
+    assert score_store.blob_dir("bb" * 32).exists()
+    assert not legacy_file.exists()
+    assert locked == ["aa" * 32, "bb" * 32]
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.common import AudioFormat
+from app.file_streaming import file_validators, negotiate_audio_format, parse_range, serve_file
+
+
+@pytest.fixture
+def served(tmp_path):
+    """
+    只挂载 serve_file 的最小应用，返回 (客户端, 文件路径)
+    """
+    path = tmp_path / "score.mid"
+    path.write_bytes(bytes(range(256)) * 4)
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+
+    app = FastAPI()
+
+    @app.get("/file")
+    def get_file(request: Request):
+        return serve_file(request, path, media_type="audio/midi")
+
+    return TestClient(app), path
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=1000-", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+
+
+def test_negotiate_audio_format():
+    available = [AudioFormat.WAV, AudioFormat.FLAC, AudioFormat.OGG]
+    assert negotiate_audio_format("flac", None, available) == AudioFormat.FLAC
+    assert negotiate_audio_format(None, "*/*", available) == AudioFormat.WAV
+    assert negotiate_audio_format(None, "audio/flac;q=0.5, audio/ogg", available) == AudioFormat.OGG
+    assert negotiate_audio_format(None, "audio/ogg", [AudioFormat.WAV]) == AudioFormat.WAV
+
+
+def test_if_none_match_returns_304(served):
+    client, path = served
+    etag = client.get("/file").headers["etag"]
+
+    response = client.get("/file", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    # If-None-Match 优先于 If-Modified-Since
+    response = client.get("/file", headers={
+        "If-None-Match": '"other"',
+        "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT",
+    })
+    assert response.status_code == 200
+
+
+def test_if_modified_since_returns_304(served):
+    client, path = served
+    last_modified = client.get("/file").headers["last-modified"]
+
+    assert client.get("/file", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/file", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}).status_code == 200
+    assert client.get("/file", headers={"If-Modified-Since": "not a date"}).status_code == 200
+
+
+def test_if_range_mismatch_returns_full_file(served):
+    client, path = served
+    etag = client.get("/file").headers["etag"]
+
+    response = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10))
+    assert response.headers["content-range"] == "bytes 0-9/1024"
+
+    # 文件已变化，忽略 Range 返回完整文件
+    response = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == path.read_bytes()
+    assert "content-range" not in response.headers
+
+
+def test_manifest_validators_match_file_response(served):
+    client, path = served
+    validators = file_validators(path)
+    response = client.get("/file")
+
+    assert validators == {
+        "size": 1024,
+        "etag": response.headers["etag"],
+        "last_modified": response.headers["last-modified"],
+    }
+    # 客户端可以直接用清单中的校验信息发起条件请求
+    assert client.get("/file", headers={"If-None-Match": validators["etag"]}).status_code == 304
+    assert client.get("/file", headers={"If-Modified-Since": validators["last_modified"]}).status_code == 304
+
+    path.write_bytes(b"changed")
+    assert file_validators(path)["etag"] != validators["etag"]
+    assert client.get("/file", headers={"If-None-Match": validators["etag"]}).status_code == 200
@@ -0,0 +1,67 @@
+import asyncio
+
+from app import library_cache
+
+
+def test_read_through_caches_until_invalidated(monkeypatch):
+    monkeypatch.setattr(library_cache, "backend", library_cache.LRUCache(max_entries=8))
+    loads = []
+
+    async def load_page():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return {"data": [len(loads)]}
+
+    async def scenario():
+        # 并发的未命中只加载一次
+        pages = await asyncio.gather(*[
+            library_cache.read_through(("library", None, 10, None, "none"), load_page)
+            for _ in range(5)
+        ])
+        assert pages == [{"data": [1]}] * 5
+        assert await library_cache.read_through(("library", None, 10, None, "none"), load_page) == {"data": [1]}
+
+        await library_cache.invalidate_library()
+        assert await library_cache.read_through(("library", None, 10, None, "none"), load_page) == {"data": [2]}
+
+    asyncio.run(scenario())
+    assert len(loads) == 2
+
+
+def test_waiters_load_the_page_when_the_shared_load_is_cancelled(monkeypatch):
+    monkeypatch.setattr(library_cache, "backend", library_cache.LRUCache(max_entries=8))
+    started = asyncio.Event()
+
+    async def slow_page():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def fast_page():
+        return {"data": ["waiter"]}
+
+    async def scenario():
+        key_parts = ("library", None, 10, None, "none")
+        loading = asyncio.create_task(library_cache.read_through(key_parts, slow_page))
+        await started.wait()
+        waiter = asyncio.create_task(library_cache.read_through(key_parts, fast_page))
+        await asyncio.sleep(0)
+        # 负责加载的请求被取消，等待者不会一直挂起
+        loading.cancel()
+        assert await asyncio.wait_for(waiter, timeout=1) == {"data": ["waiter"]}
+        assert loading.cancelled()
+        assert library_cache._inflight == {}
+
+    asyncio.run(scenario())
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = library_cache.LRUCache(max_entries=2)
+
+    async def scenario():
+        await cache.set("a", 1, 60)
+        await cache.set("b", 2, 60)
+        assert await cache.get("a") == 1
+        await cache.set("c", 3, 60)
+        return await cache.get("a"), await cache.get("b"), await cache.get("c")
+
+    assert asyncio.run(scenario()) == (1, None, 3)
@@ -0,0 +1,49 @@
+import shutil
+import zipfile
+
+import numpy as np
+import partitura
+
+from pathlib import Path
+
+from app.note_index import BEAT_MAP_FIELDS, MEASURE_FIELDS, NOTE_FIELDS, compute_note_index, note_index_path
+
+BACH_FUGUE = Path(__file__).resolve().parents[3] / "resources" / "Bach-fugue_bwv_858.musicxml"
+
+
+def test_note_index_is_sorted_and_uncompressed(tmp_path):
+    score_path = tmp_path / "score.musicxml"
+    shutil.copyfile(BACH_FUGUE, score_path)
+
+    index_path = compute_note_index(score_path)
+    assert index_path == note_index_path(score_path)
+
+    # device-service 直接内存映射各个数组，成员不能压缩
+    with zipfile.ZipFile(index_path) as archive:
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    with np.load(index_path) as archive:
+        index = dict(archive)
+    assert set(index) == set(NOTE_FIELDS) | set(MEASURE_FIELDS) | set(BEAT_MAP_FIELDS)
+
+    notes = partitura.load_musicxml(BACH_FUGUE).parts[0].note_array()
+    assert len(index["pitch"]) == len(notes)
+    assert np.all(np.diff(index["onset_quarter"]) >= 0)
+    assert np.array_equal(np.sort(index["pitch"]), np.sort(notes["pitch"]))
+
+    # 每个音符的小节号与小节边界一致
+    starts = index["measure_start_quarter"]
+    positions = np.searchsorted(starts, index["onset_quarter"], side="right") - 1
+    assert np.array_equal(index["measure_number"][positions], index["measure"])
+
+
+def test_beat_map_matches_partitura(tmp_path):
+    score_path = tmp_path / "score.musicxml"
+    shutil.copyfile(BACH_FUGUE, score_path)
+    with np.load(compute_note_index(score_path)) as archive:
+        index = dict(archive)
+
+    part = partitura.load_score_as_part(str(BACH_FUGUE))
+    assert np.all(np.diff(index["beat_map_beat"]) > 0)
+    beats = np.linspace(index["beat_map_beat"][0], index["beat_map_beat"][-1], 1000)
+    expected = part.quarter_map(part.inv_beat_map(beats))
+    assert np.allclose(np.interp(beats, index["beat_map_beat"], index["beat_map_quarter"]), expected)
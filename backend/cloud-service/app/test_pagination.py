@@ -0,0 +1,17 @@
+import pytest
+
+from datetime import datetime, timezone
+
+from app.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 15, 2, 44, 861530, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, "a1b2c3d4")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "a1b2c3d4")
+
+
+def test_invalid_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
@@ -0,0 +1,29 @@
+import asyncio
+
+from passlib.context import CryptContext
+
+from app import password_hashing
+from app.password_hashing import PasswordHashingBusy, hash_password_async, verify_password_async
+
+
+def test_verify_rehashes_when_rounds_change(monkeypatch):
+    old_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+    stored = old_context.hash("secret")
+    monkeypatch.setattr(password_hashing, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+
+    verified, new_hash = asyncio.run(verify_password_async("secret", stored))
+    assert verified and new_hash.startswith("$2b$05$")
+    assert asyncio.run(verify_password_async("secret", new_hash)) == (True, None)
+    assert asyncio.run(verify_password_async("wrong", stored)) == (False, None)
+
+
+def test_hashing_rejects_work_over_the_limit(monkeypatch):
+    monkeypatch.setattr(password_hashing, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=10))
+    monkeypatch.setattr(password_hashing, "PASSWORD_HASH_MAX_PENDING", 1)
+
+    async def scenario():
+        return await asyncio.gather(hash_password_async("a"), hash_password_async("b"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert results[0].startswith("$2b$10$")
+    assert isinstance(results[1], PasswordHashingBusy)
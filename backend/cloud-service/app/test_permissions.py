@@ -0,0 +1,51 @@
+import asyncio
+
+from sqlalchemy import delete
+
+from app.conftest import SyncSessionAdapter
+from app.models import Permission, Role, RolePermission, User, UserRole
+from app.permissions import invalidate_permissions
+from app.utils import has_permission
+
+
+def _add_roles(db):
+    db.add_all([
+        User(id="u1", name="alice", hashed_password="x"),
+        Role(id="r-user", name="user"),
+        Role(id="r-admin", name="admin"),
+        Permission(id="p-upload", name="upload_file"),
+        Permission(id="p-delete", name="delete_file"),
+    ])
+    db.flush()
+    db.add_all([
+        RolePermission(role_id="r-user", permission_id="p-upload"),
+        RolePermission(role_id="r-admin", permission_id="p-upload"),
+        RolePermission(role_id="r-admin", permission_id="p-delete"),
+        UserRole(user_id="u1", role_id="r-user"),
+    ])
+    db.commit()
+
+
+def test_has_permission_is_cached_until_invalidated(sqlite_db):
+    invalidate_permissions()
+    session_factory, queries = sqlite_db
+    sync_db = session_factory()
+    _add_roles(sync_db)
+    db = SyncSessionAdapter(sync_db)
+    queries.clear()
+
+    assert asyncio.run(has_permission("u1", "upload_file", db))
+    assert not asyncio.run(has_permission("u1", "delete_file", db))
+    # 全部权限由一次联表查询取出
+    assert len(queries) == 1
+
+    sync_db.execute(delete(UserRole).where(UserRole.user_id == "u1"))
+    sync_db.add(UserRole(user_id="u1", role_id="r-admin"))
+    sync_db.commit()
+    # 角色变化后缓存失效前仍使用旧的权限
+    assert not asyncio.run(has_permission("u1", "delete_file", db))
+
+    invalidate_permissions("u1")
+    queries.clear()
+    assert asyncio.run(has_permission("u1", "delete_file", db))
+    assert len(queries) == 1
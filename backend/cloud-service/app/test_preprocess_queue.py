@@ -0,0 +1,138 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import preprocess_queue
+from app.common import ProcessingState
+from app.models import UploadedFile
+
+HASH1, HASH2, HASH3, HASH4 = "1a" * 32, "2b" * 32, "3c" * 32, "4d" * 32
+
+
+@pytest.fixture
+def queue_db(sqlite_db, monkeypatch):
+    """
+    预处理队列使用内存 sqlite；返回 (添加记录, 查询状态) 两个函数
+    """
+    session_factory, _ = sqlite_db
+    monkeypatch.setattr(preprocess_queue, "SessionLocal", session_factory)
+    monkeypatch.setattr(preprocess_queue, "engine", session_factory.kw["bind"])
+    monkeypatch.setattr(preprocess_queue, "_requeue_connection", None)
+    monkeypatch.setattr(preprocess_queue, "request_quota_check", lambda keep=(): None)
+
+    def add(file_id, content_hash, state=ProcessingState.QUEUED):
+        with session_factory() as db:
+            db.add(UploadedFile(
+                id=file_id,
+                filename=f"{file_id}.musicxml",
+                filepath=f"/blobs/{content_hash}/score.musicxml",
+                content_hash=content_hash,
+                user_id="user",
+                processing_state=state.value,
+            ))
+            db.commit()
+
+    def get(file_id):
+        with session_factory() as db:
+            return db.get(UploadedFile, file_id)
+
+    yield add, get
+    if preprocess_queue._requeue_connection is not None:
+        preprocess_queue._requeue_connection.close()
+
+
+def test_job_renders_and_fills_in_waiting_twins(queue_db, monkeypatch):
+    add, get = queue_db
+    add("a", HASH1)
+    add("twin", HASH1)
+    add("other", HASH2)
+    states = []
+
+    def render(score_path, log_name):
+        states.append((get("a").processing_state, get("twin").processing_state))
+        return f"/blobs/{HASH1}/score.mid", f"/blobs/{HASH1}/score.wav"
+
+    monkeypatch.setattr(preprocess_queue, "render_score_artifacts", render)
+    monkeypatch.setattr(preprocess_queue, "_read_metadata", lambda score_path, log_name: {"title": "Fugue"})
+
+    assert preprocess_queue.run_preprocess_job("a", f"/blobs/{HASH1}/score.musicxml") == ProcessingState.DONE.value
+    assert states == [(ProcessingState.RENDERING.value, ProcessingState.RENDERING.value)]
+    for file_id in ("a", "twin"):
+        uploaded_file = get(file_id)
+        assert uploaded_file.processing_state == ProcessingState.DONE.value
+        assert uploaded_file.midi_path == f"/blobs/{HASH1}/score.mid"
+        assert uploaded_file.title == "Fugue"
+    assert get("other").processing_state == ProcessingState.QUEUED.value
+
+
+def test_failed_job_fails_waiting_twins(queue_db, monkeypatch):
+    add, get = queue_db
+    add("a", HASH1)
+    add("twin", HASH1)
+    add("done", HASH1, ProcessingState.DONE)
+
+    def render(score_path, log_name):
+        raise RuntimeError("fluidsynth failed")
+
+    monkeypatch.setattr(preprocess_queue, "render_score_artifacts", render)
+
+    assert preprocess_queue.run_preprocess_job("a", f"/blobs/{HASH1}/score.musicxml") == ProcessingState.FAILED.value
+    for file_id in ("a", "twin"):
+        assert get(file_id).processing_state == ProcessingState.FAILED.value
+        assert get(file_id).processing_error == "fluidsynth failed"
+    # 已完成的记录不受影响
+    assert get("done").processing_state == ProcessingState.DONE.value
+
+
+def test_crashed_job_is_marked_failed(queue_db, monkeypatch):
+    add, get = queue_db
+    add("a", HASH1, ProcessingState.RENDERING)
+
+    class _CrashedExecutor:
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_exception(BrokenProcessPool("worker died"))
+            return future
+
+    monkeypatch.setattr(preprocess_queue, "get_executor", lambda: _CrashedExecutor())
+    preprocess_queue.submit_preprocess("a", f"/blobs/{HASH1}/score.musicxml")
+
+    uploaded_file = get("a")
+    assert uploaded_file.processing_state == ProcessingState.FAILED.value
+    assert uploaded_file.processing_error == "worker died"
+
+
+def test_requeue_submits_one_job_per_content_hash(queue_db, monkeypatch):
+    add, get = queue_db
+    add("queued", HASH1)
+    add("twin", HASH1, ProcessingState.RENDERING)
+    add("rendering", HASH2, ProcessingState.RENDERING)
+    add("done", HASH3, ProcessingState.DONE)
+    add("failed", HASH4, ProcessingState.FAILED)
+    submitted = []
+    monkeypatch.setattr(preprocess_queue, "submit_preprocess", lambda file_id, score_path: submitted.append(file_id))
+
+    assert preprocess_queue.requeue_pending_jobs() == 2
+    # 相同内容的两条记录只提交一个任务，已完成和失败的记录不提交
+    assert "rendering" in submitted
+    assert len(set(submitted) & {"queued", "twin"}) == 1
+
+    # 已持有锁的 worker 不会再次提交
+    assert preprocess_queue.requeue_pending_jobs() == 0
+    assert len(submitted) == 2
+
+
+def test_requeue_is_skipped_without_the_lock(queue_db, monkeypatch):
+    add, get = queue_db
+    add("queued", HASH1)
+    submitted = []
+    monkeypatch.setattr(preprocess_queue, "submit_preprocess", lambda file_id, score_path: submitted.append(file_id))
+
+    # 另一个 worker 已持有锁
+    engine = preprocess_queue.engine
+    with engine.connect() as connection:
+        connection.connection.driver_connection.create_function("pg_try_advisory_lock", 1, lambda key: False)
+    assert preprocess_queue.requeue_pending_jobs() == 0
+    assert submitted == []
+    assert preprocess_queue._requeue_connection is None
@@ -0,0 +1,41 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import query_metrics
+from app.query_metrics import QueryMetricsMiddleware, get_query_metrics, instrument_engine
+
+
+def test_queries_are_counted_per_route(monkeypatch):
+    monkeypatch.setattr(query_metrics, "N_PLUS_ONE_THRESHOLD", 5)
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    app = FastAPI()
+    app.add_middleware(QueryMetricsMiddleware)
+
+    @app.get("/items/{count}")
+    async def items(count: int):
+        with engine.connect() as conn:
+            for i in range(count):
+                conn.execute(text("SELECT :i"), {"i": i})
+        return {"count": count}
+
+    get_query_metrics(reset=True)
+    client = TestClient(app)
+    response = client.get("/items/2")
+    assert response.headers["Server-Timing"].endswith('desc="2 queries"')
+    client.get("/items/8")
+
+    # 请求之外的查询不计入统计
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    stats = get_query_metrics(reset=True)["GET /items/{count}"]
+    assert stats["requests"] == 2
+    assert stats["queries"] == 10
+    assert stats["max_queries"] == 8
+    assert stats["suspected_n_plus_one"] == 1
+    assert stats["most_repeated_count"] == 8
+    assert stats["most_repeated_statement"] == "SELECT ?"
+    assert get_query_metrics() == {}
@@ -0,0 +1,12 @@
+from app import reference_features
+from app.reference_features import REFERENCE_FEATURE_VERSION, feature_fingerprint, get_feature_version
+
+
+def test_feature_version_covers_method_and_matchmaker(monkeypatch):
+    fingerprint = feature_fingerprint()
+    assert get_feature_version(fingerprint) == REFERENCE_FEATURE_VERSION
+    assert get_feature_version(dict(reversed(list(fingerprint.items())))) == REFERENCE_FEATURE_VERSION
+
+    assert get_feature_version({**fingerprint, "method": "dixon"}) != REFERENCE_FEATURE_VERSION
+    monkeypatch.setattr(reference_features.matchmaker, "__version__", "99.0.0")
+    assert get_feature_version(feature_fingerprint()) != REFERENCE_FEATURE_VERSION
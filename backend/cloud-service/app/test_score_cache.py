@@ -0,0 +1,23 @@
+import shutil
+
+import numpy as np
+import partitura
+
+from pathlib import Path
+
+from app.score_cache import load_score_cached, parsed_score_path
+
+BACH_PRELUDE = Path(__file__).resolve().parents[3] / "resources" / "Bach-prelude_bwv_846.musicxml"
+
+
+def test_load_score_cached_reuses_parsed_score(tmp_path):
+    score_path = tmp_path / "score.musicxml"
+    shutil.copyfile(BACH_PRELUDE, score_path)
+
+    parsed = load_score_cached(score_path)
+    assert parsed_score_path(score_path).exists()
+
+    cached = load_score_cached(score_path)
+    expected = partitura.load_musicxml(BACH_PRELUDE)
+    assert np.array_equal(cached.note_array(), expected.note_array())
+    assert np.array_equal(cached.note_array(), parsed.note_array())
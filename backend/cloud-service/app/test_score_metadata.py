@@ -0,0 +1,57 @@
+import partitura
+import pytest
+
+from pathlib import Path
+from sqlalchemy.dialects import postgresql
+
+from app.library_search import build_search_query, escape_like
+from app.models import UploadedFile
+from app.score_metadata import METADATA_FIELDS, copy_metadata, extract_score_metadata
+
+BACH_PRELUDE = Path(__file__).resolve().parents[3] / "resources" / "Bach-prelude_bwv_846.musicxml"
+
+
+def _compile(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_extract_score_metadata():
+    metadata = extract_score_metadata(partitura.load_musicxml(BACH_PRELUDE))
+
+    assert set(metadata) == set(METADATA_FIELDS)
+    assert metadata["title"] == "Prelude and Fugue in C major, BWV 846"
+    assert metadata["composer"] == "J.S. Bach (1685-1750)"
+    assert metadata["part_count"] == 1
+    assert metadata["key_signature"] == "C"
+    assert metadata["time_signature"] == "4/4"
+    assert metadata["measure_count"] == 5
+    assert metadata["note_count"] == 69
+    assert metadata["duration_seconds"] == 20.0
+
+
+def test_copy_metadata_from_same_content():
+    source = UploadedFile(title="Prelude", composer="Bach", note_count=69, part_count=1)
+    target = UploadedFile()
+    assert copy_metadata(source, target)
+    assert (target.title, target.composer, target.note_count) == ("Prelude", "Bach", 69)
+
+    assert not copy_metadata(UploadedFile(), UploadedFile())
+    assert not copy_metadata(None, UploadedFile())
+
+
+def test_build_search_query():
+    sql = _compile(build_search_query("  bach   prelude ", key="C", min_duration=10, sort="relevance", limit=11))
+    assert "search_vector @@ websearch_to_tsquery('simple'::regconfig, 'bach prelude')" in sql
+    assert "uploaded_files.filename ILIKE '%%bach prelude%%'" in sql
+    assert "'bach prelude' <%% uploaded_files.title" in sql
+    assert "uploaded_files.key_signature = 'C'" in sql
+    assert "ORDER BY ts_rank" in sql
+
+    # 没有搜索词时按上传时间排序
+    sql = _compile(build_search_query(None, sort="relevance"))
+    assert "websearch_to_tsquery" not in sql
+    assert "ORDER BY uploaded_files.created_at DESC NULLS LAST" in sql
+
+    assert escape_like("50%_a\\b") == "50\\%\\_a\\\\b"
+    with pytest.raises(ValueError):
+        build_search_query("bach", sort="size")
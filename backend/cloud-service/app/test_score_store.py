@@ -0,0 +1,21 @@
+import hashlib
+
+from app.score_store import ScoreHasher, new_score_hasher
+
+
+def _digest(data: bytes, chunk_size: int, hasher: ScoreHasher) -> str:
+    for i in range(0, len(data), chunk_size):
+        hasher.update(data[i:i + chunk_size])
+    return hasher.hexdigest()
+
+
+def test_score_hasher_normalizes_line_endings_and_bom():
+    expected = hashlib.sha256(b"<score>\n<part/>\n</score>\n").hexdigest()
+    data = b"\xef\xbb\xbf<score>\r\n<part/>\r</score>\r"
+    for chunk_size in (1, 2, 3, 7, 1024):
+        assert _digest(data, chunk_size, ScoreHasher()) == expected
+
+
+def test_score_hasher_keeps_binary_scores_as_is():
+    data = b"PK\x03\x04\r\n"
+    assert _digest(data, 2, new_score_hasher("bwv846.mxl")) == hashlib.sha256(data).hexdigest()
@@ -1,14 +1,21 @@
 import partitura
 import tempfile
+import uuid
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
 
 from pathlib import Path
 from typing import Optional
 
 from sqlalchemy.orm import Session
-from app.models import User, Permission, UserRole, RolePermission
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User, Permission
+from app.permissions import get_permissions
 from app.auth import hash_password
-from app.common import GetFileType
-from app.config import UPLOAD_DIR
+from app.common import GetFileType, AudioFormat
+from app.score_cache import load_score_cached
 # 创建临时目录
 TEMP_DIR = Path(tempfile.gettempdir()) / "score_evaluation"
 TEMP_DIR.mkdir(exist_ok=True)
@@ -30,20 +37,22 @@ def create_user(db: Session, email: str, username: str, password: str, permissio
     return new_user
 
 # 用户是否有对应权限
-def has_permission(user_id: str, permission_name: str, db: Session) -> bool:
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id).all()
-    for user_role in user_roles:
-        role_permissions = db.query(RolePermission).filter(RolePermission.role_id == user_role.role_id).all()
-        for role_permission in role_permissions:
-            permission = db.query(Permission).filter(Permission.id == role_permission.permission_id).first()
-            if permission and permission.name == permission_name:
-                return True
-    return False
+async def has_permission(user_id: str, permission_name: str, db: AsyncSession) -> bool:
+    return permission_name in await get_permissions(user_id, db)
+
+def _tmp_output_path(path: Path) -> Path:
+    # 保留扩展名，写完后再原子替换，避免并发任务读到半成品
+    return path.with_name(f"{path.stem}.{uuid.uuid4().hex[:8]}.tmp{path.suffix}")
+
 
 def preprocess_score(score_xml: Path) -> tuple[str, str]:
     """
     Preprocess the score xml file to midi and audio file
 
+    The artifacts are written next to the score. Artifacts that already exist
+    (e.g. the same score was uploaded before) are reused as is. The parsed
+    score is cached as well, see ``load_score_cached``.
+
     Parameters
     ----------
     score_xml : Path
@@ -54,17 +63,78 @@ def preprocess_score(score_xml: Path) -> tuple[str, str]:
     tuple[str, str]
         Paths to the generated MIDI and audio files
     """
-    score_obj = partitura.load_musicxml(score_xml)
+    score_midi_path = score_xml.with_suffix(".mid")
+    score_audio_path = score_xml.with_suffix(".wav")
+    if score_midi_path.exists() and score_audio_path.exists():
+        return score_midi_path, score_audio_path
+
+    score_obj = load_score_cached(score_xml)
 
-    score_midi_path = UPLOAD_DIR / f"{score_xml.stem}.mid"
-    partitura.save_score_midi(score_obj, score_midi_path)
+    if not score_midi_path.exists():
+        tmp_path = _tmp_output_path(score_midi_path)
+        partitura.save_score_midi(score_obj, tmp_path)
+        tmp_path.replace(score_midi_path)
 
-    score_audio_path = UPLOAD_DIR / f"{score_xml.stem}.wav"
-    partitura.save_wav_fluidsynth(score_obj, score_audio_path)
+    if not score_audio_path.exists():
+        tmp_path = _tmp_output_path(score_audio_path)
+        partitura.save_wav_fluidsynth(score_obj, tmp_path)
+        tmp_path.replace(score_audio_path)
 
     return score_midi_path, score_audio_path
 
 
+def audio_rendition_path(score_audio_path: Path, audio_format: AudioFormat) -> Path:
+    """
+    压缩音频与 WAV 放在同一目录，仅扩展名不同
+    """
+    return Path(score_audio_path).with_suffix(f".{audio_format.value}")
+
+
+def encode_audio_renditions(score_audio_path: Path) -> dict[AudioFormat, Path]:
+    """
+    Encode compressed renditions of the rendered score audio
+
+    FLAC keeps the original sample rate. Opus only supports 48 kHz, so the
+    audio is resampled before it is written into an Ogg container.
+
+    Parameters
+    ----------
+    score_audio_path : Path
+        Path to the WAV file rendered by fluidsynth
+
+    Returns
+    -------
+    dict[AudioFormat, Path]
+        Paths to the compressed files, existing files are reused
+    """
+    renditions = {
+        AudioFormat.FLAC: audio_rendition_path(score_audio_path, AudioFormat.FLAC),
+        AudioFormat.OGG: audio_rendition_path(score_audio_path, AudioFormat.OGG),
+    }
+    if all(path.exists() for path in renditions.values()):
+        return renditions
+
+    data, sample_rate = sf.read(str(score_audio_path), dtype="float32", always_2d=True)
+
+    flac_path = renditions[AudioFormat.FLAC]
+    if not flac_path.exists():
+        tmp_path = _tmp_output_path(flac_path)
+        sf.write(str(tmp_path), data, sample_rate, format="FLAC")
+        tmp_path.replace(flac_path)
+
+    ogg_path = renditions[AudioFormat.OGG]
+    if not ogg_path.exists():
+        opus_rate = 48000
+        if sample_rate != opus_rate:
+            gcd = np.gcd(sample_rate, opus_rate)
+            data = resample_poly(data, opus_rate // gcd, sample_rate // gcd, axis=0).astype(np.float32)
+        tmp_path = _tmp_output_path(ogg_path)
+        sf.write(str(tmp_path), np.clip(data, -1.0, 1.0), opus_rate, format="OGG", subtype="OPUS")
+        tmp_path.replace(ogg_path)
+
+    return renditions
+
+
 async def find_file_by_id(file_id: str, file_type: GetFileType) -> Optional[Path]:
     
     return None
@@ -14,4 +14,7 @@ $do$;
 ALTER USER imusicuser WITH SUPERUSER;
 GRANT ALL PRIVILEGES ON DATABASE imusicdb TO imusicuser;
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO imusicuser;
-GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO imusicuser;
\ No newline at end of file
+GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO imusicuser;
+
+-- 曲目库搜索的三元组索引需要 pg_trgm 扩展
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
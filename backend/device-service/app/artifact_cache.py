@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import aiohttp
+
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .config import ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES, ARTIFACT_HTTP_CONNECTIONS
+
+# 每个产物目录中的元数据文件：ETag、Last-Modified、有效期和文件名，修改时间即最近使用时间
+META_FILE = "meta.json"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 没有 meta.json 的目录视为正在下载，超过该秒数仍没有时视为中断的下载残留，可以淘汰
+INCOMPLETE_GRACE_SECONDS = 3600
+
+_session: Optional[aiohttp.ClientSession] = None
+# 同一产物的并发请求只下载一次 {file_id/key: [锁, 正在使用的请求数]}，没有请求使用时删除
+_locks: dict[str, list] = {}
+
+# 淘汰在线程池中执行，以下状态由 _state_lock 保护：
+# 正在下载或校验的产物目录，以及会话正在使用的产物目录 {目录: 引用数}
+_state_lock = threading.Lock()
+_busy: set = set()
+_pinned: dict[Path, int] = {}
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    所有下载共用一个带连接池的会话，与 cloud-service 的连接保持复用
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ARTIFACT_HTTP_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60),
+        )
+    return _session
+
+
+async def close_http_session() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def entry_dir(file_id: str, key: str) -> Path:
+    return ARTIFACT_CACHE_DIR / file_id / key
+
+
+def pin(paths: Iterable[Optional[Path]]) -> None:
+    """
+    会话使用期间不淘汰这些文件所在的产物目录，与 unpin 成对调用
+    """
+    with _state_lock:
+        for path in paths:
+            if path is not None:
+                _pinned[path.parent] = _pinned.get(path.parent, 0) + 1
+
+
+def unpin(paths: Iterable[Optional[Path]]) -> None:
+    with _state_lock:
+        for path in paths:
+            if path is None:
+                continue
+            count = _pinned.get(path.parent, 0) - 1
+            if count > 0:
+                _pinned[path.parent] = count
+            else:
+                _pinned.pop(path.parent, None)
+
+
+@asynccontextmanager
+async def _artifact_lock(name: str):
+    entry = _locks.setdefault(name, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _locks.pop(name, None)
+
+
+def _is_pinned(directory: Path) -> bool:
+    with _state_lock:
+        return directory in _pinned
+
+
+def _read_meta(directory: Path) -> Optional[dict]:
+    try:
+        meta = json.loads((directory / META_FILE).read_text(encoding="utf-8"))
+        if (directory / meta["filename"]).exists():
+            return meta
+    except Exception:
+        pass
+    return None
+
+
+def _write_meta(directory: Path, meta: dict) -> None:
+    tmp_path = directory / f"{META_FILE}.{uuid.uuid4().hex[:8]}.tmp"
+    tmp_path.write_text(json.dumps(meta), encoding="utf-8")
+    tmp_path.replace(directory / META_FILE)
+
+
+def _max_age(cache_control: Optional[str]) -> int:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    if not match or "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    return int(match.group(1))
+
+
+def _filename(content_disposition: Optional[str]) -> Optional[str]:
+    match = re.search(r'filename="([^"]+)"', content_disposition or "")
+    # 文件名来自响应头，只保留最后一段，避免写到缓存目录之外
+    return Path(match.group(1)).name if match else None
+
+
+async def fetch_artifact(file_id: str, key: str, url: str) -> Optional[Path]:
+    """
+    Return a local copy of a cloud-service file, downloading it only if needed
+
+    Entries are stored under ``<ARTIFACT_CACHE_DIR>/<file_id>/<key>/`` with
+    the validators of the response. A copy within its ``max-age`` is used
+    without any request. An expired copy is revalidated with ``If-None-Match``
+    / ``If-Modified-Since``, and a ``304`` costs no transfer. If cloud-service
+    cannot be reached, a cached copy is used as is.
+
+    Parameters
+    ----------
+    file_id : str
+        ID of the uploaded file
+    key : str
+        Name of the artifact within the file, including its version
+    url : str
+        cloud-service URL of the artifact
+
+    Returns
+    -------
+    Path or None
+        The cached file, keeping the original file name (partitura picks the
+        parser by extension), or None if cloud-service does not have it
+    """
+    directory = entry_dir(file_id, key)
+    async with _artifact_lock(f"{file_id}/{key}"):
+        # 标记后淘汰不会删除该目录；正在被淘汰时等待删除完成，之后按没有缓存处理
+        with _state_lock:
+            _busy.add(directory)
+        try:
+            path, downloaded = await _fetch_locked(directory, url)
+        finally:
+            with _state_lock:
+                _busy.discard(directory)
+
+    if downloaded:
+        await asyncio.get_running_loop().run_in_executor(None, enforce_budget, {directory})
+    return path
+
+
+async def _fetch_locked(directory: Path, url: str) -> tuple[Optional[Path], bool]:
+    """
+    在产物的锁内获取文件，返回 (路径, 是否新下载)
+    """
+    meta = _read_meta(directory)
+    if meta is not None and meta.get("expires_at", 0) > time.time():
+        (directory / META_FILE).touch()
+        return directory / meta["filename"], False
+
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        async with get_http_session().get(url, headers=headers) as response:
+            if response.status == 304 and meta is not None:
+                meta["expires_at"] = time.time() + _max_age(response.headers.get("Cache-Control"))
+                _write_meta(directory, meta)
+                return directory / meta["filename"], False
+
+            if response.status != 200:
+                logging.error(f"Failed to get file from cloud: {response.status} {url}")
+                if response.status == 404:
+                    # 产物已不存在（例如版本变化），旧副本不再使用；会话正在使用时留给之后的淘汰删除
+                    if not _is_pinned(directory):
+                        await asyncio.to_thread(shutil.rmtree, directory, ignore_errors=True)
+                    return None, False
+                return (directory / meta["filename"] if meta is not None else None), False
+
+            filename = _filename(response.headers.get("Content-Disposition"))
+            if not filename:
+                logging.error(f"no original filename: {response.status}")
+                return None, False
+
+            # 先写临时文件再原子替换，下载中断时不会留下半成品
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = directory / f".{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                # 磁盘写入在线程池中执行，不阻塞事件循环
+                f = await asyncio.to_thread(open, tmp_path, "wb")
+                try:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+                if meta is not None and meta["filename"] != filename:
+                    (directory / meta["filename"]).unlink(missing_ok=True)
+                tmp_path.replace(directory / filename)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+            _write_meta(directory, {
+                "filename": filename,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "expires_at": time.time() + _max_age(response.headers.get("Cache-Control")),
+            })
+            return directory / filename, True
+    except aiohttp.ClientError as e:
+        logging.error(f"Error getting file from cloud: {e}")
+        return (directory / meta["filename"] if meta is not None else None), False
+
+
+def enforce_budget(keep: set = frozenset()) -> int:
+    """
+    Evict least recently used artifacts until the cache fits the budget
+
+    Entries that are being downloaded or revalidated, or whose files are
+    used by a session (see ``pin``), are never evicted. An entry without
+    ``meta.json`` is a download in progress; it is only evicted once it is
+    older than ``INCOMPLETE_GRACE_SECONDS`` (left over by an interrupted
+    download).
+
+    Parameters
+    ----------
+    keep : set
+        Entry directories that must not be evicted (e.g. just downloaded)
+
+    Returns
+    -------
+    int
+        Number of bytes freed
+    """
+    if ARTIFACT_CACHE_MAX_BYTES <= 0 or not ARTIFACT_CACHE_DIR.exists():
+        return 0
+
+    entries = []  # (last_used, size, directory)
+    total = 0
+    now = time.time()
+    for directory in ARTIFACT_CACHE_DIR.glob("*/*"):
+        try:
+            if not directory.is_dir():
+                continue
+            size = sum(path.stat().st_size for path in directory.iterdir() if path.is_file())
+            meta_path = directory / META_FILE
+            if meta_path.exists():
+                last_used = meta_path.stat().st_mtime
+            elif now - directory.stat().st_mtime > INCOMPLETE_GRACE_SECONDS:
+                last_used = 0
+            else:
+                # 正在下载，计入大小但不淘汰
+                total += size
+                continue
+        except FileNotFoundError:
+            # 被并发的下载或淘汰删除
+            continue
+        entries.append((last_used, size, directory))
+        total += size
+
+    freed = 0
+    for last_used, size, directory in sorted(entries, key=lambda entry: entry[0]):
+        if total - freed <= ARTIFACT_CACHE_MAX_BYTES:
+            break
+        if directory in keep:
+            continue
+        # 检查和删除都在锁内，开始下载的目录不会在之后被删除
+        with _state_lock:
+            if directory in _busy or directory in _pinned:
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+        freed += size
+        # 删除空的 file_id 目录
+        try:
+            directory.parent.rmdir()
+        except OSError:
+            pass
+    if freed:
+        print(f"Evicted {freed / 1024 ** 2:.1f} MB from the artifact cache")
+    return freed
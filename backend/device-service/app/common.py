@@ -10,3 +10,5 @@ class GetFileType(Enum):
     SCORE_FILE = "score"
     AUDIO_FILE = "audio"
     MIDI_FILE = "midi"
+    FEATURES_FILE = "features"
+    NOTE_INDEX_FILE = "note_index"
@@ -1,5 +1,38 @@
+import os
+import tempfile
+
+from pathlib import Path
+
 SAMPLE_RATE = 44100
 FRAME_RATE = 30
 HOP_LENGTH = SAMPLE_RATE // FRAME_RATE
 N_FFT = 2 * HOP_LENGTH
 SOUND_FONT_PATH = "~/soundfonts/sf2/MuseScore_General.sf2"
+
+
+# score following 参数
+FOLLOWER_FRAME_RATE = 86
+
+# 参考特征配置，需要与 cloud-service 中的 REFERENCE_FEATURE_CONFIG 保持一致
+REFERENCE_FEATURE_CONFIG = {
+    "input_type": "audio",
+    "frame_rate": FOLLOWER_FRAME_RATE,
+    "method": "arzt",
+}
+
+# 同时进行的 score following 会话数上限（每个会话占用一个工作线程），超出时拒绝新的会话
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "4"))
+# 指标接口中保留的已结束会话数
+SESSION_HISTORY = int(os.getenv("SESSION_HISTORY", "20"))
+
+# 预先构建（arm）的 follower 数上限，超出时丢弃最早构建的
+ARMED_POOL_SIZE = int(os.getenv("ARMED_POOL_SIZE", "2"))
+# 预先构建的 follower 闲置超过该秒数后丢弃
+ARMED_IDLE_SECONDS = int(os.getenv("ARMED_IDLE_SECONDS", "300"))
+
+# 从 cloud-service 下载的乐谱及其产物的本地缓存，重启服务后仍然有效
+ARTIFACT_CACHE_DIR = Path(os.getenv("ARTIFACT_CACHE_DIR", str(Path(tempfile.gettempdir()) / "score_following_cache")))
+# 缓存大小上限，超出后淘汰最久未使用的产物；0 表示不限制
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# 与 cloud-service 之间复用的 HTTP 连接数上限
+ARTIFACT_HTTP_CONNECTIONS = int(os.getenv("ARTIFACT_HTTP_CONNECTIONS", "8"))
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+
+from collections import OrderedDict
+from typing import Optional
+
+from .config import ARMED_IDLE_SECONDS, ARMED_POOL_SIZE
+from .utils import ArmedFollower, build_follower, prepare_score_following, release_files
+
+
+def follower_key(file_id: str, input_type: str, is_performce_model: bool, device: Optional[int]) -> tuple:
+    # 现场输入时 follower 的输入流绑定到设备，performance 模式与设备无关
+    return (file_id, input_type, bool(is_performce_model), None if is_performce_model else device)
+
+
+class FollowerPool:
+    """
+    Followers built ahead of time, so that starting a session only starts streaming
+
+    ``arm`` downloads the files of a score and builds its follower (note
+    index, reference features, ``Matchmaker`` and its input stream) in a
+    worker thread. ``take`` hands an armed follower to a session; a
+    ``Matchmaker`` consumes its stream, so each one is used by one session
+    only. At most ``ARMED_POOL_SIZE`` followers are kept, the oldest are
+    dropped first, and followers not taken within ``ARMED_IDLE_SECONDS``
+    are dropped by a background sweep. A dropped follower closes its input
+    stream, and a live input device held by an armed follower counts as in
+    use when sessions are admitted (see ``live_devices``).
+    """
+
+    def __init__(self, max_size: int = ARMED_POOL_SIZE, idle_seconds: int = ARMED_IDLE_SECONDS):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._armed: OrderedDict[tuple, ArmedFollower] = OrderedDict()
+        # 正在构建的 follower，同一乐谱的并发请求共用一次构建
+        self._arming: dict[tuple, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def arm(self, file_id: str, input_type: str, is_performce_model: bool, device: Optional[int]) -> ArmedFollower:
+        key = follower_key(file_id, input_type, is_performce_model, device)
+        follower = self._armed.get(key)
+        if follower is not None:
+            follower.last_used = time.time()
+            self._armed.move_to_end(key)
+            return follower
+
+        task = self._arming.get(key)
+        if task is None:
+            task = asyncio.create_task(self._build(key))
+            self._arming[key] = task
+            task.add_done_callback(lambda _: self._arming.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _build(self, key: tuple) -> ArmedFollower:
+        file_id, input_type, is_performce_model, device = key
+        started = time.time()
+        files = await prepare_score_following(file_id, input_type, is_performce_model)
+        try:
+            follower = await asyncio.get_running_loop().run_in_executor(
+                None, build_follower, files, is_performce_model, device
+            )
+        except BaseException:
+            release_files(files)
+            raise
+        print(f"Armed score follower for {file_id} in {time.time() - started:.2f}s")
+
+        self._armed[key] = follower
+        while len(self._armed) > self.max_size:
+            evicted, dropped = self._armed.popitem(last=False)
+            dropped.discard()
+            print(f"Dropped armed score follower for {evicted[0]}: pool is full")
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+        return follower
+
+    async def take(self, file_id: str, input_type: str, is_performce_model: bool, device: Optional[int]) -> Optional[ArmedFollower]:
+        """
+        取出预先构建的 follower；正在构建时等待构建完成，没有时返回 None
+        取出后由会话负责在结束时调用 release_files
+        """
+        key = follower_key(file_id, input_type, is_performce_model, device)
+        task = self._arming.get(key)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except Exception as e:
+                logging.error(f"Failed to arm score follower for {file_id}: {e}")
+        return self._armed.pop(key, None)
+
+    def evict_idle(self) -> int:
+        deadline = time.time() - self.idle_seconds
+        expired = [key for key, follower in self._armed.items() if follower.last_used < deadline]
+        for key in expired:
+            self._armed.pop(key).discard()
+            print(f"Dropped idle armed score follower for {key[0]}")
+        return len(expired)
+
+    async def _sweep(self) -> None:
+        while self._armed:
+            await asyncio.sleep(max(self.idle_seconds / 2, 1))
+            self.evict_idle()
+
+    def live_devices(self, exclude: Optional[tuple] = None) -> set:
+        """
+        已构建或正在构建的现场输入 follower 占用的 (input_type, device)
+        exclude 为会话将要取走的 follower
+        """
+        keys = (set(self._armed) | set(self._arming)) - {exclude}
+        # key 为 (file_id, input_type, is_performce_model, device)
+        return {(key[1], key[3]) for key in keys if not key[2]}
+
+    def metrics(self) -> dict:
+        now = time.time()
+        return {
+            "max_size": self.max_size,
+            "idle_seconds": self.idle_seconds,
+            "armed": [
+                {
+                    "file_id": key[0],
+                    "input_type": follower.input_type,
+                    "is_performce_model": key[2],
+                    "device": key[3],
+                    "built_seconds": round(follower.built_seconds, 3),
+                    "idle_seconds": round(now - follower.last_used, 1),
+                }
+                for key, follower in self._armed.items()
+            ],
+            "arming": [key[0] for key in self._arming],
+        }
+
+    def clear(self) -> None:
+        for follower in self._armed.values():
+            follower.discard()
+        self._armed.clear()
+        for task in self._arming.values():
+            task.cancel()
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+
+
+follower_pool = FollowerPool()
@@ -1,23 +1,27 @@
 import asyncio
+import time
 import warnings
 import debugpy
 import os
-from concurrent.futures import ThreadPoolExecutor
 from fastapi import WebSocket, WebSocketDisconnect
 from app.tuner.pitch_detector import PitchDetector
 
 warnings.filterwarnings("ignore", module="partitura")
 
-from fastapi import FastAPI, File, UploadFile, WebSocket
+from fastapi import Body, FastAPI, File, HTTPException, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.websockets import WebSocketState
 
-from .position_manager import position_manager
+from .session_manager import SessionRejected, session_manager
+from .artifact_cache import close_http_session, enforce_budget
+from .follower_pool import follower_key, follower_pool
 from .utils import (
     get_audio_devices,
     get_midi_devices,
+    prepare_score_following,
+    release_files,
+    follow_score,
     run_score_following,
-    cleanup_temp_files,
     listen_for_stop,
     update_position,
 )
@@ -42,7 +46,19 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-executor = ThreadPoolExecutor(max_workers=1)
+
+
+@app.on_event("startup")
+def trim_artifact_cache():
+    # 启动时按配置的大小上限清理本地产物缓存
+    enforce_budget()
+
+
+@app.on_event("shutdown")
+async def close_cloud_session():
+    session_manager.shutdown()
+    follower_pool.clear()
+    await close_http_session()
 
 
 # ================== API ==================
@@ -75,13 +91,51 @@ async def midi_devices():
 
 
 
+@app.get("/local/sessions")
+async def practice_sessions():
+    """
+    当前和最近结束的练习会话及其指标
+    """
+    return session_manager.metrics()
+
+
+@app.post("/local/arm")
+async def arm_score_follower(data: dict = Body(...)):
+    """
+    预先下载乐谱并构建 follower，参数与 /local/ws 的第一条消息相同
+    之后打开的相同乐谱和设备的会话直接开始读取输入
+    """
+    file_id = data.get("file_id")
+    if not file_id:
+        raise HTTPException(status_code=400, detail="file_id is required")
+    try:
+        follower = await follower_pool.arm(
+            file_id,
+            data.get("input_type", "audio"),
+            data.get("isPerformceModel", False),
+            data.get("device"),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to arm score follower: {e}")
+    return {"armed": True, "built_seconds": round(follower.built_seconds, 3)}
+
+
+@app.get("/local/armed")
+async def armed_score_followers():
+    """
+    预先构建的 follower 列表
+    """
+    return follower_pool.metrics()
+
+
 @app.websocket("/local/ws")
 async def websocket_endpoint(websocket: WebSocket):
     tasks = []  # 存储所有需要管理的任务
     main_task = None
-    
+    session = None
+    files = None
+
     try:
-        position_manager.reset()
         await websocket.accept()
         print("[DEBUG] WebSocket connection accepted")
         
@@ -92,46 +146,49 @@ async def websocket_endpoint(websocket: WebSocket):
         device = data.get("device")
         print(f"[DEBUG] Received data: {data}")
 
-        # 使用线程池执行主要任务
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            main_task = loop.run_in_executor(
-                executor,
-                lambda: asyncio.run(run_score_following(file_id, input_type, is_performce_model, device))
-            )
-            
-            # 创建并启动所有任务
-            stop_listener = asyncio.create_task(listen_for_stop())
-            position_updater = asyncio.create_task(update_position(file_id))
-            tasks.extend([stop_listener, position_updater])
-
-            # 等待任意一个任务完成
-            done, pending = await asyncio.wait(
-                [stop_listener, position_updater, main_task],
-                return_when=asyncio.FIRST_COMPLETED
-            )
-
-            # 如果是停止信号或者出错，取消所有任务
-            should_stop = any(
-                t in done and (
-                    (t == stop_listener and t.result()) or  # 停止信号
-                    (t == main_task and isinstance(t.result(), dict) and "error" in t.result())  # 错误
-                )
-                for t in done
+        # 会话数已满或设备被占用时拒绝，不影响其他会话
+        try:
+            session = session_manager.open(
+                file_id,
+                input_type,
+                is_performce_model,
+                device,
+                armed_devices=follower_pool.live_devices(
+                    exclude=follower_key(file_id, input_type, is_performce_model, device)
+                ),
             )
-
-            if should_stop:
-                print("[DEBUG] Stopping all tasks...")
-                # 取消所有未完成的任务
-                for task in pending:
-                    if not task.done():
-                        task.cancel()
-                # 取消主任务
-                if not main_task.done():
-                    main_task.cancel()
-                
-                # 等待所有任务完成取消
-                await asyncio.gather(*pending, return_exceptions=True)
+        except SessionRejected as e:
+            await websocket.send_json({"error": str(e)})
+            await websocket.close(code=1013)  # Try Again Later
+            return
+
+        # 在会话管理器的共享线程池中执行主要任务
+        started = time.time()
+        follower = await follower_pool.take(file_id, input_type, is_performce_model, device)
+        session.armed = follower is not None
+        if follower is not None:
+            # 已预先构建，直接开始读取输入
+            files = follower.files
+            session.prepare_seconds = time.time() - started
+            main_task = session_manager.start(session, follow_score, follower)
+        else:
+            # 在主事件循环中获取文件，共用 HTTP 连接池和本地缓存
+            files = await prepare_score_following(file_id, input_type, is_performce_model)
+            session.prepare_seconds = time.time() - started
+            main_task = session_manager.start(session, run_score_following, files)
+        # 工作线程结束后文件才可以被缓存淘汰
+        main_task.add_done_callback(lambda _: release_files(files))
+
+        # 创建并启动所有任务
+        stop_listener = asyncio.create_task(listen_for_stop(websocket))
+        position_updater = asyncio.create_task(update_position(session, websocket))
+        tasks.extend([stop_listener, position_updater])
+
+        # 等待任意一个任务完成：停止信号、连接断开或 score following 结束
+        await asyncio.wait(
+            [stop_listener, position_updater, main_task],
+            return_when=asyncio.FIRST_COMPLETED
+        )
 
     except Exception as e:
         print(f"[DEBUG] WebSocket error: {e}")
@@ -139,12 +196,15 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.send_json({"error": str(e)})
     finally:
         print("[DEBUG] Cleaning up...")
-        # 确保所有任务都被取消
+        # 通知工作线程停止，线程退出后释放会话名额
+        if session is not None:
+            session_manager.close(session)
+        if main_task is None and files is not None:
+            # 没有开始运行，文件不再使用
+            release_files(files)
         for task in tasks:
             if not task.done():
                 task.cancel()
-        if main_task and not main_task.done():
-            main_task.cancel()
         
         # 等待所有任务完成取消
         if tasks:
@@ -152,8 +212,6 @@ async def websocket_endpoint(websocket: WebSocket):
         
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
-        position_manager.reset()
-        cleanup_temp_files()
 
 
 @app.websocket("/local/ws/tuner/violin")
@@ -0,0 +1,114 @@
+import logging
+import struct
+import zipfile
+
+import numpy as np
+
+from pathlib import Path
+from typing import Optional
+
+# 与 cloud-service 的音符索引格式版本保持一致
+NOTE_INDEX_VERSION = "2"
+
+
+def load_note_index(index_file: Optional[Path]) -> Optional[dict[str, np.ndarray]]:
+    """
+    Memory-map the note index produced by cloud-service
+
+    ``np.load`` ignores ``mmap_mode`` for ``.npz`` archives, so every
+    (uncompressed) member is mapped directly at its offset in the file.
+
+    Parameters
+    ----------
+    index_file : Path, optional
+        ``.npz`` file downloaded from cloud-service
+
+    Returns
+    -------
+    dict[str, np.ndarray] or None
+        Read-only memory maps keyed by field (``onset_beat``,
+        ``onset_quarter``, ``duration_beat``, ``duration_quarter``,
+        ``pitch``, ``measure``, ``part``, ``measure_number``,
+        ``measure_start_beat``, ``measure_start_quarter``,
+        ``beat_map_beat``, ``beat_map_quarter``), or None if the file is
+        missing or unreadable
+    """
+    if index_file is None:
+        return None
+    try:
+        index = {}
+        with zipfile.ZipFile(index_file) as archive, open(index_file, "rb") as f:
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError(f"{info.filename} is compressed")
+                # 本地文件头固定 30 字节，之后是文件名和扩展字段
+                f.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack("<HH", f.read(4))
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                if np.lib.format.read_magic(f) == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                if dtype.hasobject:
+                    # 对象数组需要 pickle，音符索引中不应出现
+                    raise ValueError(f"{info.filename} has object dtype")
+                index[Path(info.filename).stem] = np.memmap(
+                    index_file,
+                    dtype=dtype,
+                    mode="r",
+                    offset=f.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+        return index
+    except Exception as e:
+        logging.error(f"Failed to load note index {index_file}: {e}")
+        return None
+
+
+def locate(index: dict[str, np.ndarray], beats):
+    """
+    Convert follower positions (beats) to quarter, measure and beat in measure
+
+    Replaces ``quarter_map(inv_beat_map(beat))`` of the part with
+    ``np.interp`` over the precomputed breakpoints, and finds the measure
+    with ``np.searchsorted``. Works on a single position (one frame of the
+    live follower) or an array of positions (offline alignment) alike.
+
+    Parameters
+    ----------
+    index : dict[str, np.ndarray]
+        Note index returned by ``load_note_index``
+    beats : float or array_like
+        Positions reported by the follower, in beats
+
+    Returns
+    -------
+    quarter, measure, beat_in_measure
+        Scalars for a scalar input, arrays otherwise. Like partitura's maps,
+        positions outside the score (or NaN) give a NaN quarter and beat in
+        measure; their measure is None for a scalar and -1 in an array.
+        Positions before the first measure belong to the first measure.
+    """
+    beats = np.asarray(beats, dtype=np.float64)
+    beat_map = index["beat_map_beat"]
+    if len(beat_map) == 0:
+        valid = np.zeros(beats.shape, dtype=bool)
+        quarters = np.full(beats.shape, np.nan)
+    else:
+        # NaN 的比较结果为 False，同样视为超出范围
+        valid = (beats >= beat_map[0]) & (beats <= beat_map[-1])
+        quarters = np.interp(beats, beat_map, index["beat_map_quarter"], left=np.nan, right=np.nan)
+    starts = index["measure_start_beat"]
+    if len(starts) == 0:
+        measures = np.zeros(beats.shape, dtype=np.int32)
+        beats_in_measure = beats.copy()
+    else:
+        positions = np.clip(np.searchsorted(starts, beats, side="right") - 1, 0, None)
+        measures = index["measure_number"][positions]
+        beats_in_measure = beats - starts[positions]
+    measures = np.where(valid, measures, -1)
+    beats_in_measure = np.where(valid, beats_in_measure, np.nan)
+    if beats.ndim == 0:
+        return float(quarters), int(measures) if valid else None, float(beats_in_measure)
+    return quarters, measures, beats_in_measure
@@ -0,0 +1,58 @@
+import logging
+
+import matchmaker
+import numpy as np
+
+from pathlib import Path
+from typing import Optional
+from matchmaker import Matchmaker
+
+from .config import REFERENCE_FEATURE_CONFIG
+
+
+# 决定参考特征内容的全部输入，版本号由 cloud-service 的 get_feature_version 根据它换算，device-service 不单独计算
+REFERENCE_FEATURE_FINGERPRINT = {**REFERENCE_FEATURE_CONFIG, "matchmaker": matchmaker.__version__}
+
+
+def load_reference_features(features_file: Optional[Path]) -> Optional[np.ndarray]:
+    """
+    Memory-map precomputed reference features
+
+    Parameters
+    ----------
+    features_file : Path, optional
+        ``.npy`` file downloaded from cloud-service
+
+    Returns
+    -------
+    np.ndarray or None
+        Copy-on-write memory map of the features, or None if the file is
+        missing or unreadable (the follower then computes them itself)
+    """
+    if features_file is None:
+        return None
+    try:
+        return np.load(features_file, mmap_mode="c")
+    except Exception as e:
+        logging.error(f"Failed to load reference features {features_file}: {e}")
+        return None
+
+
+class CachedMatchmaker(Matchmaker):
+    """
+    Matchmaker that takes precomputed reference features
+
+    ``Matchmaker.__init__`` calls ``preprocess_score`` to render the score and
+    extract its features. When ``reference_features`` is given, that step is
+    skipped and the cached features are used as is.
+    """
+
+    def __init__(self, *args, reference_features: Optional[np.ndarray] = None, **kwargs):
+        self._cached_reference_features = reference_features
+        super().__init__(*args, **kwargs)
+
+    def preprocess_score(self):
+        if self._cached_reference_features is None:
+            return super().preprocess_score()
+        self.reference_features = self._cached_reference_features
+        return self.reference_features
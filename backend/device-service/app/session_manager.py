@@ -0,0 +1,278 @@
+import asyncio
+import math
+import threading
+import time
+import uuid
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from .config import MAX_SESSIONS, SESSION_HISTORY
+
+
+class SessionRejected(Exception):
+    """
+    会话数已满或输入设备被占用时拒绝新的会话
+    """
+
+
+class PositionChannel:
+    """
+    Hand positions from a worker thread to the event loop as they are produced
+
+    Only the latest value is kept: if the sender is slower than the follower,
+    intermediate positions are dropped instead of queued, so the cursor never
+    falls behind. ``publish`` may be called from any thread and wakes the
+    waiting coroutine with ``call_soon_threadsafe``, at most once per value
+    taken by ``get``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = None
+        self._pending = False
+        self._closed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        # 被更新的值覆盖、没有发送出去的位置数
+        self.coalesced = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        绑定接收位置的事件循环，在事件循环中调用
+        """
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def publish(self, value) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            if self._pending:
+                self.coalesced += 1
+            self._latest = value
+            if self._pending:
+                # 已经通知过事件循环，只替换为最新值
+                return
+            self._pending = True
+        self._wake()
+
+    def close(self) -> None:
+        """
+        工作线程结束后调用，等待中的 get 返回 None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    async def get(self):
+        """
+        等待下一个位置并返回最新值；通道关闭且没有新值时返回 None
+        """
+        while True:
+            with self._lock:
+                if self._pending:
+                    self._pending = False
+                    self._event.clear()
+                    return self._latest
+                if self._closed:
+                    return None
+                self._event.clear()
+            await self._event.wait()
+
+
+@dataclass
+class PracticeSession:
+    """
+    一次 score following 练习的状态，每个 WebSocket 连接一个，互不影响
+    """
+    file_id: str
+    input_type: str
+    is_performce_model: bool
+    device: Optional[int]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    state: str = "preparing"  # preparing / running / finished / stopped / failed
+    error: Optional[str] = None
+    position: float = 0.0
+    measure: Optional[int] = None
+    # 是否使用了预先构建（arm）的 follower
+    armed: bool = False
+    stop_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    # (position, measure)，由工作线程推送给 WebSocket 发送协程
+    channel: PositionChannel = field(default_factory=PositionChannel, repr=False)
+
+    # 指标
+    created_at: float = field(default_factory=time.time)
+    prepare_seconds: Optional[float] = None
+    started_at: Optional[float] = None
+    first_position_seconds: Optional[float] = None
+    position_updates: int = 0
+    finished_at: Optional[float] = None
+
+    @property
+    def uses_live_device(self) -> bool:
+        return not self.is_performce_model
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    def set_position(self, position: float, measure: Optional[int] = None) -> None:
+        """
+        由 score following 工作线程调用
+        """
+        # 对齐失败时 Matchmaker 可能给出 NaN，保持上一个位置
+        if isinstance(position, float) and math.isnan(position):
+            return
+        if self.position_updates == 0 and self.started_at is not None:
+            self.first_position_seconds = time.time() - self.started_at
+        self.position = position
+        if measure is not None:
+            self.measure = measure
+        self.position_updates += 1
+        self.channel.publish((self.position, self.measure))
+
+    def metrics(self) -> dict:
+        end = self.finished_at or time.time()
+        running_seconds = end - self.started_at if self.started_at else 0.0
+        return {
+            "session_id": self.id,
+            "file_id": self.file_id,
+            "input_type": self.input_type,
+            "device": self.device,
+            "state": self.state,
+            "armed": self.armed,
+            "error": self.error,
+            "position": self.position,
+            "measure": self.measure,
+            "prepare_seconds": round(self.prepare_seconds, 3) if self.prepare_seconds is not None else None,
+            "first_position_seconds": round(self.first_position_seconds, 3) if self.first_position_seconds is not None else None,
+            "running_seconds": round(running_seconds, 3),
+            "position_updates": self.position_updates,
+            "updates_per_second": round(self.position_updates / running_seconds, 2) if running_seconds > 0 else 0.0,
+            "coalesced_updates": self.channel.coalesced,
+        }
+
+
+class SessionManager:
+    """
+    Run several score following sessions side by side
+
+    Every session has its own state, so sessions on different pieces or
+    devices no longer overwrite each other's positions. The blocking follower
+    loops run on one shared pool of ``MAX_SESSIONS`` threads. A session is
+    only admitted while a thread is free (no session waits in a queue behind
+    a practice that may last an hour) and while its live input device is
+    not in use by another session or held by an armed follower.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._executor = ThreadPoolExecutor(max_workers=max_sessions, thread_name_prefix="score-following")
+        self._sessions: dict[str, PracticeSession] = {}
+        # 最近结束的会话，供指标接口查看
+        self._history: deque = deque(maxlen=SESSION_HISTORY)
+        self._lock = threading.Lock()
+
+    def open(
+        self,
+        file_id: str,
+        input_type: str,
+        is_performce_model: bool,
+        device: Optional[int],
+        armed_devices: Iterable[tuple] = (),
+    ) -> PracticeSession:
+        """
+        登记新的会话；armed_devices 为预先构建的 follower 占用的 (input_type, device)
+        """
+        session = PracticeSession(file_id, input_type, is_performce_model, device)
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionRejected(f"Too many practice sessions ({self.max_sessions}), try again later")
+            if session.uses_live_device and (
+                (input_type, device) in set(armed_devices)
+                or any(
+                    other.uses_live_device and other.input_type == input_type and other.device == device
+                    for other in self._sessions.values()
+                )
+            ):
+                raise SessionRejected(f"Input device {device} is already in use")
+            self._sessions[session.id] = session
+        print(f"Opened practice session {session.id} for {file_id} ({len(self._sessions)}/{self.max_sessions})")
+        return session
+
+    def start(self, session: PracticeSession, func, *args) -> asyncio.Future:
+        """
+        在共享线程池中运行 func(session, *args)，线程结束时释放会话名额
+        """
+        session.state = "running"
+        session.started_at = time.time()
+        session.channel.bind(asyncio.get_running_loop())
+        future = self._executor.submit(func, session, *args)
+
+        def _on_done(f):
+            error = f.exception()
+            result = None if error else f.result()
+            if error is None and isinstance(result, dict) and "error" in result:
+                error = result["error"]
+            if error is not None:
+                session.state = "failed"
+                session.error = str(error)
+            else:
+                session.state = "stopped" if session.stopped else "finished"
+            session.channel.close()
+            self._release(session)
+
+        future.add_done_callback(_on_done)
+        return asyncio.wrap_future(future)
+
+    def close(self, session: PracticeSession) -> None:
+        """
+        通知工作线程停止；还没有开始运行的会话立即释放名额
+        """
+        session.stop_event.set()
+        session.channel.close()
+        if session.started_at is None:
+            session.state = "stopped"
+            self._release(session)
+
+    def _release(self, session: PracticeSession) -> None:
+        with self._lock:
+            if self._sessions.pop(session.id, None) is None:
+                return
+            session.finished_at = time.time()
+            self._history.append(session)
+        print(f"Closed practice session {session.id}: {session.state}")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            active = [session.metrics() for session in self._sessions.values()]
+            recent = [session.metrics() for session in reversed(self._history)]
+        return {
+            "max_sessions": self.max_sessions,
+            "active": active,
+            "recent": recent,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            session.stop_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+session_manager = SessionManager()
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app import artifact_cache
+from app.artifact_cache import META_FILE, enforce_budget, entry_dir, fetch_artifact, pin, unpin
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def _make_app(requests: list, max_age: int):
+    async def score(request):
+        requests.append(dict(request.headers))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"Cache-Control": f"max-age={max_age}"})
+        return web.Response(body=b"<score/>", headers={
+            "ETag": '"v1"',
+            "Cache-Control": f"max-age={max_age}",
+            "Content-Disposition": 'attachment; filename="score.musicxml"',
+        })
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/score", score)
+    app.router.add_get("/missing", missing)
+    return app
+
+
+def test_fetch_uses_fresh_copy_and_revalidates_with_304(cache_dir, monkeypatch):
+    requests = []
+
+    async def run():
+        server = TestServer(_make_app(requests, max_age=60))
+        await server.start_server()
+        try:
+            url = str(server.make_url("/score"))
+            path = await fetch_artifact("f1", "score", url)
+            assert path.read_bytes() == b"<score/>"
+
+            # max-age 之内不发送请求
+            assert await fetch_artifact("f1", "score", url) == path
+            assert len(requests) == 1
+
+            # 过期后条件请求，304 不重新下载
+            meta_path = entry_dir("f1", "score") / META_FILE
+            meta = json.loads(meta_path.read_text())
+            meta["expires_at"] = 0
+            meta_path.write_text(json.dumps(meta))
+            assert await fetch_artifact("f1", "score", url) == path
+            assert len(requests) == 2
+            assert requests[1]["If-None-Match"] == '"v1"'
+            assert json.loads(meta_path.read_text())["expires_at"] > time.time()
+
+            # 产物已不存在时删除本地副本，会话正在使用时保留
+            missing_url = str(server.make_url("/missing"))
+            meta_path.write_text(json.dumps({**json.loads(meta_path.read_text()), "expires_at": 0}))
+            pin([path])
+            try:
+                assert await fetch_artifact("f1", "score", missing_url) is None
+                assert path.exists()
+            finally:
+                unpin([path])
+            assert await fetch_artifact("f1", "score", missing_url) is None
+            assert not entry_dir("f1", "score").exists()
+            # 没有请求使用的锁不再保留
+            assert artifact_cache._locks == {}
+        finally:
+            await artifact_cache.close_http_session()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def _make_entry(file_id: str, key: str, size: int, last_used: float, meta: bool = True):
+    directory = entry_dir(file_id, key)
+    directory.mkdir(parents=True)
+    (directory / "data").write_bytes(b"x" * size)
+    if meta:
+        (directory / META_FILE).write_text("{}")
+        os.utime(directory / META_FILE, (last_used, last_used))
+    else:
+        os.utime(directory, (last_used, last_used))
+    return directory
+
+
+def test_enforce_budget_evicts_least_recently_used_idle_entries(cache_dir, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_MAX_BYTES", 1500)
+    now = time.time()
+    oldest = _make_entry("a", "score", 1000, now - 300)
+    pinned = _make_entry("b", "score", 1000, now - 200)
+    downloading = _make_entry("c", "score", 1000, now - 100, meta=False)
+    interrupted = _make_entry("d", "score", 1000, now - 2 * artifact_cache.INCOMPLETE_GRACE_SECONDS, meta=False)
+    newest = _make_entry("e", "score", 1000, now)
+
+    pin([pinned / "data"])
+    try:
+        enforce_budget()
+    finally:
+        unpin([pinned / "data"])
+
+    # 中断的下载残留先被淘汰，之后按最近使用时间淘汰，跳过会话使用中和正在下载的条目
+    assert not interrupted.exists()
+    assert not oldest.exists()
+    assert pinned.exists()
+    assert downloading.exists()
+    assert not newest.exists()
+    assert artifact_cache._pinned == {}
+
+
+def test_enforce_budget_skips_entries_being_fetched(cache_dir, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "ARTIFACT_CACHE_MAX_BYTES", 1)
+    busy = _make_entry("a", "score", 1000, time.time() - 300)
+    artifact_cache._busy.add(busy)
+    try:
+        assert enforce_budget() == 0
+    finally:
+        artifact_cache._busy.discard(busy)
+    assert busy.exists()
+    assert enforce_budget() > 0
+    assert not busy.exists()
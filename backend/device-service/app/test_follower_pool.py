@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from app import follower_pool as pool_module, utils
+from app.follower_pool import FollowerPool
+from app.utils import ArmedFollower
+
+
+class _FakeStream:
+    def __init__(self):
+        self.closed = False
+
+    def stop_listening(self):
+        self.closed = True
+
+
+class _FakeMatchmaker:
+    def __init__(self):
+        self.stream = _FakeStream()
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """
+    不下载文件、不打开设备，记录每次构建和释放的文件
+    """
+    built = []
+    released = []
+
+    async def prepare(file_id, input_type, is_performce_model):
+        return {"file_id": file_id}
+
+    def build(files, is_performce_model, device):
+        built.append(files["file_id"])
+        return ArmedFollower(_FakeMatchmaker(), None, None, "midi", files)
+
+    monkeypatch.setattr(pool_module, "prepare_score_following", prepare)
+    monkeypatch.setattr(pool_module, "build_follower", build)
+    monkeypatch.setattr(utils, "release_files", lambda files: released.append(files["file_id"]))
+    return built, released
+
+
+def test_arm_reuses_and_take_removes(builds):
+    built, released = builds
+
+    async def run():
+        pool = FollowerPool(max_size=2, idle_seconds=60)
+        first, second = await asyncio.gather(
+            pool.arm("a", "midi", False, 1),
+            pool.arm("a", "midi", False, 1),
+        )
+        # 并发请求共用一次构建，之后直接复用
+        assert first is second
+        assert await pool.arm("a", "midi", False, 1) is first
+        assert built == ["a"]
+        assert pool.live_devices() == {("midi", 1)}
+
+        assert await pool.take("a", "midi", False, 1) is first
+        assert await pool.take("a", "midi", False, 1) is None
+        # 取走的 follower 由会话负责，输入流不关闭
+        assert not first.mm.stream.closed and released == []
+        pool.clear()
+
+    asyncio.run(run())
+
+
+def test_idle_followers_are_dropped_and_closed(builds):
+    _, released = builds
+
+    async def run():
+        pool = FollowerPool(max_size=2, idle_seconds=60)
+        idle = await pool.arm("a", "midi", False, 1)
+        fresh = await pool.arm("b", "midi", False, 2)
+        idle.last_used = time.time() - 120
+
+        assert pool.evict_idle() == 1
+        assert idle.mm.stream.closed and not fresh.mm.stream.closed
+        assert released == ["a"]
+        assert pool.live_devices() == {("midi", 2)}
+        pool.clear()
+        assert fresh.mm.stream.closed
+
+    asyncio.run(run())
+
+
+def test_full_pool_drops_the_oldest(builds):
+    _, released = builds
+
+    async def run():
+        pool = FollowerPool(max_size=2, idle_seconds=60)
+        oldest = await pool.arm("a", "midi", False, 1)
+        await pool.arm("b", "midi", False, 2)
+        # 复用后 a 变为最近使用，b 成为最旧的
+        await pool.arm("a", "midi", False, 1)
+        await pool.arm("c", "audio", True, None)
+
+        assert released == ["b"]
+        assert not oldest.mm.stream.closed
+        # performance 模式不占用设备
+        assert pool.live_devices() == {("midi", 1)}
+        assert pool.live_devices(exclude=("a", "midi", False, 1)) == set()
+        pool.clear()
+
+    asyncio.run(run())
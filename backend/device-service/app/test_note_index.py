@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.note_index import load_note_index, locate
+
+
+@pytest.fixture
+def note_index(tmp_path):
+    # 两个 4/4 小节接一个 3/4 小节，八分音符为一拍，所以 quarter 是 beat 的一半
+    index_file = tmp_path / "score.notes.v2.npz"
+    np.savez(
+        index_file,
+        measure_number=np.array([1, 2, 3], dtype=np.int32),
+        measure_start_beat=np.array([0.0, 4.0, 8.0]),
+        measure_start_quarter=np.array([0.0, 2.0, 4.0]),
+        beat_map_beat=np.array([0.0, 4.0, 8.0, 11.0]),
+        beat_map_quarter=np.array([0.0, 2.0, 4.0, 5.5]),
+    )
+    return load_note_index(index_file)
+
+
+def test_locate_scalar(note_index):
+    quarter, measure, beat_in_measure = locate(note_index, 9.5)
+    assert isinstance(quarter, float) and isinstance(measure, int)
+    assert quarter == pytest.approx(4.75)
+    assert measure == 3
+    assert beat_in_measure == pytest.approx(1.5)
+
+    # 小节边界属于后一个小节
+    assert locate(note_index, 4.0) == (2.0, 2, 0.0)
+
+
+def test_locate_batch_matches_scalar(note_index):
+    beats = np.array([0.0, 3.5, 4.0, 7.25, 10.0, 11.0])
+    quarters, measures, beats_in_measure = locate(note_index, beats)
+    assert quarters.shape == measures.shape == beats_in_measure.shape == beats.shape
+    assert list(measures) == [1, 1, 2, 2, 3, 3]
+    for i, beat in enumerate(beats):
+        assert (quarters[i], measures[i], beats_in_measure[i]) == pytest.approx(locate(note_index, beat))
+
+
+def test_locate_out_of_range_is_nan(note_index):
+    # 与 partitura 的 inv_beat_map 一致，乐谱之外的位置不截断到边界
+    for beat in (-1.0, 11.5, math.nan):
+        quarter, measure, beat_in_measure = locate(note_index, beat)
+        assert math.isnan(quarter) and measure is None and math.isnan(beat_in_measure)
+
+    quarters, measures, _ = locate(note_index, [-1.0, 2.0, 12.0])
+    assert np.isnan(quarters[[0, 2]]).all() and quarters[1] == pytest.approx(1.0)
+    assert list(measures) == [-1, 1, -1]
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.session_manager import PositionChannel, SessionManager, SessionRejected
+
+
+def test_position_channel_coalesces_to_latest():
+    async def run():
+        channel = PositionChannel()
+        channel.bind(asyncio.get_running_loop())
+        for position in range(5):
+            channel.publish(position)
+        # 只取到最新值，中间的位置被合并
+        assert await channel.get() == 4
+        assert channel.coalesced == 4
+
+        channel.publish(5)
+        assert await channel.get() == 5
+        assert channel.coalesced == 4
+
+    asyncio.run(run())
+
+
+def test_position_channel_close_returns_none():
+    async def run():
+        channel = PositionChannel()
+        channel.bind(asyncio.get_running_loop())
+        channel.publish(1)
+        channel.close()
+        # 关闭前发布的值仍然送达，之后的发布被忽略
+        channel.publish(2)
+        assert await channel.get() == 1
+        assert await channel.get() is None
+
+    asyncio.run(run())
+
+
+def test_position_channel_wakes_from_worker_thread():
+    async def run():
+        channel = PositionChannel()
+        channel.bind(asyncio.get_running_loop())
+
+        def worker():
+            for position in range(100):
+                channel.publish(float(position))
+            channel.close()
+
+        received = []
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while (value := await asyncio.wait_for(channel.get(), timeout=5)) is not None:
+            received.append(value)
+        thread.join()
+
+        assert received[-1] == 99.0
+        assert received == sorted(received)
+        assert len(received) + channel.coalesced == 100
+
+    asyncio.run(run())
+
+
+def test_open_rejects_device_held_by_armed_follower():
+    manager = SessionManager(max_sessions=4)
+    try:
+        with pytest.raises(SessionRejected):
+            manager.open("a", "midi", False, 1, armed_devices={("midi", 1)})
+        # 其他设备和 performance 模式不受影响
+        manager.open("a", "midi", False, 2, armed_devices={("midi", 1)})
+        manager.open("a", "midi", True, 1, armed_devices={("midi", 1)})
+    finally:
+        manager.shutdown()
+
+
+def test_open_rejects_over_max_sessions():
+    manager = SessionManager(max_sessions=2)
+    try:
+        first = manager.open("a", "audio", True, None)
+        manager.open("b", "audio", True, None)
+        with pytest.raises(SessionRejected):
+            manager.open("c", "audio", True, None)
+
+        # 未开始运行的会话关闭后立即释放名额
+        manager.close(first)
+        manager.open("c", "audio", True, None)
+    finally:
+        manager.shutdown()
+
+
+def test_open_rejects_live_device_in_use():
+    manager = SessionManager(max_sessions=4)
+    try:
+        session = manager.open("a", "midi", False, 1)
+        with pytest.raises(SessionRejected):
+            manager.open("b", "midi", False, 1)
+        # 其他设备、其他输入类型和 performance 模式不受影响
+        manager.open("b", "midi", False, 2)
+        manager.open("b", "audio", False, 1)
+        manager.open("b", "midi", True, 1)
+
+        manager.close(session)
+        manager.open("b", "midi", False, 1)
+    finally:
+        manager.shutdown()
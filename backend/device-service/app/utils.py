@@ -1,43 +1,31 @@
+import json
 import logging
 import traceback
-import tempfile
-import shutil
-import asyncio
 import math
 import mido
 import partitura
 import pyaudio
-import aiohttp
 import os
+import time
 
-from datetime import datetime
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
-from matchmaker import Matchmaker
+from urllib.parse import quote
 from partitura.score import Part
 from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 
-from .position_manager import position_manager
+from .session_manager import PracticeSession
 from .common import GetFileType
+from .config import FOLLOWER_FRAME_RATE, REFERENCE_FEATURE_CONFIG
+from .reference_features import REFERENCE_FEATURE_FINGERPRINT, CachedMatchmaker, load_reference_features
+from .artifact_cache import fetch_artifact, pin, unpin
+from .note_index import NOTE_INDEX_VERSION, load_note_index, locate
 
 # 添加 cloud-service 的 URL
 CLOUD_SERVICE_URL = os.getenv('NEXT_CLOUD_BACKEND_URL', 'http://localhost:8101')
 
-# 创建临时目录
-TEMP_DIR = Path(tempfile.gettempdir()) / "score_following"
-TEMP_DIR.mkdir(exist_ok=True)
-
-
-def cleanup_temp_files():
-    """清理临时目录中的所有文件"""
-    try:
-        if TEMP_DIR.exists():
-            shutil.rmtree(TEMP_DIR)
-            TEMP_DIR.mkdir(exist_ok=True)
-    except Exception as e:
-        logging.error(f"Error cleaning up temp files: {e}")
-
 
 def convert_beat_to_quarter(score_part: Part, current_beat: float) -> float:
     timeline_time = score_part.inv_beat_map(current_beat)
@@ -45,45 +33,30 @@ def convert_beat_to_quarter(score_part: Part, current_beat: float) -> float:
     return float(quarter_position)
 
 
+def artifact_url(file_id: str, file_type: GetFileType) -> tuple[str, str]:
+    """
+    返回产物在缓存中的键（包含版本号）和 cloud-service 的 URL
+    """
+    if file_type == GetFileType.SCORE_FILE:
+        return "score", f"{CLOUD_SERVICE_URL}/cloud/get-score-file-by-id/{file_id}"
+    elif file_type == GetFileType.AUDIO_FILE:
+        return "audio", f"{CLOUD_SERVICE_URL}/cloud/get-audio-file-by-id/{file_id}"
+    elif file_type == GetFileType.MIDI_FILE:
+        return "midi", f"{CLOUD_SERVICE_URL}/cloud/get-midi-file-by-id/{file_id}"
+    elif file_type == GetFileType.FEATURES_FILE:
+        key = "features-" + "-".join(str(value) for _, value in sorted(REFERENCE_FEATURE_FINGERPRINT.items()))
+        fingerprint = quote(json.dumps(REFERENCE_FEATURE_FINGERPRINT, sort_keys=True))
+        return key, f"{CLOUD_SERVICE_URL}/cloud/get-features-file-by-id/{file_id}?fingerprint={fingerprint}"
+    elif file_type == GetFileType.NOTE_INDEX_FILE:
+        return f"notes-v{NOTE_INDEX_VERSION}", f"{CLOUD_SERVICE_URL}/cloud/get-note-index-by-id/{file_id}?version={NOTE_INDEX_VERSION}"
+    raise ValueError(f"Unknown file type: {file_type}")
+
+
 async def find_file_by_id(file_id: str, file_type: GetFileType) -> Optional[Path]:
-    """从 cloud-service 获取文件内容并保存到临时目录"""
+    """从本地缓存获取文件，缓存过期时向 cloud-service 重新校验，没有缓存时下载"""
     try:
-        async with aiohttp.ClientSession() as session:
-            if file_type == GetFileType.SCORE_FILE:
-                url = f"{CLOUD_SERVICE_URL}/cloud/get-score-file-by-id/{file_id}"
-            elif file_type == GetFileType.AUDIO_FILE:
-                url = f"{CLOUD_SERVICE_URL}/cloud/get-audio-file-by-id/{file_id}"
-            elif file_type == GetFileType.MIDI_FILE:
-                url = f"{CLOUD_SERVICE_URL}/cloud/get-midi-file-by-id/{file_id}"
-            
-            async with session.get(url) as response:
-                if response.status == 200:
-                    # 获取原始文件名
-                    content_disposition = response.headers.get('content-disposition')
-                    original_filename = None
-                    if content_disposition:
-                        import re
-                        filename_match = re.search(r'filename="([^"]+)"', content_disposition)
-                        if filename_match:
-                            original_filename = filename_match.group(1)
-                    
-                    # 如果没有获取到原始文件名，使用默认名称
-                    if not original_filename:
-                        logging.error(f"no original filename: {response.status}")
-                        return None
-                    
-                    # 添加时间戳
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    temp_filename = f"{file_type.value}_{timestamp}_{original_filename}"
-                    temp_file = TEMP_DIR / temp_filename
-                    
-                    # 保存文件内容
-                    with open(temp_file, "wb") as f:
-                        f.write(await response.read())
-                    return temp_file
-                else:
-                    logging.error(f"Failed to get file from cloud: {response.status}")
-                    return None
+        key, url = artifact_url(file_id, file_type)
+        return await fetch_artifact(file_id, key, url)
     except Exception as e:
         logging.error(f"Error getting file from cloud: {e}")
         return None
@@ -141,52 +114,161 @@ def get_midi_devices() -> list[dict]:
     return devices
 
 
-async def run_score_following(file_id: str, input_type: str, is_performce_model: bool, device: int) -> None:
-    score_file = await find_file_by_id(file_id, GetFileType.SCORE_FILE)  # .xml
+async def prepare_score_following(file_id: str, input_type: str, is_performce_model: bool) -> dict:
+    """
+    在主事件循环中获取 score following 需要的文件：命中本地缓存时不产生网络传输
+    获取到的文件在 release_files 之前不会被缓存淘汰
+    """
+    async def fetch(file_type: GetFileType) -> Optional[Path]:
+        path = await find_file_by_id(file_id, file_type)
+        # 获取下一个文件时的缓存淘汰不会删除已获取的文件
+        pin([path])
+        return path
+
+    files = {
+        "score_file": await fetch(GetFileType.SCORE_FILE),  # .xml
+        # 音符索引用于把位置换算为 quarter 和小节号（查表），没有时在本地解析乐谱换算
+        "note_index_file": await fetch(GetFileType.NOTE_INDEX_FILE),
+        "performance_file": None,
+        "features_file": None,
+        "input_type": GetFileType.AUDIO_FILE.value,
+    }
+
+    if is_performce_model:
+        if input_type == GetFileType.AUDIO_FILE:
+            files["performance_file"] = await fetch(GetFileType.AUDIO_FILE)
+        elif input_type == GetFileType.MIDI_FILE:
+            files["performance_file"] = await fetch(GetFileType.MIDI_FILE)
+            files["input_type"] = GetFileType.MIDI_FILE.value
+
+    # 上传时预计算的参考特征，没有时由 Matchmaker 自行计算
+    if files["input_type"] == REFERENCE_FEATURE_CONFIG["input_type"]:
+        files["features_file"] = await fetch(GetFileType.FEATURES_FILE)
+    return files
+
+
+def release_files(files: dict) -> None:
+    """
+    会话结束（或预先构建的 follower 被丢弃）后，文件可以被缓存淘汰
+    """
+    unpin(files[key] for key in ("score_file", "note_index_file", "performance_file", "features_file"))
+
+
+@dataclass
+class ArmedFollower:
+    """
+    构建好的 Matchmaker 及其乐谱数据，开始练习时只需要开始读取输入
+    """
+    mm: CachedMatchmaker
+    # 没有音符索引时才在本地解析乐谱，用于换算位置
+    score_part: Optional[Part]
+    note_index: Optional[dict]
+    input_type: str
+    # prepare_score_following 获取的文件，follower 不再使用后调用 release_files
+    files: dict
+    built_seconds: float = 0.0
+    last_used: float = field(default_factory=time.time)
+
+    def discard(self) -> None:
+        """
+        丢弃没有被会话取走的 follower：关闭构建时打开的输入流（如 MIDI 端口），释放文件
+        """
+        stream = getattr(self.mm, "stream", None)
+        if stream is not None:
+            try:
+                # 输入线程没有启动过，只停止监听并关闭设备，不能 join
+                stream.stop_listening()
+            except Exception as e:
+                logging.error(f"Failed to close input stream: {e}")
+        release_files(self.files)
+
+
+def build_follower(files: dict, is_performce_model: bool, device: Optional[int]) -> ArmedFollower:
+    """
+    Build the follower of a score from the files of ``prepare_score_following``
+
+    Loads the note index and the reference features (the score is only
+    parsed here if there is no note index) and constructs the
+    ``Matchmaker`` with its input stream. This is the slow part of starting
+    a session, so it runs in a worker thread, either when a session starts
+    or ahead of time when the score is armed.
+
+    Parameters
+    ----------
+    files : dict
+        Files returned by ``prepare_score_following``
+    is_performce_model : bool
+        Follow the reference performance file instead of a live device
+    device : int, optional
+        Index of the live audio/MIDI input device
+
+    Returns
+    -------
+    ArmedFollower
+        The follower, ready for ``follow_score``
+    """
+    started = time.time()
+    score_file = files["score_file"]
 
     # 确保 score_midi 是字符串类型
     if isinstance(score_file, Path):
         score_file = str(score_file)
 
-    score_part = partitura.load_score_as_part(score_file)
-    print(f"Running score following with {score_file}")
+    print(f"Building score follower with {score_file}")
 
-    actual_input_type = GetFileType.AUDIO_FILE.value
-    performance_file = None
-
-    if is_performce_model:
-        if input_type == GetFileType.AUDIO_FILE:
-            performance_file = await find_file_by_id(file_id, GetFileType.AUDIO_FILE)
-        elif input_type == GetFileType.MIDI_FILE:
-            performance_file = await find_file_by_id(file_id, GetFileType.MIDI_FILE)
-            actual_input_type = GetFileType.MIDI_FILE.value
+    note_index = load_note_index(files["note_index_file"])
+    score_part = partitura.load_score_as_part(score_file) if note_index is None else None
 
+    actual_input_type = files["input_type"]
+    performance_file = files["performance_file"]
     print(f"Using input type: {actual_input_type}")
 
-    alignment_in_progress = True
+    reference_features = load_reference_features(files["features_file"])
+    print(f"Using cached reference features: {reference_features is not None}")
+    # 与预计算特征使用相同的方法，其他输入类型使用 matchmaker 的默认方法
+    method = REFERENCE_FEATURE_CONFIG["method"] if actual_input_type == REFERENCE_FEATURE_CONFIG["input_type"] else None
+
     if is_performce_model:
         # 使用 performance 文件进行测试
-        mm = Matchmaker(
+        mm = CachedMatchmaker(
             score_file = score_file,
             performance_file = performance_file,
             input_type = actual_input_type,
-            frame_rate = 86,
+            method = method,
+            frame_rate = FOLLOWER_FRAME_RATE,
+            reference_features = reference_features,
         )
     else:
         # 使用特定输入设备进行测试
-        mm = Matchmaker(
+        mm = CachedMatchmaker(
             score_file = score_file,
             input_type = actual_input_type,
+            method = method,
             device_name_or_index = device,
-            frame_rate = 86,
+            frame_rate = FOLLOWER_FRAME_RATE,
+            reference_features = reference_features,
         )
+    return ArmedFollower(mm, score_part, note_index, actual_input_type, files, built_seconds=time.time() - started)
 
+
+def follow_score(session: PracticeSession, follower: ArmedFollower) -> None:
+    """
+    在会话管理器的工作线程中运行 score following
+    会话被关闭（stop_event）时在下一个位置更新处退出
+    """
+    alignment_in_progress = True
     try:
         while alignment_in_progress:
-            print(f"Running score following... (input type: {actual_input_type})")
-            for current_position in mm.run():
-                quarter_position = convert_beat_to_quarter(score_part, current_position)
-                position_manager.set_position(file_id, quarter_position)
+            print(f"Running score following... (input type: {follower.input_type})")
+            for current_position in follower.mm.run():
+                if session.stopped:
+                    break
+                if follower.note_index is not None:
+                    # 查表换算，不再每帧计算 partitura 的插值
+                    quarter_position, measure, _ = locate(follower.note_index, current_position)
+                else:
+                    quarter_position, measure = convert_beat_to_quarter(follower.score_part, current_position), None
+                session.set_position(quarter_position, measure)
             alignment_in_progress = False
     except Exception as e:
         logging.error(f"Error: {e}")
@@ -194,6 +276,14 @@ async def run_score_following(file_id: str, input_type: str, is_performce_model:
         return {"error": str(e)}
 
 
+def run_score_following(session: PracticeSession, files: dict) -> None:
+    """
+    没有预先准备好的 follower 时，在工作线程中构建并运行，files 由 prepare_score_following 获取
+    """
+    follower = build_follower(files, session.is_performce_model, session.device)
+    return follow_score(session, follower)
+
+
 async def listen_for_stop(websocket: WebSocket) -> bool:
     """监听停止信号的协程函数"""
     try:
@@ -206,21 +296,24 @@ async def listen_for_stop(websocket: WebSocket) -> bool:
         print(f"[DEBUG] Error in stop listener: {e}")
         return True
 
-async def update_position(file_id, websocket: WebSocket):
+async def update_position(session: PracticeSession, websocket: WebSocket):
+    """
+    位置一产生就推送给前端；发送跟不上时只发送最新的位置
+    """
     prev_position = 0
-    iteration_count = 0
     try:
         while websocket.client_state == WebSocketState.CONNECTED:
-            current_position = position_manager.get_position(file_id)
-            iteration_count += 1
-            print(f"[DEBUG] Iteration {iteration_count}: Current position: {current_position}")
-            
+            update = await session.channel.get()
+            if update is None:
+                # score following 已结束
+                break
+            current_position, measure = update
+
             if not math.isclose(current_position, prev_position, abs_tol=0.001):
-                await websocket.send_json({"beat_position": current_position})
+                message = {"beat_position": current_position}
+                if measure is not None:
+                    message["measure"] = measure
+                await websocket.send_json(message)
                 prev_position = current_position
-
-            await asyncio.sleep(0.1)
     except Exception as e:
         print(f"[DEBUG] Error in position updater: {e}")
-
-
@@ -20,6 +20,9 @@ const LibraryModal: React.FC<LibraryModalProps> = ({
   const [files, setFiles] = useState<any[]>([]);
   const [currentPage, setCurrentPage] = useState(1);
   const [totalPages, setTotalPages] = useState(1);
+  const [hasMore, setHasMore] = useState(false);
+  // cursors[i] 是第 i + 1 页的游标，第一页为 null
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
   const [isLoading, setIsLoading] = useState(false);
   const pageSize = 10;
 
@@ -32,9 +35,12 @@ const LibraryModal: React.FC<LibraryModalProps> = ({
   const fetchFiles = async (page: number) => {
     setIsLoading(true);
     try {
+      // 游标分页，总页数使用估计值
+      const cursor = cursors[page - 1];
+      const query = `page_size=${pageSize}&total=estimate${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
       const url = type === 'library' 
-        ? `${BE_Url_Cloud}/library?page=${page}&page_size=${pageSize}`
-        : `${BE_Url_Cloud}/my-library?page=${page}&page_size=${pageSize}`;
+        ? `${BE_Url_Cloud}/library?${query}`
+        : `${BE_Url_Cloud}/my-library?${query}`;
       
       const response = await fetch(url, {
         headers: {
@@ -44,7 +50,13 @@ const LibraryModal: React.FC<LibraryModalProps> = ({
       const data = await response.json();
       if (data.success) {
         setFiles(data.data);
-        setTotalPages(data.pagination.total_pages);
+        setHasMore(data.pagination.has_more);
+        setTotalPages(Math.max(data.pagination.total_pages, page + (data.pagination.has_more ? 1 : 0)));
+        setCursors(prev => {
+          const next = prev.slice(0, page);
+          next[page] = data.pagination.next_cursor;
+          return next;
+        });
       }
     } catch (error) {
       console.error('Error fetching files:', error);
@@ -115,8 +127,8 @@ const LibraryModal: React.FC<LibraryModalProps> = ({
                   第 {currentPage} 页 / 共 {totalPages} 页
                 </span>
                 <button
-                  onClick={() => setCurrentPage(prev => Math.min(totalPages, prev + 1))}
-                  disabled={currentPage === totalPages}
+                  onClick={() => setCurrentPage(prev => prev + 1)}
+                  disabled={!hasMore}
                   className="px-4 py-2 bg-gray-200 rounded disabled:opacity-50"
                 >
                   下一页